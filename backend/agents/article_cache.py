@@ -0,0 +1,80 @@
+"""
+Caché de artículos generados
+"""
+from collections import OrderedDict
+from typing import Dict, Optional
+import copy
+import hashlib
+import json
+import os
+import re
+import time
+
+
+def normalize_error(error: str) -> str:
+    """Normaliza el texto del error para que reintentos equivalentes compartan clave"""
+    return re.sub(r"\s+", " ", error).strip().lower()
+
+
+class ArticleCache:
+    """
+    Caché en memoria de artículos ya generados, con TTL y expulsión LRU.
+    
+    La clave combina el hash del manual, el error normalizado, el modelo del
+    dispositivo, el modelo de OpenAI y un hash del prompt, así que cambiar
+    cualquiera de ellos invalida las entradas antiguas automáticamente.
+    """
+    
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else \
+            int(os.getenv("ARTICLE_CACHE_MAX_ENTRIES", "1000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            int(os.getenv("ARTICLE_CACHE_TTL", "86400"))
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(manual_hash: str, error: str, model: str, llm_model: str, prompt_template: str) -> str:
+        prompt_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+        raw = json.dumps([manual_hash, normalize_error(error), model.strip().lower(), llm_model, prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+    
+    def contains(self, key: str) -> bool:
+        """Indica si hay una entrada vigente, sin contar acierto ni fallo"""
+        entry = self._entries.get(key)
+        return entry is not None and time.time() - entry[0] <= self.ttl_seconds
+    
+    def put(self, key: str, value: Dict):
+        self._entries[key] = (time.time(), copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -1,32 +1,115 @@
 """
 Agente LangChain para generar artículos técnicos usando RAG
 """
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from typing import Dict, List
+from langchain_core.documents import Document
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
+import asyncio
+import faiss
+import openai
 import os
 
+from agents.article_cache import ArticleCache, normalize_error
+from agents.context_packer import ContextPacker
+from agents.embedding_cache import EmbeddingCache
+from agents.error_index import ErrorCodeIndex
+from agents.json_stream import JSONSectionStream
+from agents.local_embeddings import build_embeddings
+from agents.manual_cache import ManualCache
+from agents.rate_limiter import RateLimiter
+from agents.single_flight import SingleFlight
+from agents.vector_store import VectorIndexStore, build_vectorstore, indexed_chunks
+
+
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """Semáforo compartido por todo el proceso que limita las llamadas al LLM"""
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    return _llm_semaphore
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Limitador de peticiones/tokens por minuto compartido por todo el proceso"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def retry_after_seconds(error: Exception, attempt: int) -> float:
+    """Espera indicada por la API en un 429, o backoff exponencial si no la hay"""
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return min(60.0, 2.0 ** attempt)
+
 
 class ArticleGenerator:
     """Genera artículos técnicos usando RAG con LangChain"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        manual_cache: Optional[ManualCache] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        article_cache: Optional[ArticleCache] = None
+    ):
         api_key = os.getenv("OPENAI_API_KEY")
         model = os.getenv("OPENAI_MODEL", "gpt-4o")
         
         if not api_key:
             raise ValueError("OPENAI_API_KEY no está configurada")
         
+        self.llm_model = model
+        # Los reintentos los gestiona invoke_llm con el limitador compartido
         self.llm = ChatOpenAI(
             temperature=0.3,
             model=model,
-            api_key=api_key
+            api_key=api_key,
+            max_retries=0
         )
+        self.llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", "5"))
+        self.output_tokens_estimate = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "1200"))
+        
+        # Caché de artículos ya generados
+        self.article_cache = article_cache
+        
+        # Backend de embeddings (openai o local, según EMBEDDINGS_BACKEND)
+        self.embeddings = build_embeddings(api_key)
+        self.embedding_model = getattr(self.embeddings, "model", "openai")
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
         
-        self.embeddings = OpenAIEmbeddings(api_key=api_key)
+        # Caché de embeddings por chunk compartida entre manuales
+        self.embedding_cache = embedding_cache
+        
+        # Índices FAISS persistidos junto a cada manual cacheado
+        self.manual_cache = manual_cache
+        self.vector_store = VectorIndexStore(
+            manual_cache, self.embeddings, self.embedding_model
+        ) if manual_cache else None
+        
+        # Contexto sin solapes ni duplicados, hasta CONTEXT_MAX_TOKENS
+        self.context_packer = ContextPacker()
+        
+        # Generaciones e índices idénticos en curso se comparten
+        self.article_flight = SingleFlight()
+        self.vectorstore_flight = SingleFlight()
         
         # Template para el prompt
         self.prompt_template = """Actúa como un técnico experto en domótica y productos electrónicos.
@@ -70,59 +153,498 @@ Responde SOLO en formato JSON con esta estructura:
 Pregunta: {question}
 """
     
+    def embed_chunks(
+        self,
+        texts: List[str],
+        known: Optional[Dict[str, np.ndarray]] = None
+    ) -> Tuple[np.ndarray, List[str]]:
+        """
+        Calcula los embeddings de los chunks reutilizando vectores conocidos
+        
+        Los vectores se identifican por el hash del texto normalizado del
+        chunk. Se buscan primero en known (ej: versión anterior del manual),
+        después en la caché de embeddings compartida, y solo los que faltan
+        se piden al modelo, en lotes.
+        
+        Returns:
+            (matriz float32 de embeddings, claves de chunk)
+        """
+        keys = [EmbeddingCache.text_hash(text) for text in texts]
+        known = dict(known or {})
+        
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in known and key not in missing:
+                missing[key] = text
+        
+        if missing and self.embedding_cache:
+            cached = self.embedding_cache.get_many(self.embedding_model, list(missing))
+            known.update(cached)
+            for key in cached:
+                del missing[key]
+        
+        if missing:
+            missing_keys = list(missing)
+            new_vectors = {}
+            for start in range(0, len(missing_keys), self.embedding_batch_size):
+                batch_keys = missing_keys[start:start + self.embedding_batch_size]
+                batch_vectors = self.embeddings.embed_documents([missing[key] for key in batch_keys])
+                new_vectors.update(zip(batch_keys, np.asarray(batch_vectors, dtype=np.float32)))
+            
+            known.update(new_vectors)
+            if self.embedding_cache:
+                self.embedding_cache.put_many(self.embedding_model, new_vectors)
+        
+        vectors = np.vstack([known[key] for key in keys]).astype(np.float32)
+        return vectors, keys
+    
     def create_vectorstore(self, chunks: List[Dict]) -> FAISS:
-        """Crea vectorstore FAISS desde chunks de texto"""
-        texts = [chunk["text"] for chunk in chunks]
+        """
+        Crea (o reutiliza) el vectorstore FAISS de los chunks de un manual
+        
+        Si los chunks vienen de un manual identificado por su hash, el índice
+        se guarda en disco y se comparte entre errores y peticiones; solo se
+        embebe una vez por versión del manual. Los chunks casi duplicados
+        (ManualText.duplicates) no tienen fila propia en el índice.
+        """
+        manual_hash = getattr(chunks, "content_hash", None)
+        chunk_key = getattr(chunks, "chunk_key", None)
+        store = self.vector_store if manual_hash and chunk_key else None
+        
+        if store:
+            vectorstore = store.get_loaded(manual_hash, chunk_key)
+            if vectorstore:
+                return vectorstore
+            
+        # Los casi duplicados se recuperan a través de su representante
+        rows = indexed_chunks(chunks)
+        
+        if store:
+            stored = store.load_index(manual_hash, chunk_key)
+            if stored and stored[0].ntotal == len(rows):
+                return store.wrap(manual_hash, chunk_key, stored[0], chunks, rows)
+        
+        texts = [chunks[i]["text"] for i in rows]
+        
+        # Reutilizar vectores de la versión anterior del manual
+        known = {}
+        previous_hash = getattr(chunks, "previous_hash", None)
+        if store and previous_hash:
+            known = store.load_vectors(previous_hash, chunk_key)
+        
+        vectors, keys = self.embed_chunks(texts, known)
+        if known:
+            reused = sum(1 for key in keys if key in known)
+            print(f"♻️ Embeddings reutilizados: {reused}/{len(keys)} chunks")
         
         # Crear vectorstore
-        vectorstore = FAISS.from_texts(
-            texts=texts,
-            embedding=self.embeddings
-        )
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        
+        if store:
+            store.save_index(manual_hash, chunk_key, index, keys)
+            return store.wrap(manual_hash, chunk_key, index, chunks, rows)
         
-        return vectorstore
+        return build_vectorstore(self.embeddings, index, chunks, rows)
     
-    async def generate_article(
+    def has_vectorstore(self, chunks: List[Dict]) -> bool:
+        """Indica si el manual ya se embebió (su índice está en memoria o en disco)"""
+        manual_hash = getattr(chunks, "content_hash", None)
+        chunk_key = getattr(chunks, "chunk_key", None)
+        if not (self.vector_store and manual_hash and chunk_key):
+            return False
+        return self.vector_store.has_index(manual_hash, chunk_key)
+    
+    async def get_vectorstore(self, chunks: List[Dict]) -> FAISS:
+        """Vectorstore del manual, creado fuera del event loop y compartido entre llamadas"""
+        manual_hash = getattr(chunks, "content_hash", None)
+        if manual_hash:
+            return await self.vectorstore_flight.do(
+                (manual_hash, getattr(chunks, "chunk_key", None)),
+                lambda: asyncio.to_thread(self.create_vectorstore, chunks)
+            )
+        return await asyncio.to_thread(self.create_vectorstore, chunks)
+    
+    def _index_documents(
         self,
         chunks: List[Dict],
         error: str,
-        model: str
-    ) -> Dict:
-        """Genera artículo técnico usando RAG"""
+        error_index: Optional[ErrorCodeIndex],
+        k: int
+    ) -> Optional[List[Document]]:
+        """Contexto desde el índice de códigos de error, o None si no basta"""
+        if error_index is None:
+            return None
+        hits = error_index.lookup(error, k=k)
+        if not hits:
+            return None
+        return [
+            Document(
+                page_content=chunks[i]["text"],
+                metadata={
+                    "chunk": chunks[i]["id"],
+                    "page": chunks[i].get("page"),
+                    "start": chunks[i].get("start"),
+                    "end": chunks[i].get("end")
+                }
+            )
+            for i in hits
+        ]
+    
+    async def retrieve_documents(
+        self,
+        chunks: List[Dict],
+        error: str,
+        question: str,
+        error_index: Optional[ErrorCodeIndex] = None,
+        k: int = 3
+    ) -> Tuple[List[Document], str]:
+        """
+        Obtiene el contexto del manual para un error
         
-        # Crear vectorstore
-        vectorstore = self.create_vectorstore(chunks)
+        Usa primero el índice de códigos de error; si el error no tiene
+        código o alguno no aparece en el manual, recurre a la búsqueda
+        vectorial.
+        
+        Returns:
+            (documentos, método de recuperación usado)
+        """
+        documents = self._index_documents(chunks, error, error_index, k)
+        if documents is not None:
+            return documents, "error_index"
+        
+        vectorstore = await self.get_vectorstore(chunks)
+        retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+        return await retriever.ainvoke(question), "vector"
+    
+    def search_many(self, vectorstore: FAISS, questions: List[str], k: int = 3) -> List[List[Document]]:
+        """
+        k-NN de varias preguntas a la vez
+        
+        Las preguntas se embeben en lotes de EMBEDDING_BATCH_SIZE (una sola
+        petición para batches normales) y se buscan todas con una única
+        llamada a FAISS sobre la matriz de consultas.
+        """
+        vectors = []
+        for start in range(0, len(questions), self.embedding_batch_size):
+            batch = questions[start:start + self.embedding_batch_size]
+            vectors.extend(self.embeddings.embed_documents(batch))
+        
+        _, neighbors = vectorstore.index.search(np.asarray(vectors, dtype=np.float32), k)
+        return [
+            [
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                for i in row if i >= 0
+            ]
+            for row in neighbors
+        ]
+    
+    async def retrieve_many(
+        self,
+        chunks: List[Dict],
+        errors: List[str],
+        model: str,
+        error_index: Optional[ErrorCodeIndex] = None,
+        k: int = 3
+    ) -> List[Optional[Tuple[List[Document], str]]]:
+        """
+        Recupera el contexto de todos los errores de un batch de una vez
+        
+        El índice vectorial del manual se obtiene una sola vez y todas las
+        preguntas que no resuelve el índice de códigos se embeben y buscan
+        juntas (search_many). Los errores con artículo ya en caché se omiten.
+        
+        Returns:
+            (documentos, método) por error, o None si no hace falta contexto;
+            se pasa como retrieved a generate_article
+        """
+        results: List[Optional[Tuple[List[Document], str]]] = [None] * len(errors)
+        pending = []
+        for position, error in enumerate(errors):
+            cache_key = self._article_cache_key(chunks, error, model)
+            if cache_key and self.article_cache.contains(cache_key):
+                continue
+            documents = self._index_documents(chunks, error, error_index, k)
+            if documents is not None:
+                results[position] = (documents, "error_index")
+            else:
+                pending.append(position)
         
-        # Crear prompt
+        if pending:
+            vectorstore = await self.get_vectorstore(chunks)
+            questions = [self.build_question(errors[position], model) for position in pending]
+            found = await asyncio.to_thread(self.search_many, vectorstore, questions, k)
+            for position, documents in zip(pending, found):
+                results[position] = (documents, "vector")
+        
+        return results
+    
+    async def invoke_llm(self, prompt_text: str) -> str:
+        """
+        Llama al LLM de forma asíncrona respetando el límite global de
+        llamadas simultáneas (LLM_MAX_CONCURRENCY) y de peticiones/tokens
+        por minuto (OPENAI_RPM / OPENAI_TPM)
+        
+        Ante un 429 se pausa el limitador durante el Retry-After y se
+        reintenta; los errores de conexión y 5xx se reintentan con backoff.
+        """
+        limiter = get_rate_limiter()
+        estimated = limiter.estimate_tokens(prompt_text) + self.output_tokens_estimate
+        
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated)
+            try:
+                async with get_llm_semaphore():
+                    response = await self.llm.ainvoke(prompt_text)
+                break
+            except openai.RateLimitError as e:
+                # La llamada fallida no consumió tokens: cada intento reserva los suyos
+                limiter.refund(estimated)
+                if attempt >= self.llm_max_retries:
+                    raise
+                delay = retry_after_seconds(e, attempt)
+                limiter.penalize(delay)
+                print(f"⏳ Límite de OpenAI alcanzado, reintentando en {delay:.1f}s")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                limiter.refund(estimated)
+                if attempt >= self.llm_max_retries:
+                    raise
+                await asyncio.sleep(retry_after_seconds(e, attempt))
+            attempt += 1
+        
+        usage = getattr(response, "usage_metadata", None) or {}
+        limiter.record_usage(estimated, usage.get("total_tokens"))
+        return response.content
+    
+    async def astream_llm(self, prompt_text: str) -> AsyncIterator[str]:
+        """
+        Versión en streaming de invoke_llm: mismos límites y reintentos
+        
+        Un 429 o un error de conexión antes del primer fragmento se
+        reintenta igual que en invoke_llm; una vez emitido texto el error se
+        propaga, porque el cliente ya lo ha recibido. Al terminar se corrige
+        la reserva de tokens con el uso que OpenAI envía al final del stream.
+        """
+        limiter = get_rate_limiter()
+        estimated = limiter.estimate_tokens(prompt_text) + self.output_tokens_estimate
+        
+        attempt = 0
+        total_tokens: Optional[int] = None
+        while True:
+            await limiter.acquire(estimated)
+            started = False
+            try:
+                async with get_llm_semaphore():
+                    async for message in self.llm.astream(prompt_text, stream_usage=True):
+                        usage = getattr(message, "usage_metadata", None)
+                        if usage:
+                            total_tokens = (total_tokens or 0) + usage.get("total_tokens", 0)
+                        if message.content:
+                            started = True
+                            yield message.content
+                break
+            except openai.RateLimitError as e:
+                if started:
+                    raise
+                limiter.refund(estimated)
+                if attempt >= self.llm_max_retries:
+                    raise
+                delay = retry_after_seconds(e, attempt)
+                limiter.penalize(delay)
+                print(f"⏳ Límite de OpenAI alcanzado, reintentando en {delay:.1f}s")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if started:
+                    raise
+                limiter.refund(estimated)
+                if attempt >= self.llm_max_retries:
+                    raise
+                await asyncio.sleep(retry_after_seconds(e, attempt))
+            attempt += 1
+        
+        limiter.record_usage(estimated, total_tokens)
+    
+    def _article_cache_key(self, chunks: List[Dict], error: str, model: str) -> Optional[str]:
+        """Clave de la caché de artículos, o None si el manual no tiene hash"""
+        manual_hash = getattr(chunks, "content_hash", None)
+        if self.article_cache and manual_hash:
+            return ArticleCache.make_key(
+                manual_hash, error, model, self.llm_model, self.prompt_template
+            )
+        return None
+    
+    def build_question(self, error: str, model: str) -> str:
+        """Pregunta del prompt, usada también como consulta de la búsqueda vectorial"""
+        return f"Genera un artículo técnico completo sobre cómo solucionar el error '{error}' en el modelo '{model}'."
+    
+    async def build_prompt(
+        self,
+        chunks: List[Dict],
+        error: str,
+        model: str,
+        error_index: Optional[ErrorCodeIndex] = None,
+        retrieved: Optional[Tuple[List[Document], str]] = None
+    ) -> Tuple[str, List[Document], str]:
+        """
+        Recupera el contexto (salvo que venga ya en retrieved) y construye
+        el prompt del artículo
+        
+        Returns:
+            (prompt, documentos de contexto, método de recuperación usado)
+        """
         prompt = PromptTemplate(
             template=self.prompt_template,
             input_variables=["context", "error", "model", "question"]
         )
         
-        # Crear chain de QA
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt}
-        )
+        question = self.build_question(error, model)
         
-        # Generar respuesta
-        question = f"Genera un artículo técnico completo sobre cómo solucionar el error '{error}' en el modelo '{model}'."
+        # Recuperar contexto (índice de códigos o búsqueda vectorial)
+        if retrieved is not None:
+            documents, retrieval = retrieved
+        else:
+            documents, retrieval = await self.retrieve_documents(chunks, error, question, error_index)
         
-        result = qa_chain.invoke({
-            "query": question,
-            "error": error,
-            "model": model
-        })
+        # Fundir resultados solapados o contiguos y recortar al presupuesto
+        context, documents = self.context_packer.pack(documents, chunks)
         
+        prompt_text = prompt.format(
+            context=context,
+            error=error,
+            model=model,
+            question=question
+        )
+        return prompt_text, documents, retrieval
+    
+    def _build_result(self, llm_response: str, documents: List[Document], retrieval: str) -> Dict:
         return {
             "success": True,
-            "result": result["result"],
-            "source_documents": [doc.page_content[:200] for doc in result["source_documents"]]
+            "result": llm_response,
+            "content": self.parse_llm_response(llm_response),
+            "retrieval": retrieval,
+            "source_documents": [doc.page_content[:200] for doc in documents],
+            "source_pages": [doc.metadata.get("page") for doc in documents],
+            "cached": False
         }
     
+    def _store_result(self, cache_key: Optional[str], result: Dict):
+        # Solo se cachean respuestas que se pudieron parsear
+        if cache_key and "error" not in result["content"]:
+            self.article_cache.put(cache_key, result)
+    
+    async def generate_article(
+        self,
+        chunks: List[Dict],
+        error: str,
+        model: str,
+        error_index: Optional[ErrorCodeIndex] = None,
+        use_cache: bool = True,
+        retrieved: Optional[Tuple[List[Document], str]] = None
+    ) -> Dict:
+        """
+        Genera artículo técnico usando RAG
+        
+        Si el manual está identificado por su hash, el resultado (respuesta
+        del LLM ya parseada en "content") se guarda en la caché de artículos
+        y se reutiliza para el mismo manual, error, modelo y prompt.
+        use_cache=False fuerza la regeneración y actualiza la caché.
+        
+        Las llamadas simultáneas para el mismo manual, error y modelo
+        esperan a una única generación.
+        
+        retrieved permite pasar el contexto ya recuperado (ver retrieve_many).
+        """
+        manual_hash = getattr(chunks, "content_hash", None)
+        if not manual_hash:
+            return await self._generate_article(chunks, error, model, error_index, use_cache, retrieved)
+        
+        flight_key = (manual_hash, normalize_error(error), model.strip().lower(), use_cache)
+        return await self.article_flight.do(
+            flight_key,
+            lambda: self._generate_article(chunks, error, model, error_index, use_cache, retrieved)
+        )
+    
+    async def _generate_article(
+        self,
+        chunks: List[Dict],
+        error: str,
+        model: str,
+        error_index: Optional[ErrorCodeIndex],
+        use_cache: bool,
+        retrieved: Optional[Tuple[List[Document], str]] = None
+    ) -> Dict:
+        cache_key = self._article_cache_key(chunks, error, model)
+        if cache_key and use_cache:
+            cached = self.article_cache.get(cache_key)
+            if cached:
+                cached["cached"] = True
+                return cached
+        
+        prompt_text, documents, retrieval = await self.build_prompt(
+            chunks, error, model, error_index, retrieved
+        )
+        
+        # Generar respuesta
+        llm_response = await self.invoke_llm(prompt_text)
+        
+        result = self._build_result(llm_response, documents, retrieval)
+        self._store_result(cache_key, result)
+        return result
+    
+    async def stream_article(
+        self,
+        chunks: List[Dict],
+        error: str,
+        model: str,
+        error_index: Optional[ErrorCodeIndex] = None,
+        use_cache: bool = True,
+        retrieved: Optional[Tuple[List[Document], str]] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Genera el artículo en streaming
+        
+        Produce tuplas (evento, datos):
+            ("context", {"retrieval", "source_pages"}): contexto recuperado
+            ("token", {"text"}): fragmento de texto recibido del LLM
+            ("section", {"key", "value"}): campo del artículo ya completo
+            ("item", {"key", "value"}): elemento de un campo lista ya completo
+            ("result", resultado): mismo diccionario que generate_article
+        
+        Un artículo cacheado se emite directamente por secciones. retrieved
+        funciona como en generate_article.
+        """
+        cache_key = self._article_cache_key(chunks, error, model)
+        if cache_key and use_cache:
+            cached = self.article_cache.get(cache_key)
+            if cached:
+                cached["cached"] = True
+                yield "context", {"retrieval": cached.get("retrieval"), "source_pages": cached.get("source_pages", [])}
+                for key, value in cached["content"].items():
+                    if isinstance(value, list):
+                        for item in value:
+                            yield "item", {"key": key, "value": item}
+                    yield "section", {"key": key, "value": value}
+                yield "result", cached
+                return
+        
+        prompt_text, documents, retrieval = await self.build_prompt(chunks, error, model, error_index, retrieved)
+        yield "context", {
+            "retrieval": retrieval,
+            "source_pages": [doc.metadata.get("page") for doc in documents]
+        }
+        
+        parser = JSONSectionStream()
+        parts = []
+        async for text in self.astream_llm(prompt_text):
+            parts.append(text)
+            yield "token", {"text": text}
+            for event, key, value in parser.feed(text):
+                yield event, {"key": key, "value": value}
+        
+        result = self._build_result("".join(parts), documents, retrieval)
+        self._store_result(cache_key, result)
+        yield "result", result
+    
     def parse_llm_response(self, llm_response: str) -> Dict:
         """Parsea la respuesta del LLM en formato JSON"""
         import json
@@ -1,10 +1,13 @@
 """
 Generador de artículos en batch
 """
-from typing import List, Dict
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Dict, Optional, Tuple
+from collections import deque
+from itertools import islice
 import asyncio
 from datetime import datetime
 import json
+import os
 
 
 class BatchArticleGenerator:
@@ -14,22 +17,240 @@ class BatchArticleGenerator:
         self.pdf_processor = pdf_processor
         self.article_generator = article_generator
         self.affiliate_linker = affiliate_linker
+        
+        # Artículos generados a la vez dentro de un batch; el ritmo real de
+        # llamadas a OpenAI lo marca el limitador de peticiones/tokens
+        self.concurrency = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    
+    async def generate_single_article(
+        self,
+        pdf_result: Dict,
+        model: str,
+        error: str,
+        publish_status: str = "draft",
+        retrieved: Optional[Tuple[List, str]] = None
+    ) -> Dict:
+        """
+        Genera un artículo del batch a partir del manual ya procesado
+        
+        Args:
+            retrieved: Contexto ya recuperado para el error (retrieve_many)
+        
+        Returns:
+            Artículo con título, contenido, enlaces de afiliado y metadata
+        
+        Raises:
+            Exception si el artículo no se pudo generar
+        """
+        chunks = pdf_result["chunks"]
+        
+        # Generar artículo
+        article_result = await self.article_generator.generate_article(
+            chunks=chunks,
+            error=error,
+            model=model,
+            error_index=pdf_result.get("error_index"),
+            retrieved=retrieved
+        )
+        
+        if not article_result["success"]:
+            raise Exception("Failed to generate article")
+        
+        # Respuesta ya parseada
+        article_content = article_result["content"]
+        
+        # Procesar productos
+        recommended_products = article_content.get("recommended_products", [])
+        affiliate_products = self.affiliate_linker.process_products(recommended_products)
+        
+        return {
+            "error": error,
+            "title": article_content.get("title", f"Error: {error}"),
+            "content": {
+                "introduction": article_content.get("introduction", ""),
+                "error_meaning": article_content.get("error_meaning", ""),
+                "diagnosis": article_content.get("diagnosis", ""),
+                "solution_steps": article_content.get("solution_steps", []),
+                "common_failures": article_content.get("common_failures", []),
+            },
+            "affiliate_links": affiliate_products,
+            "metadata": {
+                "model": model,
+                "error": error,
+                "pdf_chunks": len(chunks),
+                "generated_at": datetime.now().isoformat()
+            },
+            "status": publish_status
+        }
+    
+    async def iter_articles(
+        self,
+        pdf_result: Dict,
+        model: str,
+        errors: Iterable[str],
+        publish_status: str = "draft"
+    ) -> AsyncIterator[Tuple[int, str, Optional[Dict], Optional[str]]]:
+        """
+        Genera los artículos de un manual ya procesado y los devuelve según terminan
+        
+        Mantiene como máximo BATCH_CONCURRENCY artículos en curso (ventana
+        deslizante): los errores se leen del iterable a medida que hay hueco,
+        así que la memoria no crece con la longitud del batch.
+        
+        El contexto se recupera por bloques de errores con retrieve_many (un
+        solo índice, un lote de embeddings de consulta y una búsqueda FAISS
+        por bloque) y se reparte entre las llamadas al LLM. El bloque
+        siguiente se recupera mientras se generan los artículos del actual.
+        
+        Yields:
+            (índice del error, error, artículo o None, detalle del fallo o None)
+        """
+        window = max(1, self.concurrency)
+        block_size = max(window, self.article_generator.embedding_batch_size)
+        pending_errors = enumerate(errors)
+        ready = deque()
+        in_flight = set()
+        prefetching: Optional[asyncio.Future] = None
+        exhausted = False
+        
+        async def prefetch() -> List[Tuple[int, str, Optional[Tuple]]]:
+            block = list(islice(pending_errors, block_size))
+            if not block:
+                return []
+            try:
+                contexts = await self.article_generator.retrieve_many(
+                    pdf_result["chunks"],
+                    [error for _, error in block],
+                    model,
+                    pdf_result.get("error_index")
+                )
+            except Exception as e:
+                # Cada artículo recuperará su propio contexto
+                print(f"⚠️ Recuperación en bloque fallida: {str(e)}")
+                contexts = [None] * len(block)
+            return [(index, error, context) for (index, error), context in zip(block, contexts)]
+        
+        async def generate(index: int, error: str, retrieved) -> Tuple[int, str, Optional[Dict], Optional[str]]:
+            print(f"🤖 Generando artículo {index + 1}: {error}")
+            try:
+                article = await self.generate_single_article(
+                    pdf_result, model, error, publish_status, retrieved
+                )
+            except Exception as e:
+                print(f"❌ Error generando artículo para {error}: {str(e)}")
+                return index, error, None, str(e)
+            print(f"✅ Artículo {index + 1} generado exitosamente")
+            return index, error, article, None
+        
+        def fill():
+            nonlocal prefetching
+            while len(in_flight) < window and ready:
+                index, error, retrieved = ready.popleft()
+                in_flight.add(asyncio.ensure_future(generate(index, error, retrieved)))
+            # El bloque siguiente se recupera en su propia tarea, a la vez
+            # que se generan los artículos: nunca retrasa los terminados
+            if prefetching is None and not exhausted and len(ready) < window:
+                prefetching = asyncio.ensure_future(prefetch())
+        
+        try:
+            fill()
+            while in_flight or prefetching is not None:
+                waiting = in_flight | ({prefetching} if prefetching is not None else set())
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if prefetching in done:
+                    done.discard(prefetching)
+                    block = prefetching.result()
+                    prefetching = None
+                    ready.extend(block)
+                    exhausted = not block
+                in_flight.difference_update(done)
+                fill()
+                for task in done:
+                    yield task.result()
+        finally:
+            # El consumidor dejó de leer (ej: cliente desconectado)
+            for task in in_flight:
+                task.cancel()
+            if prefetching is not None:
+                prefetching.cancel()
+    
+    async def stream_multiple_articles(
+        self,
+        pdf_url: str,
+        model: str,
+        errors: Iterable[str],
+        publish_status: str = "draft"
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Versión en streaming de generate_multiple_articles
+        
+        No acumula los artículos: cada uno se entrega en cuanto termina (en
+        orden de finalización, con su índice) y al final solo se envían los
+        contadores, así que la memoria no depende del tamaño del batch.
+        
+        Yields:
+            (evento, datos) con eventos "status", "item" y "done"
+        """
+        started_at = datetime.now().isoformat()
+        successful = 0
+        failed = 0
+        
+        yield "status", {"stage": "processing_pdf"}
+        print(f"📄 Procesando PDF: {pdf_url}")
+        pdf_result = await self.pdf_processor.process_pdf(pdf_url)
+        if not pdf_result["success"]:
+            raise Exception("No se pudo procesar el PDF")
+        
+        print(f"✅ PDF procesado: {len(pdf_result['chunks'])} chunks")
+        yield "status", {"stage": "generating", "pdf_chunks": pdf_result["num_chunks"]}
+        
+        async for index, error, article, detail in self.iter_articles(
+            pdf_result, model, errors, publish_status
+        ):
+            if article is None:
+                failed += 1
+            else:
+                successful += 1
+            yield "item", {
+                "index": index,
+                "error": error,
+                "status": "done" if article is not None else "failed",
+                "article": article,
+                "detail": detail,
+                "successful": successful,
+                "failed": failed
+            }
+        
+        print(f"\n🎉 Proceso completado: {successful}/{successful + failed} exitosos")
+        yield "done", {
+            "total": successful + failed,
+            "successful": successful,
+            "failed": failed,
+            "started_at": started_at,
+            "completed_at": datetime.now().isoformat()
+        }
     
     async def generate_multiple_articles(
         self,
         pdf_url: str,
         model: str,
         errors: List[str],
-        publish_status: str = "draft"
+        publish_status: str = "draft",
+        on_result: Optional[Callable[[int, str, Optional[Dict], Optional[str]], Awaitable[None]]] = None
     ) -> Dict:
         """
         Genera múltiples artículos para diferentes errores del mismo dispositivo
         
+        Los artículos se generan en paralelo (hasta BATCH_CONCURRENCY a la
+        vez) y se devuelven en el mismo orden que los errores.
+        
         Args:
             pdf_url: URL del manual PDF
             model: Modelo del dispositivo
             errors: Lista de errores a procesar
             publish_status: Estado de publicación (draft/publish)
+            on_result: Callback async (índice, error, artículo, detalle) que se
+                llama en cuanto termina cada artículo (artículo=None si falló)
         
         Returns:
             Resultados de generación de todos los artículos
@@ -55,74 +276,27 @@ class BatchArticleGenerator:
                 })
                 return results
             
-            chunks = pdf_result["chunks"]
-            print(f"✅ PDF procesado: {len(chunks)} chunks")
+            print(f"✅ PDF procesado: {len(pdf_result['chunks'])} chunks")
             
             # Generar artículos para cada error
-            for i, error in enumerate(errors, 1):
-                print(f"🤖 Generando artículo {i}/{len(errors)}: {error}")
-                
-                try:
-                    # Generar artículo
-                    article_result = await self.article_generator.generate_article(
-                        chunks=chunks,
-                        error=error,
-                        model=model
-                    )
-                    
-                    if not article_result["success"]:
-                        results["failed"] += 1
-                        results["errors_log"].append({
-                            "error": error,
-                            "detail": "Failed to generate article"
-                        })
-                        continue
-                    
-                    # Parsear respuesta
-                    article_content = self.article_generator.parse_llm_response(
-                        article_result["result"]
-                    )
-                    
-                    # Procesar productos
-                    recommended_products = article_content.get("recommended_products", [])
-                    affiliate_products = self.affiliate_linker.process_products(recommended_products)
-                    
-                    # Guardar artículo generado
-                    article = {
-                        "error": error,
-                        "title": article_content.get("title", f"Error: {error}"),
-                        "content": {
-                            "introduction": article_content.get("introduction", ""),
-                            "error_meaning": article_content.get("error_meaning", ""),
-                            "diagnosis": article_content.get("diagnosis", ""),
-                            "solution_steps": article_content.get("solution_steps", []),
-                            "common_failures": article_content.get("common_failures", []),
-                        },
-                        "affiliate_links": affiliate_products,
-                        "metadata": {
-                            "model": model,
-                            "error": error,
-                            "pdf_chunks": len(chunks),
-                            "generated_at": datetime.now().isoformat()
-                        },
-                        "status": publish_status
-                    }
-                    
-                    results["articles"].append(article)
-                    results["successful"] += 1
-                    print(f"✅ Artículo {i}/{len(errors)} generado exitosamente")
-                    
-                    # Pequeña pausa para no saturar la API
-                    if i < len(errors):
-                        await asyncio.sleep(2)
-                    
-                except Exception as e:
+            outcomes: List[Optional[Tuple[Optional[Dict], Optional[str]]]] = [None] * len(errors)
+            async for index, error, article, detail in self.iter_articles(
+                pdf_result, model, errors, publish_status
+            ):
+                outcomes[index] = (article, detail)
+                if on_result:
+                    await on_result(index, error, article, detail)
+            
+            for error, (article, detail) in zip(errors, outcomes):
+                if article is None:
                     results["failed"] += 1
                     results["errors_log"].append({
                         "error": error,
-                        "detail": str(e)
+                        "detail": detail
                     })
-                    print(f"❌ Error generando artículo para {error}: {str(e)}")
+                else:
+                    results["articles"].append(article)
+                    results["successful"] += 1
             
             results["completed_at"] = datetime.now().isoformat()
             print(f"\n🎉 Proceso completado: {results['successful']}/{results['total']} exitosos")
@@ -0,0 +1,175 @@
+"""
+Trabajos de generación en batch en segundo plano, persistentes y reanudables
+"""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+
+from agents.batch_generator import BatchArticleGenerator
+from agents.job_store import JobStore
+
+
+class BatchJobManager:
+    """
+    Ejecuta batches como trabajos identificados por un ID.
+    
+    Cada artículo se guarda en el JobStore en cuanto termina (checkpoint), el
+    progreso se puede consultar o seguir por eventos, y al arrancar se
+    reanudan los trabajos interrumpidos generando solo los errores que
+    quedaron pendientes.
+    """
+    
+    KIND = "batch_generate"
+    
+    def __init__(self, job_store: JobStore, batch_generator: BatchArticleGenerator):
+        self.job_store = job_store
+        self.batch_generator = batch_generator
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+    
+    async def submit(
+        self,
+        pdf_url: str,
+        model: str,
+        errors: List[str],
+        publish_status: str = "draft"
+    ) -> str:
+        """Crea el trabajo, lo lanza en segundo plano y devuelve su ID"""
+        job_id = await asyncio.to_thread(
+            self.job_store.create_job,
+            self.KIND,
+            {"pdf_url": pdf_url, "model": model, "publish_status": publish_status},
+            errors
+        )
+        self.start(job_id)
+        return job_id
+    
+    def start(self, job_id: str) -> asyncio.Task:
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._run(job_id))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda done: self._tasks.pop(job_id, None))
+        return task
+    
+    def resume_incomplete(self) -> List[str]:
+        """Relanza los trabajos que quedaron en cola o a medias (ej: tras un reinicio)"""
+        job_ids = self.job_store.incomplete_jobs(self.KIND)
+        for job_id in job_ids:
+            print(f"🔁 Reanudando trabajo batch {job_id}")
+            self.start(job_id)
+        return job_ids
+    
+    async def wait(self, job_id: str) -> Optional[Dict]:
+        """Espera a que el trabajo termine y devuelve su resultado"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return self.get_result(job_id)
+    
+    def get_result(self, job_id: str, include_articles: bool = True) -> Optional[Dict]:
+        """
+        Estado del trabajo con el mismo formato que generate_multiple_articles
+        (articles en el orden de los errores y errors_log con los fallidos)
+        """
+        job = self.job_store.get_job(job_id)
+        if job is None:
+            return None
+        
+        items = self.job_store.get_items(job_id)
+        job["started_at"] = job["created_at"]
+        if job["status"] in ("completed", "failed"):
+            job["completed_at"] = job["updated_at"]
+        job["successful"] = job["completed"]
+        job["errors_log"] = [
+            {"error": item["item"], "detail": item["detail"]}
+            for item in items if item["status"] == "failed"
+        ]
+        if job["detail"]:
+            job["errors_log"].insert(0, {"error": "Batch process failed", "detail": job["detail"]})
+        if include_articles:
+            job["articles"] = [item["result"] for item in items if item["status"] == "done"]
+        return job
+    
+    async def _run(self, job_id: str):
+        # SQLite se usa desde un hilo para no bloquear el event loop
+        job = await asyncio.to_thread(self.job_store.get_job, job_id)
+        if job is None:
+            return
+        
+        params = job["params"]
+        pending = await asyncio.to_thread(self.job_store.get_items, job_id, "pending")
+        positions = [item["position"] for item in pending]
+        
+        await asyncio.to_thread(self.job_store.set_status, job_id, "running")
+        self._publish(job_id, "status", await asyncio.to_thread(self.get_result, job_id, False))
+        
+        async def on_result(index: int, error: str, article: Optional[Dict], detail: Optional[str]):
+            await asyncio.to_thread(self.job_store.finish_item, job_id, positions[index], article, detail)
+            progress = await asyncio.to_thread(self.job_store.get_job, job_id)
+            self._publish(job_id, "item", {
+                "position": positions[index],
+                "error": error,
+                "status": "done" if article is not None else "failed",
+                "article": article,
+                "detail": detail,
+                "completed": progress["completed"],
+                "failed": progress["failed"],
+                "total": progress["total"]
+            })
+        
+        try:
+            if pending:
+                results = await self.batch_generator.generate_multiple_articles(
+                    pdf_url=params["pdf_url"],
+                    model=params["model"],
+                    errors=[item["item"] for item in pending],
+                    publish_status=params.get("publish_status", "draft"),
+                    on_result=on_result
+                )
+                # Sin completed_at el batch falló antes de generar (ej: PDF)
+                if "completed_at" not in results:
+                    detail = "; ".join(entry["detail"] for entry in results["errors_log"])
+                    await asyncio.to_thread(self.job_store.set_status, job_id, "failed", detail)
+                    return
+            
+            await asyncio.to_thread(self.job_store.set_status, job_id, "completed")
+        
+        except asyncio.CancelledError:
+            # El trabajo queda en "running" y se reanuda en el próximo arranque
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self.job_store.set_status, job_id, "failed", str(e))
+        finally:
+            result = await asyncio.to_thread(self.get_result, job_id, False)
+            if result and result["status"] in ("completed", "failed"):
+                self._publish(job_id, "done", result)
+    
+    def _publish(self, job_id: str, event: str, data: Dict):
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait((event, data))
+    
+    async def subscribe(self, job_id: str) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Eventos de progreso del trabajo: un "status" inicial con el estado
+        actual, un "item" por artículo terminado y un "done" final
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            snapshot = self.get_result(job_id, include_articles=False)
+            if snapshot is None:
+                return
+            yield "status", snapshot
+            if snapshot["status"] in ("completed", "failed") or job_id not in self._tasks:
+                yield "done", snapshot
+                return
+            
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event == "done":
+                    return
+        finally:
+            self._subscribers[job_id].remove(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
@@ -0,0 +1,322 @@
+"""
+Generación masiva de artículos a partir de un manifiesto JSONL/CSV
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import csv
+import io
+import json
+import os
+
+from agents.batch_generator import BatchArticleGenerator
+from agents.job_store import JobStore
+from agents.pipeline import StagePipeline, build_article_pipeline
+
+
+MANIFEST_FIELDS = ("pdf_url", "model", "error")
+
+
+def parse_manifest(text: str, fmt: Optional[str] = None) -> List[Dict]:
+    """
+    Lee las filas (pdf_url, model, error) de un manifiesto
+    
+    Args:
+        text: Contenido del manifiesto
+        fmt: "jsonl" o "csv"; si no se indica se deduce del contenido
+    
+    Returns:
+        Filas en el orden del manifiesto, solo con los campos conocidos
+    
+    Raises:
+        ValueError si el formato no es válido o falta algún campo
+    """
+    if fmt is None:
+        fmt = "jsonl" if text.lstrip().startswith("{") else "csv"
+    
+    if fmt == "jsonl":
+        records = [
+            (line_no, json.loads(line))
+            for line_no, line in enumerate(text.splitlines(), 1)
+            if line.strip()
+        ]
+    elif fmt == "csv":
+        # La línea 1 es la cabecera
+        records = list(enumerate(csv.DictReader(io.StringIO(text)), 2))
+    else:
+        raise ValueError(f"Formato de manifiesto no soportado: {fmt}")
+    
+    rows = []
+    for line_no, record in records:
+        row = {field: str(record.get(field) or "").strip() for field in MANIFEST_FIELDS}
+        missing = [field for field in MANIFEST_FIELDS if not row[field]]
+        if missing:
+            raise ValueError(f"Línea {line_no}: faltan los campos {', '.join(missing)}")
+        rows.append(row)
+    
+    if not rows:
+        raise ValueError("El manifiesto no contiene filas")
+    return rows
+
+
+def read_manifest(path: str) -> List[Dict]:
+    """Lee un manifiesto desde disco (formato según la extensión)"""
+    fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+    with open(path, encoding="utf-8") as f:
+        return parse_manifest(f.read(), fmt)
+
+
+def group_by_manual(items: Iterable[Dict]) -> Dict[str, Dict[str, List[Tuple[int, str]]]]:
+    """
+    Agrupa las filas pendientes por manual y, dentro de cada manual, por modelo
+    
+    Returns:
+        {pdf_url: {model: [(posición, error), ...]}}
+    """
+    groups: Dict[str, Dict[str, List[Tuple[int, str]]]] = {}
+    for item in items:
+        row = json.loads(item["item"])
+        groups.setdefault(row["pdf_url"], {}).setdefault(row["model"], []).append(
+            (item["position"], row["error"])
+        )
+    return groups
+
+
+class BulkJobManager:
+    """
+    Ejecuta manifiestos de miles de filas (pdf_url, model, error).
+    
+    Las filas se agrupan por manual: cada manual se descarga, extrae e
+    indexa una sola vez y todos sus errores se generan sobre ese mismo
+    resultado. Hasta BULK_MANUAL_WORKERS manuales se procesan a la vez; el
+    paralelismo dentro de cada manual lo marca BATCH_CONCURRENCY.
+    
+    El estado de cada fila se guarda en el JobStore (reanudable) y cada
+    artículo se escribe además como JSON en el directorio de salida.
+    
+    En modo pipeline las filas pasan por etapas con sus propias colas y
+    workers (ingesta, embeddings, generación y, opcionalmente, publicación
+    en WordPress); ver agents/pipeline.py.
+    """
+    
+    KIND = "bulk_generate"
+    
+    def __init__(
+        self,
+        job_store: JobStore,
+        batch_generator: BatchArticleGenerator,
+        output_root: Optional[str] = None,
+        workers: Optional[int] = None,
+        wordpress_client=None,
+        global_index=None
+    ):
+        self.job_store = job_store
+        self.batch_generator = batch_generator
+        self.output_root = output_root or os.getenv("BULK_OUTPUT_DIR", "./cache/bulk")
+        self.workers = workers or int(os.getenv("BULK_MANUAL_WORKERS", "2"))
+        self.wordpress_client = wordpress_client
+        # Los manuales procesados se añaden al índice global (GlobalVectorIndex)
+        self.global_index = global_index if global_index is not None and global_index.auto_add else None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._pipelines: Dict[str, StagePipeline] = {}
+    
+    async def submit(
+        self,
+        rows: List[Dict],
+        output_dir: Optional[str] = None,
+        publish_status: str = "draft",
+        pipeline: bool = False,
+        publish: bool = False
+    ) -> str:
+        """
+        Crea el trabajo con una fila por elemento, lo lanza y devuelve su ID
+        
+        Args:
+            pipeline: Ejecutar por etapas (StagePipeline)
+            publish: Publicar en WordPress cada artículo (solo en modo pipeline)
+        """
+        if publish and (not pipeline or self.wordpress_client is None):
+            raise ValueError("La publicación requiere modo pipeline y WordPress configurado")
+        
+        job_id = await asyncio.to_thread(
+            self.job_store.create_job,
+            self.KIND,
+            {
+                "output_dir": output_dir,
+                "publish_status": publish_status,
+                "pipeline": pipeline,
+                "publish": publish
+            },
+            [json.dumps(row, ensure_ascii=False) for row in rows]
+        )
+        self.start(job_id)
+        return job_id
+    
+    def start(self, job_id: str) -> asyncio.Task:
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self.run(job_id))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda done: self._tasks.pop(job_id, None))
+        return task
+    
+    def resume_incomplete(self) -> List[str]:
+        """Relanza los trabajos que quedaron en cola o a medias (ej: tras un reinicio)"""
+        job_ids = self.job_store.incomplete_jobs(self.KIND)
+        for job_id in job_ids:
+            print(f"🔁 Reanudando trabajo bulk {job_id}")
+            self.start(job_id)
+        return job_ids
+    
+    def _output_dir(self, job: Dict) -> str:
+        return job["params"].get("output_dir") or os.path.join(self.output_root, job["job_id"])
+    
+    def get_result(self, job_id: str, include_rows: bool = False) -> Optional[Dict]:
+        """Estado del trabajo y, opcionalmente, el estado de cada fila (sin artículos)"""
+        job = self.job_store.get_job(job_id)
+        if job is None:
+            return None
+        job["output_dir"] = self._output_dir(job)
+        if job_id in self._pipelines:
+            job["stages"] = self._pipelines[job_id].stats()
+        if include_rows:
+            job["rows"] = [
+                self._row_status(job["output_dir"], item) for item in self.job_store.get_items(job_id)
+            ]
+        return job
+    
+    def _row_status(self, output_dir: str, item: Dict) -> Dict:
+        row = json.loads(item["item"])
+        row.update({
+            "row": item["position"],
+            "status": item["status"],
+            "detail": item["detail"],
+            "file": self._article_path(output_dir, item["position"]) if item["status"] == "done" else None
+        })
+        return row
+    
+    def _article_path(self, output_dir: str, position: int) -> str:
+        return os.path.join(output_dir, "articles", f"{position:06d}.json")
+    
+    async def run(self, job_id: str):
+        """Procesa las filas pendientes del trabajo agrupadas por manual"""
+        # SQLite se usa desde un hilo para no bloquear el event loop
+        job = await asyncio.to_thread(self.job_store.get_job, job_id)
+        if job is None:
+            return
+        
+        publish_status = job["params"].get("publish_status", "draft")
+        output_dir = self._output_dir(job)
+        os.makedirs(os.path.join(output_dir, "articles"), exist_ok=True)
+        
+        groups = group_by_manual(await asyncio.to_thread(self.job_store.get_items, job_id, "pending"))
+        await asyncio.to_thread(self.job_store.set_status, job_id, "running")
+        print(f"📦 Bulk {job_id}: {len(groups)} manuales pendientes")
+        
+        semaphore = asyncio.Semaphore(max(1, self.workers))
+        
+        async def worker(pdf_url: str, by_model: Dict[str, List[Tuple[int, str]]]):
+            async with semaphore:
+                await self._run_manual(job_id, output_dir, pdf_url, by_model, publish_status)
+        
+        try:
+            if job["params"].get("pipeline"):
+                await self._run_pipeline(job_id, output_dir, groups, publish_status, job["params"].get("publish"))
+            else:
+                await asyncio.gather(*(worker(pdf_url, by_model) for pdf_url, by_model in groups.items()))
+            await asyncio.to_thread(self.job_store.set_status, job_id, "completed")
+        except asyncio.CancelledError:
+            # El trabajo queda en "running" y se reanuda en el próximo arranque
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self.job_store.set_status, job_id, "failed", str(e))
+        finally:
+            self._pipelines.pop(job_id, None)
+            await asyncio.to_thread(self._write_status_file, job_id, output_dir)
+    
+    async def _run_pipeline(
+        self,
+        job_id: str,
+        output_dir: str,
+        groups: Dict[str, Dict[str, List[Tuple[int, str]]]],
+        publish_status: str,
+        publish: bool
+    ):
+        if publish and self.wordpress_client is None:
+            raise Exception("WordPress no está configurado")
+        
+        pipeline = build_article_pipeline(
+            self.batch_generator,
+            publish_status,
+            self.wordpress_client if publish else None,
+            self.global_index
+        )
+        self._pipelines[job_id] = pipeline
+        async for row in pipeline.run(groups.items()):
+            await asyncio.to_thread(
+                self._finish_row, job_id, output_dir, row["position"], row["article"], row["detail"]
+            )
+    
+    async def _run_manual(
+        self,
+        job_id: str,
+        output_dir: str,
+        pdf_url: str,
+        by_model: Dict[str, List[Tuple[int, str]]],
+        publish_status: str
+    ):
+        print(f"📄 Procesando PDF: {pdf_url}")
+        try:
+            pdf_result = await self.batch_generator.pdf_processor.process_pdf(pdf_url)
+            detail = None if pdf_result["success"] else "No se pudo procesar el PDF"
+        except Exception as e:
+            detail = f"No se pudo procesar el PDF: {str(e)}"
+        
+        if detail:
+            for rows in by_model.values():
+                for position, _ in rows:
+                    await asyncio.to_thread(self.job_store.finish_item, job_id, position, None, detail)
+            return
+        
+        for model, rows in by_model.items():
+            positions = [position for position, _ in rows]
+            async for index, error, article, detail in self.batch_generator.iter_articles(
+                pdf_result, model, (error for _, error in rows), publish_status
+            ):
+                await asyncio.to_thread(self._finish_row, job_id, output_dir, positions[index], article, detail)
+        
+        # Solo si la generación embebió el manual (algún error sin código indexado)
+        if self.global_index is not None:
+            try:
+                await self.global_index.add_manual(pdf_result, list(by_model), pdf_url=pdf_url, embedded_only=True)
+            except Exception as e:
+                print(f"⚠️ No se pudo añadir el manual al índice global: {str(e)}")
+    
+    def _finish_row(
+        self,
+        job_id: str,
+        output_dir: str,
+        position: int,
+        article: Optional[Dict],
+        detail: Optional[str]
+    ):
+        if article is not None:
+            self._write_article(output_dir, position, article)
+        # El artículo completo ya está en disco: el store guarda solo el estado
+        self.job_store.finish_item(
+            job_id, position,
+            {"file": self._article_path(output_dir, position)} if article is not None else None,
+            detail
+        )
+    
+    def _write_article(self, output_dir: str, position: int, article: Dict):
+        path = self._article_path(output_dir, position)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(article, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def _write_status_file(self, job_id: str, output_dir: str):
+        """Escribe status.jsonl con el estado final de cada fila del manifiesto"""
+        with open(os.path.join(output_dir, "status.jsonl"), "w", encoding="utf-8") as f:
+            for item in self.job_store.get_items(job_id):
+                f.write(json.dumps(self._row_status(output_dir, item), ensure_ascii=False) + "\n")
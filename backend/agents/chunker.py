@@ -0,0 +1,199 @@
+"""
+Chunking por tokens que respeta la estructura del manual
+"""
+from typing import Iterator, List, Optional, Tuple
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken llega con langchain-openai
+    tiktoken = None
+
+from agents.manual_text import ManualText, page_header
+
+
+LINE_PATTERN = re.compile(r"[^\n]*\n?")
+
+# "3.2 Conexión WiFi", "4. SOLUCIÓN DE PROBLEMAS", "Capítulo 5"...
+NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|cap[ií]tulo\s+\d+|chapter\s+\d+)\s+\S", re.IGNORECASE)
+
+
+def is_heading(line: str) -> bool:
+    """Línea corta que parece un título (numerado o en mayúsculas)"""
+    line = line.strip()
+    if not line or len(line) > 80:
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    letters = [char for char in line if char.isalpha()]
+    return len(letters) >= 4 and all(char.isupper() for char in letters)
+
+
+class StructuredChunker:
+    """
+    Divide cada página en chunks de hasta CHUNK_MAX_TOKENS tokens del modelo.
+    
+    Los cortes caen en límites de estructura: saltos de página (un chunk
+    nunca cruza de página), títulos (empiezan chunk nuevo), párrafos y, si
+    un párrafo no cabe, líneas completas, así que las filas de una tabla de
+    códigos de error no se parten. Solo una línea más larga que el máximo
+    se corta, y siempre entre palabras.
+    
+    El solape (CHUNK_OVERLAP_TOKENS) se hace con unidades completas del
+    final del chunk anterior y no se aplica tras un título.
+    """
+    
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        encoding: Optional[str] = None
+    ):
+        self.max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else \
+            int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+        self.encoding_name = encoding or os.getenv("CHUNK_ENCODING", "cl100k_base")
+        # El encoding se carga al primer uso: tiktoken lo descarga si no
+        # está en su caché y sin red importar el módulo fallaría
+        self._encoding = None
+        self._encoding_loaded = False
+        self._encoding_lock = threading.Lock()
+        # Un título solo abre chunk nuevo si el actual ya tiene algo de contenido
+        self.min_tokens = self.max_tokens // 4
+    
+    def _get_encoding(self):
+        """Encoding de tiktoken o None si no se puede cargar (4 caracteres por token)"""
+        if self._encoding_loaded:
+            return self._encoding
+        with self._encoding_lock:
+            if not self._encoding_loaded:
+                if tiktoken is not None:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        print(f"⚠️ No se pudo cargar el encoding {self.encoding_name} ({e}), se cuentan 4 caracteres por token")
+                self._encoding_loaded = True
+        return self._encoding
+    
+    @property
+    def key(self) -> str:
+        """Identifica los parámetros de chunking dentro de la caché"""
+        counter = self.encoding_name if self._get_encoding() else "chars"
+        return f"tok{self.max_tokens}_{self.overlap_tokens}_{counter}"
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Tokens de cada texto (4 caracteres por token si no hay tiktoken)"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return [-(-len(text) // 4) for text in texts]
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+    
+    def _split_line(self, text: str, start: int, end: int, tokens: int) -> Iterator[Tuple[int, int, int]]:
+        """Corta entre palabras una línea que no cabe en un chunk"""
+        pieces = max(2, -(-tokens // self.max_tokens))
+        target = -(-(end - start) // pieces)
+        while start < end:
+            cut = min(start + target, end)
+            if cut < end:
+                space = text.rfind(" ", start, cut)
+                if space > start:
+                    cut = space + 1
+            yield start, cut, self.count_tokens([text[start:cut]])[0]
+            start = cut
+    
+    def _page_units(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int, bool]]:
+        """
+        Unidades indivisibles de una página: párrafos completos si caben,
+        si no sus líneas
+        
+        Yields:
+            (inicio, fin, tokens, empieza con título)
+        """
+        lines = [
+            (match.start(), match.end())
+            for match in LINE_PATTERN.finditer(text, start, end)
+            if match.end() > match.start()
+        ]
+        line_tokens = self.count_tokens([text[a:b] for a, b in lines])
+        
+        paragraph: List[Tuple[int, int, int]] = []
+        heading = False
+        
+        def flush() -> Iterator[Tuple[int, int, int, bool]]:
+            total = sum(tokens for _, _, tokens in paragraph)
+            if total <= self.max_tokens:
+                yield paragraph[0][0], paragraph[-1][1], total, heading
+                return
+            for position, (a, b, tokens) in enumerate(paragraph):
+                first = heading and position == 0
+                if tokens <= self.max_tokens:
+                    yield a, b, tokens, first
+                else:
+                    for piece_start, piece_end, piece_tokens in self._split_line(text, a, b, tokens):
+                        yield piece_start, piece_end, piece_tokens, first
+                        first = False
+        
+        for (a, b), tokens in zip(lines, line_tokens):
+            line = text[a:b]
+            if not line.strip():
+                if paragraph:
+                    yield from flush()
+                    paragraph = []
+                continue
+            line_is_heading = is_heading(line)
+            if line_is_heading and paragraph:
+                yield from flush()
+                paragraph = []
+            if not paragraph:
+                heading = line_is_heading
+            paragraph.append((a, b, tokens))
+        
+        if paragraph:
+            yield from flush()
+    
+    def iter_chunks(self, manual: ManualText) -> Iterator[Tuple[int, int, int]]:
+        """
+        Genera los chunks del manual de forma perezosa
+        
+        Yields:
+            (inicio, fin, página) de cada chunk en el buffer del manual
+        """
+        text = manual.text
+        for position in range(manual.num_pages):
+            span = manual.page_span(position)
+            page = manual.page_numbers[position]
+            start = span.start
+            header = page_header(page)
+            if text.startswith(header, start):
+                start += len(header)
+            
+            current: List[Tuple[int, int, int, bool]] = []
+            current_tokens = 0
+            for unit in self._page_units(text, start, span.stop):
+                tokens, heading = unit[2], unit[3]
+                if current and (
+                    current_tokens + tokens > self.max_tokens
+                    or (heading and current_tokens >= self.min_tokens)
+                ):
+                    yield current[0][0], current[-1][1], page
+                    
+                    # Solape con unidades completas, salvo al empezar sección
+                    carry: List[Tuple[int, int, int, bool]] = []
+                    carry_tokens = 0
+                    if not heading:
+                        for previous in reversed(current):
+                            if carry_tokens + previous[2] > self.overlap_tokens:
+                                break
+                            carry.insert(0, previous)
+                            carry_tokens += previous[2]
+                    while carry and carry_tokens + tokens > self.max_tokens:
+                        carry_tokens -= carry.pop(0)[2]
+                    current, current_tokens = carry, carry_tokens
+                
+                current.append(unit)
+                current_tokens += tokens
+            
+            if current:
+                yield current[0][0], current[-1][1], page
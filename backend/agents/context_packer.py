@@ -0,0 +1,103 @@
+"""
+Construcción del contexto del prompt sin texto repetido
+"""
+from langchain_core.documents import Document
+from typing import List, Optional, Tuple
+import os
+
+from agents.embedding_cache import normalize_chunk_text
+from agents.rate_limiter import RateLimiter
+
+
+class ContextPacker:
+    """
+    Empaqueta los documentos recuperados en el contexto del prompt.
+    
+    Los chunks se solapan (CHUNK_OVERLAP_TOKENS) y los k resultados suelen ser
+    vecinos, así que unirlos tal cual repite el mismo texto. Aquí los
+    resultados que se solapan o son contiguos en el manual se funden en un
+    único tramo del buffer, los duplicados se descartan y se añaden tramos
+    por orden de relevancia hasta CONTEXT_MAX_TOKENS.
+    """
+    
+    def __init__(self, max_tokens: Optional[int] = None, separator: str = "\n\n"):
+        self.max_tokens = max_tokens if max_tokens is not None else \
+            int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+        self.separator = separator
+    
+    def _merge_spans(self, ranked: List[Tuple[int, Document]]) -> List[Tuple[int, int, int, List]]:
+        """
+        Funde los documentos (con su posición en el ranking) en tramos contiguos
+        
+        Returns:
+            [(inicio, fin, mejor posición en el ranking, páginas)]
+        """
+        spans = sorted(
+            (doc.metadata["start"], doc.metadata["end"], rank, doc.metadata.get("page"))
+            for rank, doc in ranked
+        )
+        merged = []
+        for start, end, rank, page in spans:
+            if merged and start <= merged[-1][1]:
+                last = merged[-1]
+                last[1] = max(last[1], end)
+                last[2] = min(last[2], rank)
+                if page not in last[3]:
+                    last[3].append(page)
+            else:
+                merged.append([start, end, rank, [page]])
+        return [tuple(span) for span in merged]
+    
+    def pack(self, documents: List[Document], chunks) -> Tuple[str, List[Document]]:
+        """
+        Construye el contexto a partir de los documentos recuperados
+        
+        Args:
+            documents: Documentos en orden de relevancia
+            chunks: Chunks del manual (ManualText para poder fundir tramos)
+        
+        Returns:
+            (texto del contexto, documentos empaquetados en el orden del contexto)
+        """
+        text = getattr(chunks, "text", None)
+        located = []
+        loose = []
+        for rank, doc in enumerate(documents):
+            if text is not None and doc.metadata.get("start") is not None:
+                located.append((rank, doc))
+            else:
+                loose.append((rank, doc))
+        
+        # (rank, posición en el manual, texto, metadata)
+        candidates = [
+            (rank, start, text[start:end].strip(), {"page": pages[0], "pages": pages, "start": start, "end": end})
+            for start, end, rank, pages in self._merge_spans(located)
+        ]
+        for rank, doc in loose:
+            candidates.append((rank, None, doc.page_content.strip(), dict(doc.metadata)))
+        candidates.sort(key=lambda candidate: candidate[0])
+        
+        selected = []
+        seen = []
+        used = 0
+        for rank, start, content, metadata in candidates:
+            normalized = normalize_chunk_text(content)
+            if not normalized or any(normalized in previous for previous in seen):
+                continue
+            
+            tokens = RateLimiter.estimate_tokens(content)
+            if self.max_tokens and used + tokens > self.max_tokens:
+                if selected:
+                    continue
+                # Ni el mejor tramo cabe entero: recortarlo al presupuesto
+                content = content[:self.max_tokens * 4]
+                tokens = RateLimiter.estimate_tokens(content)
+            
+            seen.append(normalized)
+            selected.append((start, rank, content, metadata))
+            used += tokens
+        
+        # Tramos en el orden del manual para que el contexto se lea seguido
+        selected.sort(key=lambda item: (item[0] is None, item[0] or 0, item[1]))
+        packed = [Document(page_content=content, metadata=metadata) for _, _, content, metadata in selected]
+        return self.separator.join(doc.page_content for doc in packed), packed
@@ -0,0 +1,99 @@
+"""
+Caché de embeddings por chunk compartida entre manuales
+"""
+from typing import Dict, List, Optional
+import numpy as np
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+
+def normalize_chunk_text(text: str) -> str:
+    """Normaliza espacios para que el mismo bloque de texto comparta clave"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Caché (modelo de embeddings, hash del texto normalizado) -> vector.
+    
+    Se guarda en SQLite con los vectores como blobs float32, así que los
+    bloques repetidos entre manuales del mismo fabricante (avisos de
+    seguridad, garantía, configuración inicial) solo se embeben una vez.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+    
+    def get_many(self, model: str, text_hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Devuelve los vectores cacheados de los hashes pedidos"""
+        found = {}
+        unique = list(dict.fromkeys(text_hashes))
+        
+        with self._lock:
+            # SQLite limita el número de parámetros por consulta
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        
+        return found
+    
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray]):
+        """Guarda vectores nuevos"""
+        if not vectors:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                    for text_hash, vector in vectors.items()
+                ]
+            )
+            self._conn.commit()
+    
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
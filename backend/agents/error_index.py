@@ -0,0 +1,137 @@
+"""
+Índice invertido de códigos de error (E03, R01, T06...) de un manual
+"""
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Tuple
+import re
+
+
+ERROR_CODE_PATTERN = re.compile(r"\b([A-Z]{1,3})-?(\d{1,4})\b")
+
+# Especificaciones con la misma forma que un código: USB3, IP65, IPX4,
+# H264, RJ45, CAT6, MP3, DDR4, pilas CR2032/LR6, normas ISO9001...
+NOT_ERROR_CODE = re.compile(
+    r"USB\d|IPX?\d{1,2}|H26[456]|RJ\d{2}|CAT\d|MP[34]|DDR\d|CR\d{4}|LR\d{1,2}|(ISO|IEC|DIN)\d+"
+)
+
+
+def normalize_code(letters: str, digits: str) -> str:
+    """Normaliza un código de error: 'E-3', 'E3' y 'E03' -> 'E03'"""
+    return f"{letters}{int(digits):02d}"
+
+
+def find_error_codes(text: str) -> Iterator[Tuple[int, str]]:
+    """Genera (posición, código normalizado) de cada código de error del texto"""
+    for match in ERROR_CODE_PATTERN.finditer(text):
+        letters, digits = match.group(1), match.group(2)
+        if NOT_ERROR_CODE.fullmatch(letters + digits):
+            continue
+        yield match.start(), normalize_code(letters, digits)
+
+
+def extract_error_codes(text: str) -> List[str]:
+    """Devuelve los códigos de error de un texto, sin repetir y en orden"""
+    codes = []
+    for _, code in find_error_codes(text):
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+class ErrorCodeIndex:
+    """
+    Índice código de error -> chunks y páginas donde aparece.
+    
+    Se construye al ingerir el manual para que las peticiones sobre un
+    código conocido puedan obtener su contexto sin búsqueda vectorial.
+    """
+    
+    # Cambia cuando cambian los códigos que se reconocen: los índices
+    # cacheados con otra versión se reconstruyen desde el texto
+    VERSION = 2
+    
+    def __init__(self, postings: Dict[str, Dict[int, int]] = None, pages: Dict[str, List[int]] = None):
+        # código -> {índice de chunk: número de apariciones}
+        self.postings = postings or {}
+        # código -> páginas donde aparece
+        self.pages = pages or {}
+    
+    @classmethod
+    def build(cls, manual) -> "ErrorCodeIndex":
+        """
+        Construye el índice recorriendo el manual página a página
+        
+        Args:
+            manual: ManualText con los chunks ya calculados
+        """
+        index = cls()
+        starts = manual.chunk_starts
+        ends = manual.chunk_ends
+        
+        for position in range(manual.num_pages):
+            span = manual.page_span(position)
+            page = manual.page_numbers[position]
+            page_text = manual.text[span.start:span.stop]
+            
+            for start, code in find_error_codes(page_text):
+                offset = span.start + start
+                
+                chunk = bisect_right(starts, offset) - 1
+                if chunk < 0 or ends[chunk] <= offset:
+                    continue
+                
+                chunk_counts = index.postings.setdefault(code, {})
+                chunk_counts[chunk] = chunk_counts.get(chunk, 0) + 1
+                code_pages = index.pages.setdefault(code, [])
+                if not code_pages or code_pages[-1] != page:
+                    code_pages.append(page)
+        
+        return index
+    
+    def __contains__(self, code: str) -> bool:
+        return code in self.postings
+    
+    def __len__(self) -> int:
+        return len(self.postings)
+    
+    def lookup(self, error: str, k: int = 3) -> List[int]:
+        """
+        Busca los chunks más relevantes para los códigos de un error
+        
+        Args:
+            error: Texto del error (ej: "Error E03 - Fallo de comunicación")
+            k: Número máximo de chunks
+        
+        Returns:
+            Índices de chunk ordenados por relevancia, o lista vacía si el
+            error no tiene códigos o alguno no está en el índice
+        """
+        codes = extract_error_codes(error)
+        if not codes or any(code not in self.postings for code in codes):
+            return []
+        
+        scores: Dict[int, int] = {}
+        for code in codes:
+            for chunk, count in self.postings[code].items():
+                scores[chunk] = scores.get(chunk, 0) + count
+        
+        ranked = sorted(scores, key=lambda chunk: (-scores[chunk], chunk))
+        return ranked[:k]
+    
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.VERSION,
+            "postings": {
+                code: [[chunk, count] for chunk, count in counts.items()]
+                for code, counts in self.postings.items()
+            },
+            "pages": self.pages
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ErrorCodeIndex":
+        postings = {
+            code: {chunk: count for chunk, count in counts}
+            for code, counts in data.get("postings", {}).items()
+        }
+        return cls(postings, data.get("pages", {}))
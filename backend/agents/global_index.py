@@ -0,0 +1,494 @@
+"""
+Índice vectorial global y persistente de todos los manuales, por shards
+"""
+from langchain_core.documents import Document
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import numpy as np
+import faiss
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from agents.single_flight import SingleFlight
+from agents.vector_store import ChunkDocstore
+
+
+def normalize_key(value: Optional[str]) -> str:
+    """Minúsculas, sin acentos y solo letras y números: 'Echo Dot (4ª gen.)' -> 'echo dot 4a gen'"""
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value.lower())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", value))
+
+
+def shard_name(brand: Optional[str]) -> str:
+    """Shard de una marca (nombre de fichero seguro); "unknown" para los manuales sin marca"""
+    return normalize_key(brand).replace(" ", "_") or "unknown"
+
+
+class GlobalVectorIndex:
+    """
+    Un único índice de chunks para todos los manuales ingeridos.
+    
+    Los vectores se reparten en shards por marca, cada uno un índice HNSW
+    de FAISS (búsqueda sub-lineal, admite añadir sin reentrenar) guardado
+    en GLOBAL_INDEX_DIR. Una marca se parte en segmentos de hasta
+    GLOBAL_INDEX_SEGMENT_ROWS filas: añadir un manual solo reescribe el
+    segmento abierto, y lo hace sin bloquear las búsquedas. Los metadatos (manual, modelos que cubre, marca,
+    tipo de dispositivo y fila -> chunk) viven en SQLite junto a los shards.
+    
+    Las consultas se filtran por modelo, marca y tipo de dispositivo: solo
+    se buscan los shards de los manuales que cumplen el filtro y, si estos
+    suman pocas filas (GLOBAL_INDEX_EXACT_MAX), se comparan exactamente sus
+    vectores en lugar de recorrer el grafo. Los vectores se toman del
+    índice por manual (create_vectorstore), así que añadir un manual no
+    vuelve a llamar al modelo de embeddings.
+    
+    Al reindexar una URL con contenido nuevo, la versión anterior deja de
+    aparecer en los resultados. Las filas apuntan a chunks del manual según
+    su chunk_key: si cambian los parámetros de chunking, idioma o casi
+    duplicados, los manuales indexados con otra clave dejan de aparecer y
+    se reindexan la próxima vez que se añaden.
+    """
+    
+    def __init__(
+        self,
+        article_generator,
+        pdf_processor,
+        index_dir: Optional[str] = None
+    ):
+        self.article_generator = article_generator
+        self.pdf_processor = pdf_processor
+        
+        root = index_dir or os.getenv("GLOBAL_INDEX_DIR", "./cache/global_index")
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", article_generator.embedding_model)
+        self.index_dir = os.path.join(root, safe_model)
+        self.shards_dir = os.path.join(self.index_dir, "shards")
+        os.makedirs(self.shards_dir, exist_ok=True)
+        
+        self.hnsw_m = int(os.getenv("GLOBAL_INDEX_HNSW_M", "32"))
+        self.ef_search = int(os.getenv("GLOBAL_INDEX_EF_SEARCH", "64"))
+        self.exact_max = int(os.getenv("GLOBAL_INDEX_EXACT_MAX", "4096"))
+        self.segment_rows = int(os.getenv("GLOBAL_INDEX_SEGMENT_ROWS", "10000"))
+        # Añadir los manuales de /generate_article y los trabajos bulk que
+        # ya se embebieron (nunca se embebe solo para el índice global)
+        self.auto_add = os.getenv("GLOBAL_INDEX_AUTO_ADD", "true").lower() == "true"
+        
+        self._shards: Dict[str, faiss.Index] = {}
+        # search() consulta los metadatos con el lock ya tomado
+        self._lock = threading.RLock()
+        # Serializa las escrituras, que guardan el segmento fuera de _lock
+        self._write_lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.index_dir, "metadata.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS manuals (
+                content_hash TEXT PRIMARY KEY,
+                pdf_url TEXT,
+                brand TEXT NOT NULL,
+                device_type TEXT NOT NULL,
+                shard TEXT NOT NULL,
+                num_rows INTEGER NOT NULL,
+                active INTEGER NOT NULL,
+                indexed_at REAL NOT NULL,
+                chunk_key TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS manual_models (
+                content_hash TEXT NOT NULL,
+                model_key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                PRIMARY KEY (content_hash, model_key)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                shard TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunk INTEGER NOT NULL,
+                PRIMARY KEY (shard, row)
+            );
+            CREATE INDEX IF NOT EXISTS manual_models_key ON manual_models (model_key);
+            CREATE INDEX IF NOT EXISTS chunks_manual ON chunks (content_hash);
+            """
+        )
+        # Índices creados antes de guardar la clave de chunking
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(manuals)")}
+        if "chunk_key" not in columns:
+            self._conn.execute("ALTER TABLE manuals ADD COLUMN chunk_key TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+        
+        # Un mismo manual pedido a la vez se indexa una sola vez
+        self.flight = SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+    
+    def _shard_path(self, shard: str) -> str:
+        return os.path.join(self.shards_dir, f"{shard}.faiss")
+    
+    def _load_shard(self, shard: str) -> Optional[faiss.Index]:
+        index = self._shards.get(shard)
+        if index is None and os.path.exists(self._shard_path(shard)):
+            index = faiss.read_index(self._shard_path(shard))
+            self._shards[shard] = index
+        return index
+    
+    def _save_shard(self, shard: str, index: faiss.Index):
+        tmp_path = f"{self._shard_path(shard)}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self._shard_path(shard))
+    
+    def _open_segment(self, brand_shard: str, rows: int) -> str:
+        """Segmento de la marca donde caben `rows` filas más (el último o uno nuevo)"""
+        prefix = f"{brand_shard}-"
+        numbers = sorted(
+            int(name[len(prefix):-len(".faiss")])
+            for name in os.listdir(self.shards_dir)
+            if name.startswith(prefix) and name.endswith(".faiss") and name[len(prefix):-len(".faiss")].isdigit()
+        )
+        if numbers:
+            segment = f"{prefix}{numbers[-1]:04d}"
+            index = self._load_shard(segment)
+            if index is None or index.ntotal == 0 or index.ntotal + rows <= self.segment_rows:
+                return segment
+        return f"{prefix}{(numbers[-1] + 1 if numbers else 0):04d}"
+    
+    def _link_models(self, content_hash: str, models: List[str]):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO manual_models (content_hash, model_key, model) VALUES (?, ?, ?)",
+            [(content_hash, normalize_key(model), model.strip()) for model in models if normalize_key(model)]
+        )
+    
+    async def add_manual(
+        self,
+        pdf_result: Dict,
+        models: List[str],
+        pdf_url: Optional[str] = None,
+        brand: Optional[str] = None,
+        device_type: Optional[str] = None,
+        embedded_only: bool = False
+    ) -> Dict:
+        """
+        Añade un manual procesado al índice global (o solo sus modelos si ya estaba)
+        
+        Args:
+            pdf_result: Resultado de PDFProcessor.process_pdf
+            models: Modelos que cubre el manual
+            pdf_url: URL del manual; reindexarla desactiva la versión anterior
+            brand: Marca (shard). Sin ella el manual va al shard común
+                "unknown" y no aparece al filtrar por marca; no se deduce del
+                modelo, cuya primera palabra suele ser la línea de producto
+            device_type: Tipo de dispositivo (ej: "alexa", "router")
+            embedded_only: Solo si el manual ya tiene índice vectorial propio
+                (la indexación automática no llama al modelo de embeddings)
+        
+        Returns:
+            Dict con content_hash, shard, rows y added (False si ya estaba
+            o si se omitió por embedded_only)
+        """
+        content_hash = pdf_result["content_hash"]
+        
+        chunk_key = getattr(pdf_result["chunks"], "chunk_key", None) or self.pdf_processor.chunk_key
+        
+        existing = await asyncio.to_thread(self._link_existing, content_hash, chunk_key, models, brand)
+        if existing:
+            return existing
+        if embedded_only and not self.article_generator.has_vectorstore(pdf_result["chunks"]):
+            return {"content_hash": content_hash, "shard": None, "rows": 0, "added": False}
+        
+        async def index_manual() -> Dict:
+            vectorstore = await self.article_generator.get_vectorstore(pdf_result["chunks"])
+            return await asyncio.to_thread(
+                self._add_vectors, content_hash, chunk_key, vectorstore, models, pdf_url, brand, device_type
+            )
+        
+        result = await self.flight.do((content_hash, chunk_key), index_manual)
+        # Quien se unió a una indexación en curso puede traer otros modelos
+        await asyncio.to_thread(self._link_existing, content_hash, chunk_key, models, brand)
+        return result
+    
+    def _link_existing(
+        self,
+        content_hash: str,
+        chunk_key: str,
+        models: List[str],
+        brand: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Si el manual ya está indexado con esta clave de chunking, le asocia
+        los modelos (y la marca, si se indexó sin ella) y devuelve su registro
+        """
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT shard, num_rows FROM manuals WHERE content_hash = ? AND chunk_key = ?",
+                (content_hash, chunk_key)
+            ).fetchone()
+            if existing is None:
+                return None
+            self._link_models(content_hash, models)
+            if normalize_key(brand):
+                # El shard no cambia, pero el manual ya coincide con el filtro por marca
+                self._conn.execute(
+                    "UPDATE manuals SET brand = ? WHERE content_hash = ? AND brand = ''",
+                    (normalize_key(brand), content_hash)
+                )
+            self._conn.commit()
+            return {"content_hash": content_hash, "shard": existing["shard"], "rows": existing["num_rows"], "added": False}
+    
+    def _add_vectors(
+        self,
+        content_hash: str,
+        chunk_key: str,
+        vectorstore,
+        models: List[str],
+        pdf_url: Optional[str],
+        brand: Optional[str],
+        device_type: Optional[str]
+    ) -> Dict:
+        vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+        chunk_ids = [int(vectorstore.index_to_docstore_id[i]) for i in range(len(vectors))]
+        
+        with self._write_lock:
+            with self._lock:
+                existing = self._link_existing(content_hash, chunk_key, models, brand)
+                if existing:
+                    return existing
+                
+                shard = self._open_segment(shard_name(brand), len(vectors))
+                index = self._load_shard(shard)
+                if index is None:
+                    index = faiss.IndexHNSWFlat(vectors.shape[1], self.hnsw_m)
+                    self._shards[shard] = index
+                first_row = index.ntotal
+                index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+            
+            # Primero el segmento: filas sin metadatos se ignoran, metadatos sin
+            # filas no. Solo las escrituras modifican el índice y están
+            # serializadas, así que se guarda sin bloquear las búsquedas
+            self._save_shard(shard, index)
+            
+            with self._lock:
+                # Indexado con otra clave de chunking: sus filas ya no
+                # corresponden a los chunks del manual y quedan huérfanas
+                self._conn.execute("DELETE FROM chunks WHERE content_hash = ?", (content_hash,))
+                self._conn.execute("DELETE FROM manuals WHERE content_hash = ?", (content_hash,))
+                
+                if pdf_url:
+                    self._conn.execute(
+                        "UPDATE manuals SET active = 0 WHERE pdf_url = ? AND content_hash != ?",
+                        (pdf_url, content_hash)
+                    )
+                self._conn.execute(
+                    "INSERT INTO manuals (content_hash, pdf_url, brand, device_type, shard, num_rows, active, indexed_at, chunk_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)",
+                    (
+                        content_hash, pdf_url, normalize_key(brand), normalize_key(device_type),
+                        shard, len(vectors), time.time(), chunk_key
+                    )
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (shard, row, content_hash, chunk) VALUES (?, ?, ?, ?)",
+                    [(shard, first_row + i, content_hash, chunk) for i, chunk in enumerate(chunk_ids)]
+                )
+                self._link_models(content_hash, models)
+                self._conn.commit()
+        
+        print(f"🗂️ Manual {content_hash[:12]} en el índice global ({shard}, {len(vectors)} chunks)")
+        return {"content_hash": content_hash, "shard": shard, "rows": len(vectors), "added": True}
+    
+    def schedule_manual(self, pdf_result: Dict, models: List[str], **metadata) -> asyncio.Task:
+        """
+        Añade en segundo plano el manual, si ya se embebió, o sus modelos,
+        si ya estaba en el índice
+        """
+        async def run():
+            try:
+                await self.add_manual(pdf_result, models, embedded_only=True, **metadata)
+            except Exception as e:
+                print(f"⚠️ No se pudo añadir el manual al índice global: {str(e)}")
+        
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+    
+    def find_manuals(
+        self,
+        model: Optional[str] = None,
+        brand: Optional[str] = None,
+        device_type: Optional[str] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Manuales activos que cumplen el filtro, agrupados por shard
+        
+        Solo cuentan los indexados con la clave de chunking actual. El modelo se busca primero exacto (normalizado) y, si no hay
+        ninguno, como fragmento en cualquiera de los dos sentidos
+        ("echo dot 4" encuentra "amazon echo dot 4").
+        
+        Returns:
+            {shard: {content_hash: filas}}
+        """
+        conditions = ["m.active = 1", "m.chunk_key = ?"]
+        params: List = [self.pdf_processor.chunk_key]
+        if brand:
+            conditions.append("m.brand = ?")
+            params.append(normalize_key(brand))
+        if device_type:
+            conditions.append("m.device_type = ?")
+            params.append(normalize_key(device_type))
+        
+        model_key = normalize_key(model)
+        model_filters = [None]
+        if model_key:
+            model_filters = [
+                ("SELECT content_hash FROM manual_models WHERE model_key = ?", [model_key]),
+                (
+                    "SELECT content_hash FROM manual_models WHERE length(model_key) >= 4 AND "
+                    "(model_key LIKE '%' || ? || '%' OR ? LIKE '%' || model_key || '%')",
+                    [model_key, model_key]
+                )
+            ]
+        
+        rows = []
+        with self._lock:
+            for model_filter in model_filters:
+                query = f"SELECT m.content_hash, m.shard, m.num_rows FROM manuals m WHERE {' AND '.join(conditions)}"
+                query_params = list(params)
+                if model_filter:
+                    query += f" AND m.content_hash IN ({model_filter[0]})"
+                    query_params += model_filter[1]
+                rows = self._conn.execute(query, query_params).fetchall()
+                if rows:
+                    break
+        
+        manuals: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            manuals.setdefault(row["shard"], {})[row["content_hash"]] = row["num_rows"]
+        return manuals
+    
+    def _select_chunks(self, shard: str, column: str, values: List) -> List[sqlite3.Row]:
+        """Filas de chunks del shard cuyo column está en values (en lotes por el límite de SQLite)"""
+        found = []
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            found.extend(self._conn.execute(
+                f"SELECT row, content_hash, chunk FROM chunks WHERE shard = ? AND {column} IN ({','.join('?' * len(batch))})",
+                [shard, *batch]
+            ).fetchall())
+        return found
+    
+    def _search_shard(
+        self,
+        shard: str,
+        query: np.ndarray,
+        manuals: Dict[str, int],
+        k: int
+    ) -> List[Tuple[float, str, int]]:
+        """(distancia, content_hash, chunk) de los k vecinos del shard dentro de manuals"""
+        index = self._load_shard(shard)
+        if index is None or index.ntotal == 0:
+            return []
+        
+        if sum(manuals.values()) <= self.exact_max:
+            # Pocas filas: comparación exacta solo con los vectores del filtro
+            rows = [row for row in self._select_chunks(shard, "content_hash", list(manuals)) if row["row"] < index.ntotal]
+            if not rows:
+                return []
+            vectors = np.vstack([index.reconstruct(row["row"]) for row in rows])
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            best = np.argsort(distances)[:k]
+            return [(float(distances[i]), rows[i]["content_hash"], rows[i]["chunk"]) for i in best]
+        
+        # Muchas filas: HNSW pidiendo más vecinos hasta tener k que cumplan el filtro
+        fetch = k * 4
+        while True:
+            index.hnsw.efSearch = max(self.ef_search, fetch)
+            distances, neighbors = index.search(query[None, :], min(fetch, index.ntotal))
+            candidates = [int(row) for row in neighbors[0] if row >= 0]
+            metadata = {row["row"]: row for row in self._select_chunks(shard, "row", candidates)}
+            hits = [
+                (float(distance), metadata[row]["content_hash"], metadata[row]["chunk"])
+                for distance, row in zip(distances[0], candidates)
+                if row in metadata and metadata[row]["content_hash"] in manuals
+            ]
+            if len(hits) >= k or fetch >= index.ntotal:
+                return hits[:k]
+            fetch *= 4
+    
+    def search(
+        self,
+        query: np.ndarray,
+        model: Optional[str] = None,
+        brand: Optional[str] = None,
+        device_type: Optional[str] = None,
+        k: int = 3
+    ) -> List[Tuple[float, str, int]]:
+        """
+        Vecinos más cercanos de un vector de consulta en los manuales filtrados
+        
+        Returns:
+            [(distancia, content_hash, chunk)] ordenados por distancia
+        """
+        hits = []
+        with self._lock:
+            for shard, manuals in self.find_manuals(model, brand, device_type).items():
+                hits.extend(self._search_shard(shard, query, manuals, k))
+        hits.sort(key=lambda hit: hit[0])
+        return hits[:k]
+    
+    async def retrieve(
+        self,
+        question: str,
+        model: str,
+        brand: Optional[str] = None,
+        device_type: Optional[str] = None,
+        k: int = 3
+    ) -> Optional[Tuple[Dict, List[Document]]]:
+        """
+        Encuentra el manual y el contexto de una pregunta sin conocer el PDF
+        
+        El manual elegido es el del mejor resultado; el contexto son los
+        resultados de ese manual, para poder fundirlos sobre su texto.
+        
+        Returns:
+            (resultado del manual como el de process_pdf, documentos) o None
+            si ningún manual indexado cumple el filtro
+        """
+        vector = await asyncio.to_thread(self.article_generator.embeddings.embed_documents, [question])
+        query = np.asarray(vector[0], dtype=np.float32)
+        hits = await asyncio.to_thread(self.search, query, model, brand, device_type, k * 3)
+        
+        for content_hash in dict.fromkeys(hit[1] for hit in hits):
+            # El manual puede haber salido de la caché de manuales
+            pdf_result = await asyncio.to_thread(self.pdf_processor.load_manual, content_hash)
+            if pdf_result is None:
+                continue
+            docstore = ChunkDocstore(pdf_result["chunks"])
+            documents = []
+            for distance, hit_hash, chunk in hits:
+                if hit_hash != content_hash or len(documents) == k:
+                    continue
+                document = docstore.search(str(chunk))
+                if isinstance(document, Document):
+                    document.metadata.update({"content_hash": content_hash, "distance": distance})
+                    documents.append(document)
+            return pdf_result, documents
+        
+        return None
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            manuals = self._conn.execute(
+                "SELECT shard, COUNT(*) AS manuals, SUM(num_rows) AS rows FROM manuals "
+                "WHERE active = 1 AND chunk_key = ? GROUP BY shard",
+                (self.pdf_processor.chunk_key,)
+            ).fetchall()
+        return {
+            "shards": {row["shard"]: {"manuals": row["manuals"], "rows": row["rows"]} for row in manuals},
+            "manuals": sum(row["manuals"] for row in manuals),
+            "rows": sum(row["rows"] or 0 for row in manuals)
+        }
@@ -0,0 +1,167 @@
+"""
+Almacén persistente de trabajos en segundo plano
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+
+class JobStore:
+    """
+    Guarda trabajos y el estado de cada uno de sus elementos en SQLite (WAL).
+    
+    Cada elemento (ej: cada error de un batch) se marca como done/failed en
+    cuanto termina, de forma que un trabajo interrumpido puede reanudarse
+    procesando solo los elementos que siguen pendientes.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("JOB_STORE_PATH", "./cache/jobs.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                detail TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                item TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                detail TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (job_id, position)
+            );
+            """
+        )
+        self._conn.commit()
+    
+    def create_job(self, kind: str, params: Dict, items: List[str]) -> str:
+        """Crea un trabajo en estado queued con sus elementos pendientes"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, total, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), len(items), now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, position, item, status, updated_at) "
+                "VALUES (?, ?, ?, 'pending', ?)",
+                [(job_id, position, item, now) for position, item in enumerate(items)]
+            )
+            self._conn.commit()
+        return job_id
+    
+    def set_status(self, job_id: str, status: str, detail: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, detail = ?, updated_at = ? WHERE id = ?",
+                (status, detail, datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+    
+    def finish_item(
+        self,
+        job_id: str,
+        position: int,
+        result: Optional[Dict] = None,
+        detail: Optional[str] = None
+    ):
+        """Checkpoint de un elemento: done si hay resultado, failed si no"""
+        status = "done" if result is not None else "failed"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, detail = ?, updated_at = ? "
+                "WHERE job_id = ? AND position = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    detail,
+                    datetime.now().isoformat(),
+                    job_id,
+                    position
+                )
+            )
+            self._conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ?",
+                (datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Estado del trabajo con el recuento de elementos por estado"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                (job_id,)
+            ).fetchall())
+        
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "total": row["total"],
+            "completed": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0),
+            "detail": row["detail"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+    
+    def get_items(self, job_id: str, status: Optional[str] = None) -> List[Dict]:
+        """Elementos del trabajo en orden, opcionalmente filtrados por estado"""
+        query = "SELECT * FROM job_items WHERE job_id = ?"
+        args = [job_id]
+        if status:
+            query += " AND status = ?"
+            args.append(status)
+        query += " ORDER BY position"
+        
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        
+        return [
+            {
+                "position": row["position"],
+                "item": row["item"],
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "detail": row["detail"],
+                "updated_at": row["updated_at"]
+            }
+            for row in rows
+        ]
+    
+    def incomplete_jobs(self, kind: str) -> List[str]:
+        """Trabajos que no llegaron a terminar (en cola o interrumpidos)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND status IN ('queued', 'running') "
+                "ORDER BY created_at",
+                (kind,)
+            ).fetchall()
+        return [row["id"] for row in rows]
@@ -0,0 +1,121 @@
+"""
+Parser incremental del JSON de artículos que devuelve el LLM en streaming
+"""
+from typing import Any, List, Optional, Tuple
+import json
+
+
+class JSONSectionStream:
+    """
+    Recibe el texto del LLM a trozos y emite cada campo del objeto JSON de
+    primer nivel en cuanto se cierra.
+
+    Eventos devueltos por feed():
+        ("section", clave, valor): un campo completo (title, introduction...)
+        ("item", clave, valor): un elemento de un campo lista (ej: cada
+            producto de recommended_products), antes de que se cierre la lista
+
+    Ignora el texto previo a la primera llave (ej: ```json).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.escape = False
+
+        self.expect = "key"
+        self.key: Optional[str] = None
+        self.key_start: Optional[int] = None
+        self.value_start: Optional[int] = None
+        self.value_is_array = False
+        self.item_start: Optional[int] = None
+
+    def _decode(self, start: int, end: int) -> Tuple[bool, Any]:
+        try:
+            return True, json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            return False, None
+
+    def _close_value(self, end: int, events: List[Tuple[str, str, Any]]):
+        if self.key is not None and self.value_start is not None:
+            ok, value = self._decode(self.value_start, end)
+            if ok:
+                events.append(("section", self.key, value))
+        self.expect = "key"
+        self.key = None
+        self.value_start = None
+        self.value_is_array = False
+
+    def _close_item(self, end: int, events: List[Tuple[str, str, Any]]):
+        if self.item_start is not None:
+            ok, value = self._decode(self.item_start, end)
+            if ok:
+                events.append(("item", self.key, value))
+        self.item_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        """Añade texto y devuelve los eventos que se completaron"""
+        self.text += chunk
+        events = []
+
+        while self.pos < len(self.text) and not self.done:
+            char = self.text[self.pos]
+
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect == "key" and self.key_start is not None:
+                        ok, key = self._decode(self.key_start, self.pos + 1)
+                        self.key = key if ok else None
+                        self.key_start = None
+                        self.expect = "colon"
+                self.pos += 1
+                continue
+
+            # Inicio de valor de primer nivel o de elemento de lista
+            if not char.isspace():
+                if self.depth == 1 and self.expect == "value" and self.value_start is None:
+                    self.value_start = self.pos
+                    self.value_is_array = char == "["
+                elif self.depth == 2 and self.value_is_array and self.item_start is None and char not in ",]":
+                    self.item_start = self.pos
+
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect == "key":
+                    self.key_start = self.pos
+            elif char == ":" and self.depth == 1 and self.expect == "colon":
+                self.expect = "value"
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                if char == "]" and self.depth == 2 and self.value_is_array:
+                    self._close_item(self.pos, events)
+                self.depth -= 1
+                if self.depth == 0:
+                    self._close_value(self.pos, events)
+                    self.done = True
+            elif char == ",":
+                if self.depth == 1 and self.expect == "value":
+                    self._close_value(self.pos, events)
+                elif self.depth == 2 and self.value_is_array:
+                    self._close_item(self.pos, events)
+
+            self.pos += 1
+
+        return events
@@ -0,0 +1,124 @@
+"""
+Detección de idioma por página para descartar idiomas que no se publican
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import re
+
+from agents.manual_text import PAGE_MARKER
+
+
+WORD_PATTERN = re.compile(r"\b[^\W\d_]+\b")
+
+# Palabras funcionales frecuentes de los idiomas habituales en manuales
+LANGUAGE_WORDS: Dict[str, set] = {
+    "es": set("el la los las del que y en una por para con es se su al como más pero está puede "
+              "este esta cuando si no lo le sus hay desde pulse botón dispositivo".split()),
+    "en": set("the and of to a in is for with on not be this that it as are or you your can if "
+              "when from will press device button".split()),
+    "fr": set("le la les de des du que et en un une pour avec ne pas est se au aux comme plus "
+              "mais ce cette vous sur dans appuyez appareil".split()),
+    "de": set("der die das den dem des und in ein eine zu mit nicht ist sich auf für als auch wie "
+              "oder wenn sie werden kann bei gerät taste".split()),
+    "it": set("il lo la gli le di del della che e in un una per con non è si al come più ma "
+              "questo questa quando sono premere dispositivo".split()),
+    "pt": set("o os as do da dos das que e em um uma para com não é se ao como mais mas está "
+              "pode este esta quando no na dispositivo botão".split()),
+    "nl": set("de het een en van in is op te dat met voor niet zijn als ook aan of u uw bij "
+              "wordt kan deze wanneer apparaat".split()),
+    "pl": set("i w na z do nie się jest to że o jak po przez lub dla jeśli może oraz urządzenie "
+              "przycisk".split()),
+    "sv": set("och i att det som en på är av för med till den inte om har kan eller när du "
+              "enheten knappen".split()),
+}
+
+# Las palabras que comparten varios idiomas puntúan menos
+_WEIGHTS: Dict[str, Dict[str, float]] = {}
+for _language, _words in LANGUAGE_WORDS.items():
+    for _word in _words:
+        _WEIGHTS.setdefault(_word, {})
+for _word, _scores in _WEIGHTS.items():
+    _owners = [language for language, words in LANGUAGE_WORDS.items() if _word in words]
+    for _language in _owners:
+        _scores[_language] = 1.0 / len(_owners)
+
+
+def detect_language(text: str, min_words: int = 20) -> Optional[str]:
+    """
+    Idioma más probable de un texto (código ISO 639-1) o None si hay poco
+    texto o ninguna palabra funcional reconocible (tablas, figuras...)
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < min_words:
+        return None
+    
+    scores: Counter = Counter()
+    for word, count in Counter(words).items():
+        for language, weight in _WEIGHTS.get(word, {}).items():
+            scores[language] += weight * count
+    
+    if not scores:
+        return None
+    language, score = scores.most_common(1)[0]
+    # Al menos un 5% de palabras funcionales del idioma ganador
+    return language if score >= 0.05 * len(words) else None
+
+
+class LanguageFilter:
+    """
+    Descarta en la ingesta las páginas escritas en idiomas no permitidos.
+    
+    Los manuales suelen repetir el mismo contenido en 10-20 idiomas y solo
+    se publica en los de INGEST_LANGUAGES (por defecto "es"), así que el
+    resto de páginas se vacía antes de trocear y embeber. Las páginas sin
+    idioma claro (tablas, diagramas, poco texto) se conservan. Si ninguna
+    página está en un idioma permitido, se conserva el manual entero.
+    
+    INGEST_LANGUAGES vacío desactiva el filtro.
+    """
+    
+    def __init__(self, languages: Optional[Iterable[str]] = None, min_words: Optional[int] = None):
+        if languages is None:
+            languages = os.getenv("INGEST_LANGUAGES", "es").split(",")
+        self.languages = sorted({language.strip().lower() for language in languages if language.strip()})
+        self.min_words = min_words or int(os.getenv("LANGUAGE_MIN_WORDS", "20"))
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.languages)
+    
+    @property
+    def key(self) -> str:
+        """Identifica la configuración del filtro dentro de la caché"""
+        return "lang-" + "-".join(self.languages) if self.languages else "lang-all"
+    
+    def filter_pages(self, pages: List[str]) -> Tuple[List[str], List[Optional[str]]]:
+        """
+        Vacía las páginas en idiomas no permitidos conservando su separador
+        
+        Args:
+            pages: Texto de cada página, precedido de su cabecera de página
+        
+        Returns:
+            (páginas filtradas, idioma detectado por página)
+        """
+        if not self.enabled:
+            return pages, [None] * len(pages)
+        
+        headers = []
+        languages = []
+        for page in pages:
+            match = PAGE_MARKER.match(page)
+            header = match.group(0) if match else ""
+            headers.append(header)
+            languages.append(detect_language(page[len(header):], self.min_words))
+        
+        if not any(language in self.languages for language in languages):
+            return pages, languages
+        
+        filtered = [
+            header if language is not None and language not in self.languages else page
+            for page, header, language in zip(pages, headers, languages)
+        ]
+        return filtered, languages
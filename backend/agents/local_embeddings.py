@@ -0,0 +1,92 @@
+"""
+Motor de embeddings local (sin red) basado en hashing de términos
+"""
+from langchain_core.embeddings import Embeddings
+from typing import List, Optional
+import numpy as np
+import os
+import re
+import unicodedata
+import zlib
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Palabras muy frecuentes que no aportan a la recuperación
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "o", "para", "por", "que", "se", "su", "un", "una", "y",
+    "and", "for", "in", "is", "it", "of", "on", "or", "the", "to",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos y sin stopwords"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings TF con hashing de unigramas y bigramas, calculados con NumPy.
+    
+    No necesita red ni entrenamiento: cada término se proyecta con crc32
+    a una de `dim` posiciones (con signo para compensar colisiones), se
+    aplica tf sublineal (log(1 + tf)) y se normaliza L2, de modo que la
+    distancia L2 de FAISS equivale a similitud coseno.
+    """
+    
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
+        self.model = f"local-hashing-{self.dim}"
+    
+    def _features(self, text: str) -> List[str]:
+        tokens = tokenize(text)
+        bigrams = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        return tokens + bigrams
+    
+    def _embed(self, text: str) -> np.ndarray:
+        features = self._features(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+        
+        hashes = np.fromiter(
+            (zlib.crc32(feature.encode("utf-8")) for feature in features),
+            dtype=np.uint32,
+            count=len(features)
+        )
+        buckets = hashes % self.dim
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        
+        np.add.at(vector, buckets, signs)
+        # tf sublineal conservando el signo
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+def build_embeddings(api_key: Optional[str] = None) -> Embeddings:
+    """
+    Crea el backend de embeddings configurado en EMBEDDINGS_BACKEND
+    
+    - openai (por defecto): OpenAIEmbeddings
+    - local: HashingEmbeddings, sin llamadas a la API
+    """
+    backend = os.getenv("EMBEDDINGS_BACKEND", "openai").lower()
+    
+    if backend == "local":
+        return HashingEmbeddings()
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(api_key=api_key)
+    
+    raise ValueError(f"EMBEDDINGS_BACKEND no soportado: {backend}")
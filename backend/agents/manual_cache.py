@@ -0,0 +1,242 @@
+"""
+Caché en disco de manuales descargados y procesados
+"""
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+class ManualCache:
+    """
+    Caché direccionada por contenido para manuales PDF.
+    
+    Cada manual se guarda bajo el SHA-256 de sus bytes (texto extraído y
+    layout de páginas y chunks, ambos por chunk_key: el texto ya viene
+    filtrado por idioma y depende de la configuración). Aparte se mantiene un índice URL -> (sha256, ETag,
+    Last-Modified) para revalidar con GET condicional. Las entradas se
+    expulsan por LRU cuando se supera el presupuesto de tamaño.
+    """
+    
+    INDEX_FILE = "index.json"
+    
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[int] = None
+    ):
+        self.cache_dir = cache_dir or os.getenv("MANUAL_CACHE_DIR", "./cache/manuals")
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(os.getenv("MANUAL_CACHE_MAX_MB", "1024")) * 1024 * 1024
+        # Durante este tiempo no se revalida la URL contra el servidor
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            int(os.getenv("MANUAL_CACHE_TTL", "86400"))
+        
+        # Los accesos se guardan en index.json como mucho cada tanto tiempo
+        self.touch_interval = float(os.getenv("MANUAL_CACHE_TOUCH_INTERVAL", "60"))
+        self._flushed_at = 0.0
+        
+        self.entries_dir = os.path.join(self.cache_dir, "entries")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        self._index = self._load_index()
+        # El índice se modifica también desde hilos (extracción, embeddings)
+        self._lock = threading.RLock()
+    
+    def _load_index(self) -> Dict:
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        index.setdefault("urls", {})
+        index.setdefault("entries", {})
+        return index
+    
+    def _save_index(self):
+        self._write_atomic(
+            os.path.join(self.cache_dir, self.INDEX_FILE),
+            json.dumps(self._index)
+        )
+        self._flushed_at = time.monotonic()
+    
+    def _write_atomic(self, path: str, data: str):
+        """Escribe un fichero de forma atómica (tmp + rename)"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def _entry_dir(self, content_hash: str) -> str:
+        return os.path.join(self.entries_dir, content_hash)
+    
+    def get_url(self, url: str) -> Optional[Dict]:
+        """Devuelve el registro cacheado de una URL (sha256, etag, last_modified)"""
+        record = self._index["urls"].get(url)
+        if record and record["sha256"] in self._index["entries"]:
+            return record
+        return None
+    
+    def is_fresh(self, record: Dict) -> bool:
+        """Indica si el registro puede usarse sin revalidar contra el servidor"""
+        return time.time() - record.get("checked_at", 0) < self.ttl_seconds
+    
+    def put_url(
+        self,
+        url: str,
+        content_hash: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        """Asocia una URL con el contenido descargado y sus validadores HTTP"""
+        with self._lock:
+            self._index["urls"][url] = {
+                "sha256": content_hash,
+                "etag": etag,
+                "last_modified": last_modified,
+                "checked_at": time.time()
+            }
+            self._save_index()
+    
+    @staticmethod
+    def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+        """Calcula el SHA-256 de un fichero sin cargarlo entero en memoria"""
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
+    
+    def has_entry(self, content_hash: str) -> bool:
+        return content_hash in self._index["entries"]
+    
+    def load(self, content_hash: str, chunk_key: str) -> Optional[Dict]:
+        """
+        Carga texto y layout (páginas y chunks) de un manual cacheado
+        
+        Args:
+            content_hash: SHA-256 del PDF
+            chunk_key: Identificador de los parámetros de chunking
+        
+        Returns:
+            {"text": ..., "layout": {...}} o None si no está en caché
+        """
+        if content_hash not in self._index["entries"]:
+            return None
+        
+        entry_dir = self._entry_dir(content_hash)
+        try:
+            with open(os.path.join(entry_dir, f"text_{chunk_key}.txt"), "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(os.path.join(entry_dir, f"layout_{chunk_key}.json"), "r", encoding="utf-8") as f:
+                layout = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        
+        self._touch(content_hash)
+        return {"text": text, "layout": layout}
+    
+    def store(self, content_hash: str, chunk_key: str, text: str, layout: Dict):
+        """Guarda texto y layout de un manual y aplica el presupuesto de tamaño"""
+        entry_dir = self._entry_dir(content_hash)
+        os.makedirs(entry_dir, exist_ok=True)
+        
+        self._write_atomic(os.path.join(entry_dir, f"text_{chunk_key}.txt"), text)
+        self._write_atomic(
+            os.path.join(entry_dir, f"layout_{chunk_key}.json"),
+            json.dumps(layout)
+        )
+        
+        with self._lock:
+            self._index["entries"][content_hash] = {
+                "size": self._dir_size(entry_dir),
+                "last_access": time.time()
+            }
+            self._evict()
+            self._save_index()
+    
+    def artifact_path(self, content_hash: str, name: str) -> Optional[str]:
+        """
+        Ruta base para guardar un artefacto derivado junto a un manual
+        
+        Returns:
+            Ruta dentro de la entrada, o None si el manual no está en caché
+        """
+        if content_hash not in self._index["entries"]:
+            return None
+        return os.path.join(self._entry_dir(content_hash), name)
+    
+    def refresh_entry(self, content_hash: str):
+        """Recalcula el tamaño de una entrada tras añadirle artefactos"""
+        with self._lock:
+            if content_hash not in self._index["entries"]:
+                return
+            self._index["entries"][content_hash]["size"] = self._dir_size(self._entry_dir(content_hash))
+            self._evict()
+            self._save_index()
+    
+    def _touch(self, content_hash: str):
+        """
+        Actualiza el último acceso en memoria (el LRU ya lo ve) y solo
+        reescribe index.json si pasaron MANUAL_CACHE_TOUCH_INTERVAL segundos
+        desde la última escritura: tras una caída se pierden como mucho los
+        accesos de ese intervalo, que solo afectan al orden de expulsión
+        """
+        with self._lock:
+            entry = self._index["entries"].get(content_hash)
+            if entry:
+                entry["last_access"] = time.time()
+                if time.monotonic() - self._flushed_at >= self.touch_interval:
+                    self._save_index()
+    
+    def flush(self):
+        """Guarda los accesos pendientes (al cerrar)"""
+        with self._lock:
+            self._save_index()
+    
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path)
+        )
+    
+    def _evict(self):
+        """Expulsa las entradas menos usadas hasta cumplir el presupuesto"""
+        entries = self._index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        if total <= self.max_bytes:
+            return
+        
+        for content_hash in sorted(entries, key=lambda h: entries[h]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries.pop(content_hash)["size"]
+            shutil.rmtree(self._entry_dir(content_hash), ignore_errors=True)
+        
+        # Eliminar URLs que apuntaban a entradas expulsadas
+        self._index["urls"] = {
+            url: record for url, record in self._index["urls"].items()
+            if record["sha256"] in entries
+        }
+    
+    def stats(self) -> Dict:
+        """Resumen del estado de la caché"""
+        with self._lock:
+            entries = self._index["entries"]
+            return {
+                "entries": len(entries),
+                "urls": len(self._index["urls"]),
+                "size_bytes": sum(entry["size"] for entry in entries.values()),
+                "max_bytes": self.max_bytes
+            }
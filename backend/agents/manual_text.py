@@ -0,0 +1,210 @@
+"""
+Representación compacta del texto de un manual y sus chunks
+"""
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence
+import re
+
+
+PAGE_MARKER = re.compile(r"\n--- Página (\d+) ---\n")
+
+
+def page_header(page_number: int) -> str:
+    """Separador que precede al texto de cada página en el buffer"""
+    return f"\n--- Página {page_number} ---\n"
+
+
+class ChunkView:
+    """
+    Vista (start, end, page) sobre el buffer de texto de un manual.
+    
+    El texto del chunk solo se materializa al pedirlo. Admite acceso tipo
+    dict (chunk["text"], chunk["id"]...) para los consumidores existentes.
+    """
+    
+    __slots__ = ("_manual", "index", "start", "end", "page")
+    
+    def __init__(self, manual: "ManualText", index: int, start: int, end: int, page: int):
+        self._manual = manual
+        self.index = index
+        self.start = start
+        self.end = end
+        self.page = page
+    
+    @property
+    def id(self) -> str:
+        return f"chunk_{self.index}"
+    
+    @property
+    def text(self) -> str:
+        return self._manual.text[self.start:self.end].strip()
+    
+    def __getitem__(self, key: str):
+        if key not in ("id", "text", "start", "end", "page"):
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "text": self.text,
+            "start": self.start,
+            "end": self.end,
+            "page": self.page
+        }
+    
+    def __repr__(self) -> str:
+        return f"ChunkView({self.id}, page={self.page}, {self.start}:{self.end})"
+
+
+class ManualText(Sequence):
+    """
+    Un único buffer de texto, una tabla de offsets de página y los chunks
+    guardados como arrays de enteros (start, end, page).
+    
+    Se comporta como una secuencia de ChunkView, así que puede pasarse donde
+    antes se esperaba la lista de dicts de chunks.
+    """
+    
+    def __init__(self, text: str, page_offsets: Optional[List[int]] = None, page_numbers: Optional[List[int]] = None):
+        self.text = text
+        if page_offsets is None:
+            page_offsets, page_numbers = self._find_pages(text)
+        self.page_offsets = array("q", page_offsets)
+        self.page_numbers = array("i", page_numbers)
+        self.clear_chunks()
+        
+        # Identidad del manual (SHA-256 del PDF) y de su versión anterior
+        self.content_hash: Optional[str] = None
+        self.previous_hash: Optional[str] = None
+        # Parámetros de chunking con los que se generaron los chunks
+        self.chunk_key: Optional[str] = None
+    
+    @staticmethod
+    def _find_pages(text: str):
+        """Reconstruye la tabla de páginas a partir de los separadores de página"""
+        offsets = []
+        numbers = []
+        for match in PAGE_MARKER.finditer(text):
+            offsets.append(match.start())
+            numbers.append(int(match.group(1)))
+        if not offsets or offsets[0] != 0:
+            offsets.insert(0, 0)
+            numbers.insert(0, numbers[0] - 1 if numbers else 1)
+        return offsets, numbers
+    
+    @classmethod
+    def from_pages(cls, pages: List[str], page_numbers: Optional[List[int]] = None) -> "ManualText":
+        """Construye el buffer uniendo las páginas en una sola pasada"""
+        offsets = []
+        position = 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page)
+        if page_numbers is None:
+            page_numbers = list(range(1, len(pages) + 1))
+        return cls("".join(pages), offsets, page_numbers)
+    
+    @property
+    def num_pages(self) -> int:
+        return len(self.page_offsets)
+    
+    def page_span(self, position: int) -> range:
+        """Rango [inicio, fin) de la posición-ésima página del buffer"""
+        start = self.page_offsets[position]
+        end = self.page_offsets[position + 1] if position + 1 < len(self.page_offsets) else len(self.text)
+        return range(start, end)
+    
+    def page_at(self, offset: int) -> int:
+        """Número de página que contiene un offset del texto"""
+        position = max(bisect_right(self.page_offsets, offset) - 1, 0)
+        return self.page_numbers[position]
+    
+    def page_text(self, position: int) -> str:
+        span = self.page_span(position)
+        return self.text[span.start:span.stop]
+    
+    def page_body(self, position: int) -> str:
+        """Texto de la página sin su separador"""
+        text = self.page_text(position)
+        header = page_header(self.page_numbers[position])
+        return text[len(header):] if text.startswith(header) else text
+    
+    def clear_chunks(self):
+        self.chunk_starts = array("q")
+        self.chunk_ends = array("q")
+        self.chunk_pages = array("i")
+        self.chunk_duplicate_of: Optional[array] = None
+        self._duplicates: Dict[int, List[int]] = {}
+    
+    def add_chunk(self, start: int, end: int, page: int):
+        self.chunk_starts.append(start)
+        self.chunk_ends.append(end)
+        self.chunk_pages.append(page)
+    
+    def set_duplicates(self, duplicate_of: List[int]):
+        """
+        Registra el representante de cada chunk (el propio índice si es único)
+        
+        Los casi duplicados no se embeben ni se indexan: se recuperan a
+        través de su representante, que guarda las referencias a ellos.
+        """
+        self.chunk_duplicate_of = array("q", duplicate_of)
+        self._duplicates = {}
+        for index, representative in enumerate(duplicate_of):
+            if representative != index:
+                self._duplicates.setdefault(representative, []).append(index)
+    
+    def representatives(self) -> List[int]:
+        """Índices de los chunks que se indexan (todos si no hay duplicados)"""
+        if self.chunk_duplicate_of is None:
+            return list(range(len(self)))
+        return [index for index, representative in enumerate(self.chunk_duplicate_of) if representative == index]
+    
+    def duplicates(self, index: int) -> List[int]:
+        """Chunks casi idénticos representados por el chunk index"""
+        return self._duplicates.get(index, [])
+    
+    def __len__(self) -> int:
+        return len(self.chunk_starts)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk fuera de rango")
+        return ChunkView(self, index, self.chunk_starts[index], self.chunk_ends[index], self.chunk_pages[index])
+    
+    def __iter__(self) -> Iterator[ChunkView]:
+        for index in range(len(self)):
+            yield ChunkView(self, index, self.chunk_starts[index], self.chunk_ends[index], self.chunk_pages[index])
+    
+    def to_layout(self) -> Dict:
+        """Serializa páginas y chunks (sin el texto) para la caché"""
+        return {
+            "page_offsets": self.page_offsets.tolist(),
+            "page_numbers": self.page_numbers.tolist(),
+            "chunk_starts": self.chunk_starts.tolist(),
+            "chunk_ends": self.chunk_ends.tolist(),
+            "chunk_pages": self.chunk_pages.tolist(),
+            "chunk_duplicate_of": self.chunk_duplicate_of.tolist() if self.chunk_duplicate_of is not None else None
+        }
+    
+    @classmethod
+    def from_layout(cls, text: str, layout: Dict) -> "ManualText":
+        manual = cls(text, layout["page_offsets"], layout["page_numbers"])
+        manual.chunk_starts = array("q", layout["chunk_starts"])
+        manual.chunk_ends = array("q", layout["chunk_ends"])
+        manual.chunk_pages = array("i", layout["chunk_pages"])
+        if layout.get("chunk_duplicate_of") is not None:
+            manual.set_duplicates(layout["chunk_duplicate_of"])
+        return manual
@@ -0,0 +1,150 @@
+"""
+Detección de chunks casi duplicados con MinHash y LSH
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import os
+import re
+import zlib
+
+from agents.error_index import extract_error_codes
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Primo mayor que 2^32 para las permutaciones (a * x + b) mod p
+_PRIME = np.uint64(4294967311)
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Bandas y filas por banda con el umbral LSH, (1/b)^(1/r), más alto que
+    no supere el umbral de similitud pedido: los candidatos de más se
+    descartan al comparar firmas, los que faltan no se recuperan
+    """
+    options = [
+        (bands, num_perm // bands)
+        for bands in range(1, num_perm + 1)
+        if num_perm % bands == 0
+    ]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    return max(below or options[-1:], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class NearDuplicateDetector:
+    """
+    Agrupa chunks casi idénticos (avisos de seguridad, bloques de "contacte
+    con el servicio técnico", pies de página...) que se repiten en cada
+    capítulo del manual.
+    
+    Cada chunk se resume en una firma MinHash de NEAR_DUP_PERMUTATIONS
+    valores sobre sus 5-gramas de palabras; LSH por bandas propone
+    candidatos y se confirman los que tienen una similitud de Jaccard
+    estimada >= NEAR_DUP_THRESHOLD. Cada grupo queda representado por su
+    primer chunk. Dos chunks con códigos de error distintos nunca se
+    agrupan, aunque el resto del texto coincida (filas de una tabla de
+    códigos).
+    
+    NEAR_DUP_THRESHOLD=0 desactiva la detección.
+    """
+    
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        num_perm: Optional[int] = None,
+        shingle_size: int = 5
+    ):
+        self.threshold = threshold if threshold is not None else \
+            float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+        self.num_perm = num_perm or int(os.getenv("NEAR_DUP_PERMUTATIONS", "64"))
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(self.num_perm, self.threshold or 1.0)
+        
+        # Semilla fija: las mismas permutaciones en cada proceso
+        generator = np.random.default_rng(1)
+        self._a = generator.integers(1, 2 ** 31, self.num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, 2 ** 32, self.num_perm, dtype=np.uint64)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+    
+    @property
+    def key(self) -> str:
+        """Identifica la configuración del detector dentro de la caché"""
+        if not self.enabled:
+            return "nd0"
+        return f"nd{int(self.threshold * 100)}_{self.num_perm}"
+    
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash de los n-gramas de palabras del texto"""
+        words = WORD_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        shingles = {
+            " ".join(words[i:i + size])
+            for i in range(max(1, len(words) - size + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+    
+    def find_duplicates(self, texts: List[str]) -> List[int]:
+        """
+        Asigna a cada texto su representante
+        
+        Args:
+            texts: Textos de los chunks en orden del manual
+        
+        Returns:
+            Índice del representante de cada texto (el propio índice si es
+            único o el primero de su grupo)
+        """
+        representatives = list(range(len(texts)))
+        if not self.enabled or len(texts) < 2:
+            return representatives
+        
+        # (banda, valores de la banda) -> representantes con esa banda
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        signatures: Dict[int, np.ndarray] = {}
+        codes: Dict[int, List[str]] = {}
+        
+        for index, text in enumerate(texts):
+            if not text.strip():
+                continue
+            signature = self.signature(text)
+            text_codes = sorted(extract_error_codes(text))
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)
+            ]
+            
+            match = None
+            seen = set()
+            for band_key in band_keys:
+                for candidate in buckets.get(band_key, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    if codes[candidate] != text_codes:
+                        continue
+                    if np.mean(signatures[candidate] == signature) >= self.threshold:
+                        match = candidate
+                        break
+                if match is not None:
+                    break
+            
+            if match is not None:
+                representatives[index] = match
+                continue
+            
+            # Solo los representantes entran en los buckets: sin cadenas A~B~C
+            signatures[index] = signature
+            codes[index] = text_codes
+            for band_key in band_keys:
+                buckets.setdefault(band_key, []).append(index)
+        
+        return representatives
@@ -2,95 +2,526 @@
 Módulo para procesar PDFs y extraer texto para RAG
 """
 import fitz  # PyMuPDF
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import multiprocessing
 import tempfile
 import os
 import httpx
 
+from agents.chunker import StructuredChunker
+from agents.language_filter import LanguageFilter
+from agents.manual_cache import ManualCache
+from agents.manual_text import ManualText, page_header
+from agents.near_duplicates import NearDuplicateDetector
+from agents.error_index import ErrorCodeIndex
+from agents.single_flight import SingleFlight
+
+
+def _extract_pages(pdf_path: str, page_indices: Optional[List[int]] = None) -> List[str]:
+    """
+    Extrae el texto de las páginas indicadas (o de todas) con su cabecera
+    
+    Función de módulo para poder ejecutarse en un ProcessPoolExecutor.
+    """
+    with fitz.open(pdf_path) as doc:
+        if page_indices is None:
+            page_indices = range(len(doc))
+        return [
+            page_header(page_num + 1) + doc.load_page(page_num).get_text()
+            for page_num in page_indices
+        ]
+
+
+def _hash_pages(pdf_path: str) -> List[str]:
+    """
+    Calcula un hash por página a partir de todo lo que determina su texto:
+    su content stream, los de los Form XObjects que dibuja (anidados
+    incluidos) y sus fuentes con su tabla ToUnicode
+    
+    Es mucho más barato que extraer el texto y permite saber qué páginas
+    cambiaron entre dos versiones del mismo manual.
+    """
+    hashes = []
+    # Los XObjects y ToUnicode compartidos (cabeceras, pies) se hashean una vez
+    streams: Dict[int, bytes] = {}
+    
+    def stream_digest(doc, xref: int) -> bytes:
+        if xref not in streams:
+            streams[xref] = hashlib.sha256(doc.xref_stream(xref) or b"").digest()
+        return streams[xref]
+    
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            hasher = hashlib.sha256(page.read_contents())
+            for xobject in page.get_xobjects():
+                hasher.update(stream_digest(doc, xobject[0]))
+            for font in page.get_fonts(full=True):
+                hasher.update(repr(font[3:6]).encode())
+                kind, value = doc.xref_get_key(font[0], "ToUnicode") if font[0] else ("null", "")
+                if kind == "xref":
+                    hasher.update(stream_digest(doc, int(value.split()[0])))
+            hashes.append(hasher.hexdigest())
+    return hashes
+
 
 class PDFProcessor:
     """Procesa PDFs y divide el contenido en chunks para RAG"""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
+    def __init__(
+        self,
+        chunker: Optional[StructuredChunker] = None,
+        cache: Optional[ManualCache] = None,
+        language_filter: Optional[LanguageFilter] = None,
+        duplicate_detector: Optional[NearDuplicateDetector] = None
+    ):
+        self.chunker = chunker or StructuredChunker()
+        self.cache = cache or ManualCache()
+        self.language_filter = language_filter or LanguageFilter()
+        self.duplicate_detector = duplicate_detector or NearDuplicateDetector()
+        
+        # Descarga en streaming
+        self.download_chunk_size = int(os.getenv("PDF_DOWNLOAD_CHUNK_KB", "256")) * 1024
+        self.max_download_bytes = int(os.getenv("PDF_MAX_DOWNLOAD_MB", "200")) * 1024 * 1024
+        self.download_retries = int(os.getenv("PDF_DOWNLOAD_RETRIES", "3"))
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Extracción en paralelo para manuales grandes
+        self.extract_workers = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+        self.parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        
+        # Peticiones concurrentes del mismo manual comparten el trabajo
+        self.flight = SingleFlight()
+    
+    @property
+    def chunk_key(self) -> str:
+        """Identifica los parámetros de chunking, idioma y duplicados dentro de la caché"""
+        return f"{self.chunker.key}_{self.language_filter.key}_{self.duplicate_detector.key}"
     
     async def download_pdf(self, url: str) -> str:
         """Descarga PDF desde URL y guarda temporalmente"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=30.0)
-            response.raise_for_status()
+        download = await self.fetch_pdf(url)
+        return download["path"]
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP compartido entre descargas (reutiliza conexiones)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
+    
+    async def close(self):
+        """Cierra el cliente HTTP y el pool de extracción compartidos"""
+        await asyncio.to_thread(self.cache.flush)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+    
+    async def fetch_pdf(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        Descarga PDF en streaming a un archivo temporal
+        
+        El cuerpo se escribe en bloques de tamaño fijo mientras se calcula el
+        SHA-256, así que la memoria usada no depende del tamaño del PDF. Si la
+        transferencia se corta, se reanuda con una petición Range.
+        
+        Args:
+            url: URL del PDF
+            headers: Cabeceras opcionales (GET condicional)
+        
+        Returns:
+            Dict con not_modified, path, sha256, etag y last_modified
+        """
+        client = self._get_client()
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+        hasher = hashlib.sha256()
+        received = 0
+        etag = None
+        last_modified = None
+        attempts = 0
+        
+        try:
+            while True:
+                request_headers = dict(headers or {})
+                if received:
+                    # Reanudar desde el último byte recibido
+                    request_headers = {"Range": f"bytes={received}-"}
+                    validator = etag if etag and not etag.startswith("W/") else last_modified
+                    if validator:
+                        request_headers["If-Range"] = validator
+                
+                try:
+                    async with client.stream("GET", url, headers=request_headers) as response:
+                        if response.status_code == 304 and not received:
+                            tmp_file.close()
+                            os.unlink(tmp_file.name)
+                            return {"not_modified": True, "path": None, "sha256": None}
+                        
+                        response.raise_for_status()
+                        
+                        if received and response.status_code != 206:
+                            # El servidor ignoró el Range: empezar de cero
+                            received = 0
+                            hasher = hashlib.sha256()
+                            tmp_file.seek(0)
+                            tmp_file.truncate()
+                        
+                        if not received:
+                            etag = response.headers.get("etag")
+                            last_modified = response.headers.get("last-modified")
+                            content_length = int(response.headers.get("content-length") or 0)
+                            if content_length > self.max_download_bytes:
+                                raise Exception(
+                                    f"El PDF supera el tamaño máximo permitido "
+                                    f"({self.max_download_bytes // (1024 * 1024)} MB)"
+                                )
+                        
+                        async for block in response.aiter_bytes(self.download_chunk_size):
+                            received += len(block)
+                            if received > self.max_download_bytes:
+                                raise Exception(
+                                    f"El PDF supera el tamaño máximo permitido "
+                                    f"({self.max_download_bytes // (1024 * 1024)} MB)"
+                                )
+                            hasher.update(block)
+                            tmp_file.write(block)
+                    break
+                except httpx.TransportError as e:
+                    attempts += 1
+                    if attempts > self.download_retries:
+                        raise Exception(f"Error al descargar el PDF: {str(e)}")
+                    print(f"⚠️ Descarga interrumpida en {received} bytes, reanudando ({attempts}/{self.download_retries})")
             
-            # Guardar en archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(response.content)
-                return tmp_file.name
+            tmp_file.close()
+            return {
+                "not_modified": False,
+                "path": tmp_file.name,
+                "sha256": hasher.hexdigest(),
+                "etag": etag,
+                "last_modified": last_modified
+            }
+        except Exception:
+            tmp_file.close()
+            if os.path.exists(tmp_file.name):
+                os.unlink(tmp_file.name)
+            raise
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extrae texto completo de un PDF"""
         try:
-            doc = fitz.open(pdf_path)
-            text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += f"\n--- Página {page_num + 1} ---\n"
-                text += page.get_text()
-            
-            doc.close()
-            return text
+            return "".join(_extract_pages(pdf_path))
         except Exception as e:
             raise Exception(f"Error al extraer texto del PDF: {str(e)}")
     
-    def split_into_chunks(self, text: str) -> List[Dict[str, str]]:
-        """Divide el texto en chunks con overlap"""
-        chunks = []
-        text_length = len(text)
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Pool de procesos compartido para la extracción con PyMuPDF"""
+        if self._pool is None:
+            # Sin fork: el servidor tiene hilos y un fork puede heredar locks
+            # tomados; forkserver donde exista (Linux) y spawn en el resto
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=context)
+        return self._pool
+    
+    async def extract_text_async(self, pdf_path: str) -> str:
+        """Extrae el texto completo sin bloquear el event loop"""
+        return "".join(await self.extract_pages_async(pdf_path))
+    
+    async def extract_pages_async(
+        self,
+        pdf_path: str,
+        page_indices: Optional[List[int]] = None
+    ) -> List[str]:
+        """
+        Extrae el texto página a página sin bloquear el event loop
+        
+        Los manuales grandes se reparten por rangos de páginas entre los
+        procesos del pool; cada proceso abre el documento por su cuenta.
+        Los pequeños se extraen en un único proceso del pool, para que
+        varios manuales a la vez no compitan por el GIL con el event loop.
         
-        start = 0
-        chunk_id = 0
+        Args:
+            pdf_path: Ruta del PDF
+            page_indices: Páginas a extraer (0-based); todas si es None
+        """
+        loop = asyncio.get_running_loop()
         
-        while start < text_length:
-            end = start + self.chunk_size
-            chunk_text = text[start:end]
+        try:
+            if page_indices is None:
+                with fitz.open(pdf_path) as doc:
+                    page_indices = list(range(len(doc)))
+            
+            if self.extract_workers <= 1:
+                return await asyncio.to_thread(_extract_pages, pdf_path, page_indices)
             
-            chunks.append({
-                "id": f"chunk_{chunk_id}",
-                "text": chunk_text.strip(),
-                "start": start,
-                "end": min(end, text_length)
-            })
+            pool = self._get_pool()
+            if len(page_indices) < self.parallel_min_pages:
+                return await loop.run_in_executor(pool, _extract_pages, pdf_path, page_indices)
             
-            start += self.chunk_size - self.chunk_overlap
-            chunk_id += 1
+            step = -(-len(page_indices) // self.extract_workers)
+            parts = await asyncio.gather(*[
+                loop.run_in_executor(pool, _extract_pages, pdf_path, page_indices[start:start + step])
+                for start in range(0, len(page_indices), step)
+            ])
+            return [page for part in parts for page in part]
+        except Exception as e:
+            raise Exception(f"Error al extraer texto del PDF: {str(e)}")
+    
+    def split_into_chunks(self, text) -> ManualText:
+        """
+        Divide el texto en chunks por tokens sin cruzar saltos de página,
+        cortando en títulos, párrafos o líneas (ver StructuredChunker)
+        
+        Args:
+            text: Texto completo o ManualText ya construido
+        
+        Returns:
+            ManualText con los chunks como vistas (start, end, page)
+        """
+        manual = text if isinstance(text, ManualText) else ManualText(text)
+        manual.clear_chunks()
         
-        return chunks
+        for start, end, page in self.chunker.iter_chunks(manual):
+            manual.add_chunk(start, end, page)
+        
+        return manual
     
-    async def process_pdf(self, pdf_source: str) -> Dict:
-        """Procesa PDF completo: descarga, extrae texto y crea chunks"""
-        # Determinar si es URL o archivo local
-        if pdf_source.startswith('http://') or pdf_source.startswith('https://'):
-            pdf_path = await self.download_pdf(pdf_source)
-            is_temp = True
+    def mark_duplicates(self, manual: ManualText) -> int:
+        """
+        Agrupa los chunks casi idénticos del manual (ver NearDuplicateDetector)
+        
+        Returns:
+            Número de chunks que quedan fuera del índice vectorial
+        """
+        representatives = self.duplicate_detector.find_duplicates([chunk.text for chunk in manual])
+        manual.set_duplicates(representatives)
+        return sum(1 for index, representative in enumerate(representatives) if representative != index)
+    
+    def _build_result(
+        self,
+        content_hash: str,
+        manual: ManualText,
+        error_index: ErrorCodeIndex,
+        cached: bool
+    ) -> Dict:
+        manual.content_hash = content_hash
+        manual.chunk_key = self.chunk_key
+        return {
+            "success": True,
+            "full_text": manual.text,
+            "chunks": manual,
+            "error_index": error_index,
+            "num_chunks": len(manual),
+            "num_indexed_chunks": len(manual.representatives()),
+            "num_pages": manual.num_pages,
+            "languages": getattr(manual, "languages", {}),
+            "text_length": len(manual.text),
+            "content_hash": content_hash,
+            "cached": cached
+        }
+    
+    def _load_cached(self, content_hash: str) -> Optional[Dict]:
+        """Devuelve el resultado cacheado para un contenido, si existe"""
+        cached = self.cache.load(content_hash, self.chunk_key)
+        if cached is None:
+            return None
+        layout = cached["layout"]
+        manual = ManualText.from_layout(cached["text"], layout)
+        manual.languages = layout.get("languages", {})
+        if layout.get("error_codes", {}).get("version") == ErrorCodeIndex.VERSION:
+            error_index = ErrorCodeIndex.from_dict(layout["error_codes"])
+        else:
+            error_index = ErrorCodeIndex.build(manual)
+        return self._build_result(content_hash, manual, error_index, cached=True)
+    
+    async def _process_file(
+        self,
+        pdf_path: str,
+        content_hash: str,
+        previous_hash: Optional[str] = None
+    ) -> Dict:
+        """
+        Extrae y trocea un PDF local, reutilizando la caché por contenido
+        
+        Si se conoce la versión anterior del manual (previous_hash), solo se
+        extraen las páginas cuyo hash cambió; el resto se copia del texto
+        cacheado de esa versión.
+        """
+        cached = self._load_cached(content_hash)
+        if cached:
+            return cached
+        
+        page_hashes = await asyncio.to_thread(_hash_pages, pdf_path)
+        pages: List[Optional[str]] = [None] * len(page_hashes)
+        
+        previous = self.cache.load(previous_hash, self.chunk_key) if previous_hash else None
+        # Solo se reutiliza texto filtrado con los mismos idiomas
+        if (
+            previous
+            and previous["layout"].get("page_hashes")
+            and previous["layout"].get("language_filter") == self.language_filter.key
+        ):
+            previous_manual = ManualText.from_layout(previous["text"], previous["layout"])
+            previous_dropped = set(previous["layout"].get("pages_dropped", []))
+            # Las páginas descartadas se guardaron vacías: se vuelven a extraer
+            previous_positions = {
+                page_hash: position
+                for position, page_hash in enumerate(previous["layout"]["page_hashes"])
+                if position not in previous_dropped
+            }
+            for position, page_hash in enumerate(page_hashes):
+                previous_position = previous_positions.get(page_hash)
+                if previous_position is not None:
+                    pages[position] = page_header(position + 1) + previous_manual.page_body(previous_position)
         else:
-            pdf_path = pdf_source
-            is_temp = False
+            previous = None
+        
+        # Extraer texto (solo de las páginas nuevas o modificadas)
+        changed = [position for position, page in enumerate(pages) if page is None]
+        if changed:
+            extracted = await self.extract_pages_async(pdf_path, changed)
+            for position, page in zip(changed, extracted):
+                pages[position] = page
+        
+        if previous:
+            print(f"♻️ Manual actualizado: {len(changed)}/{len(pages)} páginas modificadas")
+        
+        # Descartar las páginas en idiomas que no se publican antes de trocear
+        filtered, page_languages = await asyncio.to_thread(self.language_filter.filter_pages, pages)
+        dropped_pages = [position for position, (page, kept) in enumerate(zip(pages, filtered)) if kept is not page]
+        dropped = len(dropped_pages)
+        pages = filtered
+        languages: Dict[str, int] = {}
+        for language in page_languages:
+            languages[language or "unknown"] = languages.get(language or "unknown", 0) + 1
+        if dropped:
+            print(f"🌐 {dropped}/{len(pages)} páginas descartadas por idioma ({', '.join(self.language_filter.languages)})")
+        
+        # Dividir en chunks
+        manual = self.split_into_chunks(ManualText.from_pages(pages))
+        manual.languages = languages
+        
+        # Colapsar avisos y bloques repetidos antes de embeber
+        duplicates = await asyncio.to_thread(self.mark_duplicates, manual)
+        if duplicates:
+            print(f"🧹 {duplicates}/{len(manual)} chunks casi duplicados agrupados")
+        
+        # Indexar códigos de error para evitar la búsqueda vectorial
+        error_index = ErrorCodeIndex.build(manual)
+        
+        layout = manual.to_layout()
+        layout["error_codes"] = error_index.to_dict()
+        layout["page_hashes"] = page_hashes
+        layout["languages"] = languages
+        layout["language_filter"] = self.language_filter.key
+        layout["pages_dropped"] = dropped_pages
+        self.cache.store(content_hash, self.chunk_key, manual.text, layout)
+        
+        # Permite reutilizar los embeddings de la versión anterior
+        manual.previous_hash = previous_hash if previous else None
+        
+        result = self._build_result(content_hash, manual, error_index, cached=False)
+        result["pages_reused"] = len(pages) - len(changed)
+        result["pages_dropped"] = dropped
+        return result
+    
+    async def _process_url(self, url: str) -> Dict:
+        """Procesa un PDF remoto revalidando la caché con GET condicional"""
+        record = self.cache.get_url(url)
+        
+        # Registro reciente: no hace falta ni red ni PyMuPDF
+        if record and self.cache.is_fresh(record):
+            cached = self._load_cached(record["sha256"])
+            if cached:
+                return cached
+        
+        headers = {}
+        if record:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        
+        download = await self.fetch_pdf(url, headers=headers)
+        
+        if download["not_modified"]:
+            cached = self._load_cached(record["sha256"])
+            if cached:
+                self.cache.put_url(url, record["sha256"], record.get("etag"), record.get("last_modified"))
+                return cached
+            # La entrada desapareció entre medias: descargar de nuevo sin validadores
+            download = await self.fetch_pdf(url)
         
         try:
-            # Extraer texto
-            text = self.extract_text_from_pdf(pdf_path)
-            
-            # Dividir en chunks
-            chunks = self.split_into_chunks(text)
+            previous_hash = record["sha256"] if record and record["sha256"] != download["sha256"] else None
+            result = await self._process_file(download["path"], download["sha256"], previous_hash)
+            self.cache.put_url(url, download["sha256"], download.get("etag"), download.get("last_modified"))
+            return result
+        finally:
+            # Limpiar archivo temporal descargado
+            if os.path.exists(download["path"]):
+                os.unlink(download["path"])
+    
+    async def process_upload(self, upload) -> Dict:
+        """
+        Procesa un PDF subido leyéndolo en bloques
+        
+        El contenido se vuelca a un archivo temporal a la vez que se calcula
+        su SHA-256, sin cargarlo entero en memoria. Si el manual ya está en
+        la caché no se vuelve a extraer.
+        
+        Args:
+            upload: Objeto con un método async read(size) (ej: UploadFile)
+        
+        Returns:
+            Resultado de process_pdf (incluye content_hash)
+        """
+        hasher = hashlib.sha256()
+        received = 0
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=self.cache.cache_dir)
+        
+        try:
+            with tmp_file:
+                while True:
+                    block = await upload.read(self.download_chunk_size)
+                    if not block:
+                        break
+                    received += len(block)
+                    if received > self.max_download_bytes:
+                        raise Exception(
+                            f"El PDF supera el tamaño máximo permitido "
+                            f"({self.max_download_bytes // (1024 * 1024)} MB)"
+                        )
+                    hasher.update(block)
+                    tmp_file.write(block)
             
-            return {
-                "success": True,
-                "full_text": text,
-                "chunks": chunks,
-                "num_chunks": len(chunks),
-                "text_length": len(text)
-            }
+            return await self._process_file(tmp_file.name, hasher.hexdigest())
         finally:
-            # Limpiar archivo temporal si se descargó
-            if is_temp and os.path.exists(pdf_path):
-                os.unlink(pdf_path)
+            if os.path.exists(tmp_file.name):
+                os.unlink(tmp_file.name)
+    
+    def load_manual(self, content_hash: str) -> Optional[Dict]:
+        """Devuelve un manual ya procesado por su hash de contenido, si está en caché"""
+        return self._load_cached(content_hash)
+    
+    async def process_pdf(self, pdf_source: str) -> Dict:
+        """
+        Procesa PDF completo: descarga, extrae texto y crea chunks
+        
+        Las llamadas simultáneas con la misma fuente esperan a un único
+        procesamiento en lugar de repetirlo.
+        """
+        return await self.flight.do(pdf_source, lambda: self._process_source(pdf_source))
+    
+    async def _process_source(self, pdf_source: str) -> Dict:
+        # Determinar si es URL o archivo local
+        if pdf_source.startswith('http://') or pdf_source.startswith('https://'):
+            return await self._process_url(pdf_source)
+        
+        content_hash = await asyncio.to_thread(ManualCache.hash_file, pdf_source)
+        return await self._process_file(pdf_source, content_hash)
@@ -0,0 +1,311 @@
+"""
+Pipeline por etapas (ingesta, embeddings, generación, publicación)
+"""
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import os
+
+from agents.batch_generator import BatchArticleGenerator
+
+
+# Marca de fin de entrada que cada worker reenvía a la etapa siguiente
+_END = object()
+
+
+class Stage:
+    """
+    Una etapa del pipeline: cola de entrada acotada y N workers.
+    
+    handler(elemento) es un generador async que produce cero o más
+    elementos para la etapa siguiente. Si la cola de la etapa siguiente
+    está llena, el worker espera (backpressure), así que la memoria queda
+    limitada por el tamaño de las colas.
+    
+    Si handler lanza una excepción, on_error(elemento, ya producidos,
+    excepción) devuelve los elementos que sustituyen a los que faltaban,
+    para que nada de lo que llevaba el elemento se pierda.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], AsyncIterator[Any]],
+        workers: int = 1,
+        queue_size: int = 32,
+        on_error: Optional[Callable[[Any, List[Any], Exception], Iterable[Any]]] = None
+    ):
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+    
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+
+class StagePipeline:
+    """
+    Encadena etapas que se ejecutan a la vez, cada una con sus workers.
+    
+    Con trabajo mixto el rendimiento lo marca la etapa más lenta y no la
+    suma de latencias: mientras un manual se extrae, otro se embebe y los
+    artículos de un tercero se generan.
+    """
+    
+    def __init__(self, stages: List[Stage], output_size: int = 32):
+        self.stages = stages
+        self.output_size = output_size
+    
+    async def run(self, items: Iterable[Any]) -> AsyncIterator[Any]:
+        """Alimenta el pipeline con items y produce las salidas de la última etapa"""
+        output: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.output_size))
+        targets = [stage.queue for stage in self.stages[1:]] + [output]
+        remaining = [stage.workers for stage in self.stages]
+        
+        async def feed():
+            for item in items:
+                await self.stages[0].queue.put(item)
+            for _ in range(self.stages[0].workers):
+                await self.stages[0].queue.put(_END)
+        
+        async def worker(position: int):
+            stage = self.stages[position]
+            target = targets[position]
+            while True:
+                item = await stage.queue.get()
+                if item is _END:
+                    break
+                stage.busy += 1
+                emitted = []
+                try:
+                    async for result in stage.handler(item):
+                        emitted.append(result)
+                        await target.put(result)
+                    stage.processed += 1
+                except Exception as e:
+                    stage.failed += 1
+                    print(f"❌ Etapa {stage.name}: {str(e)}")
+                    if stage.on_error:
+                        for result in stage.on_error(item, emitted, e):
+                            await target.put(result)
+                finally:
+                    stage.busy -= 1
+            
+            # El último worker en salir cierra la etapa siguiente
+            remaining[position] -= 1
+            if remaining[position] == 0:
+                next_workers = self.stages[position + 1].workers if position + 1 < len(self.stages) else 1
+                for _ in range(next_workers):
+                    await target.put(_END)
+        
+        tasks = [asyncio.ensure_future(feed())]
+        for position, stage in enumerate(self.stages):
+            tasks.extend(asyncio.ensure_future(worker(position)) for _ in range(stage.workers))
+        
+        try:
+            while True:
+                result = await output.get()
+                if result is _END:
+                    break
+                yield result
+            await asyncio.gather(*tasks)
+        finally:
+            # El consumidor dejó de leer o algo falló: parar todas las etapas
+            for task in tasks:
+                task.cancel()
+    
+    def stats(self) -> Dict:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+def _failed_row(pdf_url: str, model: str, position: int, error: str, detail: str) -> Dict:
+    return {
+        "position": position,
+        "pdf_url": pdf_url,
+        "model": model,
+        "error": error,
+        "article": None,
+        "detail": detail,
+        "failed": True
+    }
+
+
+def build_article_pipeline(
+    batch_generator: BatchArticleGenerator,
+    publish_status: str = "draft",
+    wordpress_client=None,
+    global_index=None
+) -> StagePipeline:
+    """
+    Pipeline de generación masiva sobre grupos (pdf_url, {modelo: [(posición, error)]})
+    
+    Etapas y workers (configurables por entorno):
+    - ingest (PIPELINE_INGEST_WORKERS): descarga, extracción con PyMuPDF
+      en el pool de procesos y chunking
+    - embed (PIPELINE_EMBED_WORKERS): índice vectorial y recuperación en
+      bloque de los errores del manual (retrieve_many)
+    - generate (PIPELINE_GENERATE_WORKERS): llamadas al LLM
+    - publish (PIPELINE_PUBLISH_WORKERS): publicación en WordPress, solo si
+      se pasa wordpress_client
+    
+    Con global_index, la etapa embed añade además al índice global cada
+    manual que la recuperación haya embebido (nunca embebe solo para eso).
+    
+    Cada etapa tiene una cola de PIPELINE_QUEUE_SIZE elementos. La salida
+    es un dict por fila con position, article (o None) y detail.
+    """
+    pdf_processor = batch_generator.pdf_processor
+    article_generator = batch_generator.article_generator
+    queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+    block_size = article_generator.embedding_batch_size
+    
+    async def ingest(group: Tuple[str, Dict[str, List[Tuple[int, str]]]]) -> AsyncIterator[Dict]:
+        pdf_url, by_model = group
+        print(f"📄 Procesando PDF: {pdf_url}")
+        try:
+            pdf_result = await pdf_processor.process_pdf(pdf_url)
+            detail = None if pdf_result["success"] else "No se pudo procesar el PDF"
+        except Exception as e:
+            detail = f"No se pudo procesar el PDF: {str(e)}"
+        
+        if detail:
+            for model, rows in by_model.items():
+                for position, error in rows:
+                    yield _failed_row(pdf_url, model, position, error, detail)
+            return
+        
+        yield {"pdf_url": pdf_url, "pdf_result": pdf_result, "by_model": by_model}
+    
+    async def embed(manual: Dict) -> AsyncIterator[Dict]:
+        if manual.get("failed"):
+            yield manual
+            return
+        
+        pdf_result = manual["pdf_result"]
+        for model, rows in manual["by_model"].items():
+            pending = iter(rows)
+            while True:
+                block = list(islice(pending, block_size))
+                if not block:
+                    break
+                try:
+                    contexts = await article_generator.retrieve_many(
+                        pdf_result["chunks"],
+                        [error for _, error in block],
+                        model,
+                        pdf_result.get("error_index")
+                    )
+                except Exception as e:
+                    # Cada artículo recuperará su propio contexto
+                    print(f"⚠️ Recuperación en bloque fallida: {str(e)}")
+                    contexts = [None] * len(block)
+                
+                for (position, error), retrieved in zip(block, contexts):
+                    yield {
+                        "position": position,
+                        "pdf_url": manual["pdf_url"],
+                        "model": model,
+                        "error": error,
+                        "pdf_result": pdf_result,
+                        "retrieved": retrieved
+                    }
+        
+        if global_index is not None:
+            try:
+                await global_index.add_manual(
+                    pdf_result, list(manual["by_model"]), pdf_url=manual["pdf_url"], embedded_only=True
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudo añadir el manual al índice global: {str(e)}")
+    
+    async def generate(row: Dict) -> AsyncIterator[Dict]:
+        if row.get("failed"):
+            yield row
+            return
+        
+        pdf_result = row.pop("pdf_result")
+        retrieved = row.pop("retrieved")
+        print(f"🤖 Generando artículo {row['position'] + 1}: {row['error']}")
+        try:
+            row["article"] = await batch_generator.generate_single_article(
+                pdf_result, row["model"], row["error"], publish_status, retrieved
+            )
+            row["detail"] = None
+            print(f"✅ Artículo {row['position'] + 1} generado exitosamente")
+        except Exception as e:
+            print(f"❌ Error generando artículo para {row['error']}: {str(e)}")
+            row.update({"article": None, "detail": str(e), "failed": True})
+        yield row
+    
+    async def publish(row: Dict) -> AsyncIterator[Dict]:
+        article = row["article"]
+        if article is not None:
+            try:
+                result = await wordpress_client.publish_article(
+                    title=article["title"],
+                    article_content=article["content"],
+                    affiliate_links=article["affiliate_links"],
+                    error=article["metadata"]["error"],
+                    model=article["metadata"]["model"],
+                    status=article.get("status", "draft")
+                )
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            article["wordpress"] = {
+                key: result.get(key) for key in ("success", "post_id", "url", "error") if key in result
+            }
+        yield row
+    
+    # Ante un fallo inesperado, cada fila pendiente sale como fallida
+    def ingest_failed(group: Tuple, emitted: List[Dict], error: Exception) -> Iterable[Dict]:
+        pdf_url, by_model = group
+        done = {row["position"] for row in emitted if "position" in row}
+        for model, rows in by_model.items():
+            for position, row_error in rows:
+                if position not in done:
+                    yield _failed_row(pdf_url, model, position, row_error, f"Error en la ingesta: {str(error)}")
+    
+    def embed_failed(manual: Dict, emitted: List[Dict], error: Exception) -> Iterable[Dict]:
+        if manual.get("failed"):
+            yield manual
+            return
+        done = {row["position"] for row in emitted}
+        for model, rows in manual["by_model"].items():
+            for position, row_error in rows:
+                if position not in done:
+                    yield _failed_row(manual["pdf_url"], model, position, row_error, f"Error en la recuperación: {str(error)}")
+    
+    def row_failed(row: Dict, emitted: List[Dict], error: Exception) -> Iterable[Dict]:
+        if emitted:
+            return
+        yield _failed_row(row["pdf_url"], row["model"], row["position"], row["error"], str(error))
+    
+    def publish_failed(row: Dict, emitted: List[Dict], error: Exception) -> Iterable[Dict]:
+        if emitted:
+            return
+        if row.get("article") is not None:
+            row["article"]["wordpress"] = {"success": False, "error": str(error)}
+        yield row
+    
+    stages = [
+        Stage("ingest", ingest, int(os.getenv("PIPELINE_INGEST_WORKERS", "2")), queue_size, ingest_failed),
+        Stage("embed", embed, int(os.getenv("PIPELINE_EMBED_WORKERS", "2")), queue_size, embed_failed),
+        Stage("generate", generate, int(os.getenv("PIPELINE_GENERATE_WORKERS", "8")), queue_size, row_failed),
+    ]
+    if wordpress_client is not None:
+        stages.append(Stage(
+            "publish", publish, int(os.getenv("PIPELINE_PUBLISH_WORKERS", "2")), queue_size, publish_failed
+        ))
+    
+    return StagePipeline(stages, output_size=queue_size)
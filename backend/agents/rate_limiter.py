@@ -0,0 +1,113 @@
+"""
+Limitador de peticiones y tokens por minuto para la API de OpenAI
+"""
+from typing import Dict, Optional
+import asyncio
+import os
+import time
+
+
+class TokenBucket:
+    """Cubo de tokens que se rellena de forma continua hasta `capacity` por minuto"""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` disponibles (0 si ya los hay)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+    
+    def consume(self, amount: float):
+        """Descuenta `amount` (negativo para devolver una reserva sobrante)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    Limita las llamadas al LLM a OPENAI_RPM peticiones y OPENAI_TPM tokens
+    por minuto (0 desactiva cada límite).
+    
+    Antes de cada llamada se reserva una estimación de tokens (prompt +
+    salida esperada) y al terminar se corrige con el uso real. Cuando la
+    API responde 429, penalize() detiene a todos los llamantes durante el
+    Retry-After indicado, no solo a la petición que lo recibió.
+    """
+    
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        rpm = rpm if rpm is not None else int(os.getenv("OPENAI_RPM", "500"))
+        tpm = tpm if tpm is not None else int(os.getenv("OPENAI_TPM", "30000"))
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        
+        self._lock: Optional[asyncio.Lock] = None
+        self._paused_until = 0.0
+        
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Estimación aproximada (4 caracteres por token)"""
+        return max(1, len(text) // 4)
+    
+    async def acquire(self, tokens: int = 0):
+        """Espera hasta poder hacer una petición que consuma `tokens`"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        # Un solo llamante espera a la vez: el orden de llegada se respeta
+        async with self._lock:
+            while True:
+                delay = max(0.0, self._paused_until - time.monotonic())
+                if self.requests:
+                    delay = max(delay, self.requests.wait_time(1))
+                if self.tokens:
+                    delay = max(delay, self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                self.waits += 1
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+            
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+    
+    def record_usage(self, estimated: int, actual: Optional[int]):
+        """Corrige la reserva de tokens con el uso real devuelto por la API"""
+        if self.tokens and actual is not None:
+            self.tokens.consume(actual - estimated)
+    
+    def refund(self, estimated: int):
+        """Devuelve la reserva de una llamada que falló sin consumir tokens (429, 5xx, conexión)"""
+        if self.tokens:
+            self.tokens.consume(-estimated)
+    
+    def penalize(self, seconds: float):
+        """Detiene todas las llamadas durante `seconds` (429 con Retry-After)"""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    def stats(self) -> Dict:
+        return {
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            "waits": self.waits,
+            "waited_seconds": round(self.waited_seconds, 2),
+            "rate_limited": self.rate_limited
+        }
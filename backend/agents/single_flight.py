@@ -0,0 +1,57 @@
+"""
+Agrupación de peticiones idénticas en curso (single-flight)
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import copy
+
+
+class SingleFlight:
+    """
+    Ejecuta una sola vez el trabajo de las llamadas concurrentes con la misma clave.
+    
+    La primera llamada lanza la tarea; las que llegan mientras sigue en curso
+    esperan a esa misma tarea en lugar de repetir descarga, embeddings o
+    llamada al LLM. La clave se libera al terminar, así que las llamadas
+    posteriores vuelven a ejecutar (o a leer de caché) normalmente.
+    
+    Cancelar a uno de los que esperan no cancela el trabajo compartido.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta func() o se une a la ejecución en curso con la misma clave
+        
+        Los resultados de tipo dict se devuelven como copia superficial para
+        que cada llamante pueda modificarlos sin afectar a los demás.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        
+        result = await asyncio.shield(task)
+        return copy.copy(result) if isinstance(result, dict) else result
+    
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marcar la excepción como recuperada si ya no queda nadie esperando
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> Dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls)
+        }
@@ -0,0 +1,188 @@
+"""
+Índices FAISS persistidos por manual
+"""
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import faiss
+import json
+import os
+import re
+import threading
+
+from agents.manual_cache import ManualCache
+
+
+class ChunkDocstore(Docstore):
+    """Docstore que materializa los documentos a partir de los chunks del manual"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+    
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            position = int(search)
+            chunk = self.chunks[position]
+        except (ValueError, IndexError):
+            return f"ID {search} not found."
+        metadata = {
+            "chunk": chunk["id"],
+            "page": chunk.get("page"),
+            "start": chunk.get("start"),
+            "end": chunk.get("end")
+        }
+        if hasattr(self.chunks, "duplicates"):
+            # Páginas donde se repite el mismo bloque (avisos, pies...)
+            duplicates = self.chunks.duplicates(position)
+            metadata["duplicate_pages"] = sorted({self.chunks.chunk_pages[i] for i in duplicates})
+        return Document(page_content=chunk["text"], metadata=metadata)
+
+
+def indexed_chunks(chunks) -> List[int]:
+    """Índices de los chunks que tienen fila en el índice vectorial"""
+    if hasattr(chunks, "representatives"):
+        return chunks.representatives()
+    return list(range(len(chunks)))
+
+
+def build_vectorstore(
+    embeddings: Embeddings,
+    index: faiss.Index,
+    chunks,
+    rows: Optional[List[int]] = None
+) -> FAISS:
+    """
+    Crea el vectorstore de LangChain sobre un índice FAISS y los chunks del manual
+    
+    rows indica qué chunk corresponde a cada fila del índice (por defecto,
+    fila i -> chunk i).
+    """
+    if rows is None:
+        rows = list(range(index.ntotal))
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=ChunkDocstore(chunks),
+        index_to_docstore_id={i: str(chunk) for i, chunk in enumerate(rows)}
+    )
+
+
+class VectorIndexStore:
+    """
+    Guarda en disco un índice FAISS por versión de manual.
+    
+    Los índices se identifican por el hash de contenido del manual, los
+    parámetros de chunking y el modelo de embeddings, y se cargan con mmap.
+    Los ya cargados se mantienen en memoria (LRU) para compartirlos entre
+    errores y peticiones del mismo manual.
+    """
+    
+    def __init__(
+        self,
+        manual_cache: ManualCache,
+        embeddings: Embeddings,
+        embedding_model: str,
+        max_loaded: Optional[int] = None
+    ):
+        self.manual_cache = manual_cache
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self.max_loaded = max_loaded if max_loaded is not None else \
+            int(os.getenv("VECTORSTORE_CACHE_SIZE", "16"))
+        self._loaded: "OrderedDict[Tuple[str, str], FAISS]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _name(self, chunk_key: str) -> str:
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", self.embedding_model)
+        return f"faiss_{safe_model}_{chunk_key}"
+    
+    def load_index(self, manual_hash: str, chunk_key: str) -> Optional[Tuple[faiss.Index, List[str]]]:
+        """
+        Carga (con mmap) el índice guardado de un manual
+        
+        Returns:
+            (índice FAISS, claves de chunk por fila) o None
+        """
+        base_path = self.manual_cache.artifact_path(manual_hash, self._name(chunk_key))
+        if base_path is None:
+            return None
+        
+        try:
+            with open(f"{base_path}.json", "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            index = faiss.read_index(f"{base_path}.faiss", faiss.IO_FLAG_MMAP)
+        except (FileNotFoundError, ValueError, RuntimeError):
+            return None
+        
+        if index.ntotal != len(keys):
+            return None
+        return index, keys
+    
+    def has_index(self, manual_hash: str, chunk_key: str) -> bool:
+        """Indica si el manual ya tiene índice en memoria o en disco, sin cargarlo"""
+        with self._lock:
+            if (manual_hash, chunk_key) in self._loaded:
+                return True
+        base_path = self.manual_cache.artifact_path(manual_hash, self._name(chunk_key))
+        return base_path is not None and os.path.exists(f"{base_path}.faiss")
+    
+    def save_index(self, manual_hash: str, chunk_key: str, index: faiss.Index, keys: List[str]):
+        """Persiste el índice de un manual junto a su entrada de caché"""
+        base_path = self.manual_cache.artifact_path(manual_hash, self._name(chunk_key))
+        if base_path is None:
+            return
+        
+        tmp_path = f"{base_path}.faiss.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, f"{base_path}.faiss")
+        with open(f"{base_path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(f"{base_path}.json.tmp", f"{base_path}.json")
+        
+        self.manual_cache.refresh_entry(manual_hash)
+    
+    def load_vectors(self, manual_hash: str, chunk_key: str) -> Dict[str, np.ndarray]:
+        """Vectores guardados de un manual indexados por clave de chunk"""
+        stored = self.load_index(manual_hash, chunk_key)
+        if stored is None:
+            return {}
+        index, keys = stored
+        return dict(zip(keys, index.reconstruct_n(0, index.ntotal)))
+    
+    def get_loaded(self, manual_hash: str, chunk_key: str) -> Optional[FAISS]:
+        """Devuelve el vectorstore del manual si ya está cargado en memoria"""
+        key = (manual_hash, chunk_key)
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+        return None
+    
+    def wrap(
+        self,
+        manual_hash: Optional[str],
+        chunk_key: Optional[str],
+        index: faiss.Index,
+        chunks,
+        rows: Optional[List[int]] = None
+    ) -> FAISS:
+        """Envuelve un índice FAISS en el vectorstore de LangChain y lo memoriza"""
+        vectorstore = build_vectorstore(self.embeddings, index, chunks, rows)
+        
+        if manual_hash:
+            with self._lock:
+                self._loaded[(manual_hash, chunk_key)] = vectorstore
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+        
+        return vectorstore
+    
+    def stats(self) -> Dict:
+        return {
+            "loaded": len(self._loaded),
+            "max_loaded": self.max_loaded
+        }
@@ -0,0 +1,100 @@
+"""
+Generación masiva de artículos desde la línea de comandos
+
+Uso:
+    python bulk_generate.py manifest.jsonl --output ./salida
+    python bulk_generate.py manifest.csv --output ./salida --workers 4
+    python bulk_generate.py manifest.jsonl --pipeline --publish
+    python bulk_generate.py --resume JOB_ID
+
+Cada fila del manifiesto lleva pdf_url, model y error. Los artículos se
+escriben en <output>/articles y el estado de cada fila en <output>/status.jsonl.
+"""
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import os
+import sys
+
+# Añadir path para importar módulos locales
+sys.path.append(os.path.dirname(__file__))
+
+from agents.pdf_processor import PDFProcessor
+from agents.article_generator import ArticleGenerator
+from agents.affiliate_linker import AffiliateLinker
+from agents.batch_generator import BatchArticleGenerator
+from agents.bulk_jobs import BulkJobManager, read_manifest
+from agents.job_store import JobStore
+from agents.wordpress_client import WordPressClient
+from agents.embedding_cache import EmbeddingCache
+from agents.article_cache import ArticleCache
+from agents.global_index import GlobalVectorIndex
+
+
+async def main(args: argparse.Namespace) -> int:
+    job_store = JobStore()
+    if args.resume:
+        job = job_store.get_job(args.resume)
+        if job is None:
+            print(f"❌ Trabajo no encontrado: {args.resume}")
+            return 1
+        # Un trabajo reanudado se ejecuta con los modos con los que se creó
+        args.pipeline = bool(job["params"].get("pipeline"))
+        args.publish = bool(job["params"].get("publish"))
+    
+    pdf_processor = PDFProcessor()
+    article_generator = ArticleGenerator(
+        manual_cache=pdf_processor.cache,
+        embedding_cache=EmbeddingCache(),
+        article_cache=ArticleCache()
+    )
+    batch_generator = BatchArticleGenerator(pdf_processor, article_generator, AffiliateLinker())
+    wordpress_client = WordPressClient() if args.publish else None
+    bulk_jobs = BulkJobManager(
+        job_store,
+        batch_generator,
+        workers=args.workers,
+        wordpress_client=wordpress_client,
+        global_index=GlobalVectorIndex(article_generator, pdf_processor)
+    )
+    
+    try:
+        if args.resume:
+            job_id = args.resume
+        else:
+            rows = read_manifest(args.manifest)
+            job_id = await bulk_jobs.submit(
+                rows, output_dir=args.output, pipeline=args.pipeline, publish=args.publish
+            )
+            print(f"📋 Trabajo {job_id}: {len(rows)} filas")
+        
+        await bulk_jobs.start(job_id)
+    finally:
+        await pdf_processor.close()
+    
+    result = bulk_jobs.get_result(job_id)
+    print(f"\n🎉 {result['completed']}/{result['total']} artículos generados, {result['failed']} fallidos")
+    print(f"📁 Resultados en {result['output_dir']}")
+    return 0 if result["status"] == "completed" else 1
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description="Genera artículos en masa desde un manifiesto JSONL/CSV")
+    parser.add_argument("manifest", nargs="?", help="Manifiesto .jsonl o .csv con pdf_url, model y error")
+    parser.add_argument("--output", help="Directorio de salida (por defecto BULK_OUTPUT_DIR/<job_id>)")
+    parser.add_argument("--workers", type=int, help="Manuales procesados a la vez (BULK_MANUAL_WORKERS)")
+    parser.add_argument("--pipeline", action="store_true", help="Ejecutar por etapas con colas y workers propios")
+    parser.add_argument("--publish", action="store_true", help="Publicar en WordPress (implica --pipeline)")
+    parser.add_argument(
+        "--resume", metavar="JOB_ID",
+        help="Reanuda un trabajo interrumpido (con su --pipeline/--publish originales)"
+    )
+    args = parser.parse_args()
+    
+    if not args.manifest and not args.resume:
+        parser.error("indica un manifiesto o --resume JOB_ID")
+    args.pipeline = args.pipeline or args.publish
+    
+    sys.exit(asyncio.run(main(args)))
@@ -1,8 +1,11 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from dotenv import load_dotenv
+import asyncio
+import json
 import os
 import sys
 
@@ -10,11 +13,17 @@ import sys
 sys.path.append(os.path.dirname(__file__))
 
 from agents.pdf_processor import PDFProcessor
-from agents.article_generator import ArticleGenerator
+from agents.article_generator import ArticleGenerator, get_rate_limiter
 from agents.affiliate_linker import AffiliateLinker
 from agents.wordpress_client import WordPressClient
 from agents.batch_generator import BatchArticleGenerator
+from agents.batch_jobs import BatchJobManager
+from agents.bulk_jobs import BulkJobManager, parse_manifest
+from agents.job_store import JobStore
 from agents.search_console_client import SearchConsoleClient
+from agents.embedding_cache import EmbeddingCache
+from agents.article_cache import ArticleCache
+from agents.global_index import GlobalVectorIndex
 
 # Cargar variables de entorno
 load_dotenv()
@@ -37,11 +46,24 @@ app.add_middleware(
 
 # Inicializar componentes
 pdf_processor = PDFProcessor()
-article_generator = ArticleGenerator()
+embedding_cache = EmbeddingCache()
+article_cache = ArticleCache()
+article_generator = ArticleGenerator(
+    manual_cache=pdf_processor.cache,
+    embedding_cache=embedding_cache,
+    article_cache=article_cache
+)
+# Índice global de todos los manuales (por modelo, marca y tipo de dispositivo)
+global_index = GlobalVectorIndex(article_generator, pdf_processor)
 affiliate_linker = AffiliateLinker()
 batch_generator = BatchArticleGenerator(pdf_processor, article_generator, affiliate_linker)
+job_store = JobStore()
+batch_jobs = BatchJobManager(job_store, batch_generator)
 search_console = SearchConsoleClient()
 
+# Máximo de errores aceptados en un batch
+BATCH_MAX_ERRORS = int(os.getenv("BATCH_MAX_ERRORS", "1000"))
+
 # WordPress client (opcional, solo si está configurado)
 try:
     wordpress_client = WordPressClient()
@@ -50,20 +72,67 @@ except ValueError:
     wordpress_client = None
     wordpress_enabled = False
 
+bulk_jobs = BulkJobManager(
+    job_store, batch_generator, wordpress_client=wordpress_client, global_index=global_index
+)
+
+
+@app.on_event("startup")
+async def startup():
+    """Reanuda los batches que quedaron a medias en la ejecución anterior"""
+    batch_jobs.resume_incomplete()
+    bulk_jobs.resume_incomplete()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Libera recursos compartidos al parar el servidor"""
+    await pdf_processor.close()
+
 
 # Modelos de datos
 class GenerateArticleRequest(BaseModel):
     """Request para generar artículo"""
     pdf_url: Optional[str] = Field(None, description="URL del PDF del manual técnico")
+    manual_hash: Optional[str] = Field(None, description="Hash de un manual ya subido con /upload_pdf")
     error: str = Field(..., description="Error o problema reportado")
     model: str = Field(..., description="Modelo del producto")
+    brand: Optional[str] = Field(None, description="Marca del producto (filtro del índice global)")
+    device_type: Optional[str] = Field(None, description="Tipo de dispositivo (filtro del índice global)")
+    bypass_cache: bool = Field(False, description="Regenerar aunque el artículo esté en caché")
+    
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "pdf_url": "https://example.com/manual.pdf",
+                    "error": "Error E03 - Fallo de comunicación",
+                    "model": "Alexa Echo Dot 4"
+                },
+                {
+                    "error": "Error E03 - Fallo de comunicación",
+                    "model": "Alexa Echo Dot 4"
+                }
+            ]
+        }
+    }
+
+
+class IndexManualRequest(BaseModel):
+    """Request para añadir un manual al índice global"""
+    pdf_url: Optional[str] = Field(None, description="URL del PDF del manual técnico")
+    manual_hash: Optional[str] = Field(None, description="Hash de un manual ya subido con /upload_pdf")
+    models: List[str] = Field(..., min_length=1, description="Modelos que cubre el manual")
+    brand: Optional[str] = Field(None, description="Marca (shard del índice global; sin ella el manual no coincide con filtros por marca)")
+    device_type: Optional[str] = Field(None, description="Tipo de dispositivo")
     
     model_config = {
         "json_schema_extra": {
             "examples": [{
                 "pdf_url": "https://example.com/manual.pdf",
-                "error": "Error E03 - Fallo de comunicación",
-                "model": "Alexa Echo Dot 4"
+                "models": ["Echo Dot 4", "Echo Dot 4 con reloj"],
+                "brand": "Amazon",
+                "device_type": "altavoz"
             }]
         }
     }
@@ -130,7 +199,10 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "/health": "Health check",
-            "/generate_article": "POST - Generar artículo técnico"
+            "/generate_article": "POST - Generar artículo técnico",
+            "/generate_article/stream": "POST - Generar artículo técnico en streaming (SSE)",
+            "/manuals/index": "POST - Añadir un manual al índice global / GET - Estado del índice",
+            "/batch_generate/stream": "POST - Generar artículos en batch en streaming (NDJSON)"
         }
     }
 
@@ -151,39 +223,142 @@ async def health_check():
     }
 
 
+async def load_request_manual(request) -> Dict:
+    """Procesa (o carga de caché) el manual indicado por pdf_url o manual_hash"""
+    if not request.pdf_url and not request.manual_hash:
+        raise HTTPException(
+            status_code=400,
+            detail="Se requiere pdf_url o manual_hash"
+        )
+    
+    if request.pdf_url:
+        pdf_result = await pdf_processor.process_pdf(request.pdf_url)
+    else:
+        pdf_result = pdf_processor.load_manual(request.manual_hash)
+        if pdf_result is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Manual no encontrado. Súbelo de nuevo con /upload_pdf"
+            )
+    
+    if not pdf_result["success"]:
+        raise HTTPException(
+            status_code=400,
+            detail="Error al procesar el PDF"
+        )
+    
+    return pdf_result
+
+
+async def resolve_request_context(request: GenerateArticleRequest) -> Tuple[Dict, Optional[Tuple]]:
+    """
+    Manual y contexto de la petición
+    
+    Con pdf_url o manual_hash se usa ese manual. Sin ellos, el manual y el contexto se buscan
+    en el índice global filtrando por modelo, marca y tipo de dispositivo.
+    
+    Returns:
+        (resultado del manual, contexto ya recuperado o None)
+    """
+    if request.pdf_url or request.manual_hash:
+        pdf_result = await load_request_manual(request)
+        return pdf_result, None
+    
+    found = await global_index.retrieve(
+        article_generator.build_question(request.error, request.model),
+        request.model,
+        brand=request.brand,
+        device_type=request.device_type
+    )
+    if found is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No hay ningún manual indexado para este modelo. Indica pdf_url o manual_hash"
+        )
+    
+    pdf_result, documents = found
+    # Un código de error presente en el manual da mejor contexto que la búsqueda
+    error_index = pdf_result.get("error_index")
+    if error_index is not None and error_index.lookup(request.error):
+        return pdf_result, None
+    return pdf_result, (documents, "global_index")
+
+
+def schedule_global_index(request: GenerateArticleRequest, pdf_result: Dict):
+    """
+    Tras generar el artículo, añade al índice global en segundo plano el
+    manual indicado por pdf_url o manual_hash si la generación lo embebió
+    (los resueltos por el índice de códigos de error no se embeben)
+    """
+    if global_index.auto_add and (request.pdf_url or request.manual_hash):
+        global_index.schedule_manual(
+            pdf_result,
+            [request.model],
+            pdf_url=request.pdf_url,
+            brand=request.brand,
+            device_type=request.device_type
+        )
+
+
+def build_article_response(
+    request: GenerateArticleRequest,
+    pdf_result: Dict,
+    article_result: Dict,
+    affiliate_products: List[Dict]
+) -> ArticleResponse:
+    """Construye la respuesta final a partir del artículo ya parseado"""
+    article_content = article_result["content"]
+    return ArticleResponse(
+        success=True,
+        title=article_content.get("title", "Artículo Técnico"),
+        content={
+            "introduction": article_content.get("introduction", ""),
+            "error_meaning": article_content.get("error_meaning", ""),
+            "diagnosis": article_content.get("diagnosis", ""),
+            "solution_steps": article_content.get("solution_steps", []),
+            "common_failures": article_content.get("common_failures", []),
+        },
+        affiliate_links=affiliate_products,
+        metadata={
+            "model": request.model,
+            "error": request.error,
+            "manual_hash": pdf_result["content_hash"],
+            "pdf_chunks": pdf_result["num_chunks"],
+            "text_length": pdf_result["text_length"],
+            "retrieval": article_result.get("retrieval"),
+            "cached": article_result.get("cached", False)
+        }
+    )
+
+
 @app.post("/generate_article", response_model=ArticleResponse)
 async def generate_article(request: GenerateArticleRequest):
     """
     Genera un artículo técnico completo basado en un manual PDF y un error reportado.
     
     - **pdf_url**: URL del manual técnico en PDF
+    - **manual_hash**: Alternativa a pdf_url para manuales ya subidos
     - **error**: Descripción del error o problema
     - **model**: Modelo del producto
+    - **brand**, **device_type**: Filtros opcionales del índice global
+    
+    Sin pdf_url ni manual_hash, el manual y el contexto se buscan en el
+    índice global de manuales ya ingeridos.
     
     Returns un artículo con título, contenido estructurado y enlaces de afiliado.
     """
     try:
-        # 1. Validar que hay PDF
-        if not request.pdf_url:
-            raise HTTPException(
-                status_code=400,
-                detail="Se requiere pdf_url para generar el artículo"
-            )
-        
-        # 2. Procesar PDF
-        pdf_result = await pdf_processor.process_pdf(request.pdf_url)
-        
-        if not pdf_result["success"]:
-            raise HTTPException(
-                status_code=400,
-                detail="Error al procesar el PDF"
-            )
+        # 1-2. Procesar el PDF o buscar el manual en el índice global
+        pdf_result, retrieved = await resolve_request_context(request)
         
         # 3. Generar artículo con LangChain RAG
         article_result = await article_generator.generate_article(
             chunks=pdf_result["chunks"],
             error=request.error,
-            model=request.model
+            model=request.model,
+            error_index=pdf_result.get("error_index"),
+            use_cache=not request.bypass_cache,
+            retrieved=retrieved
         )
         
         if not article_result["success"]:
@@ -192,36 +367,14 @@ async def generate_article(request: GenerateArticleRequest):
                 detail="Error al generar el artículo"
             )
         
-        # 4. Parsear respuesta del LLM
-        article_content = article_generator.parse_llm_response(
-            article_result["result"]
-        )
+        schedule_global_index(request, pdf_result)
         
-        # 5. Procesar productos y crear enlaces de afiliado
-        recommended_products = article_content.get("recommended_products", [])
+        # 4. Procesar productos y crear enlaces de afiliado
+        recommended_products = article_result["content"].get("recommended_products", [])
         affiliate_products = affiliate_linker.process_products(recommended_products)
         
-        # 6. Construir respuesta
-        response = ArticleResponse(
-            success=True,
-            title=article_content.get("title", "Artículo Técnico"),
-            content={
-                "introduction": article_content.get("introduction", ""),
-                "error_meaning": article_content.get("error_meaning", ""),
-                "diagnosis": article_content.get("diagnosis", ""),
-                "solution_steps": article_content.get("solution_steps", []),
-                "common_failures": article_content.get("common_failures", []),
-            },
-            affiliate_links=affiliate_products,
-            metadata={
-                "model": request.model,
-                "error": request.error,
-                "pdf_chunks": pdf_result["num_chunks"],
-                "text_length": pdf_result["text_length"]
-            }
-        )
-        
-        return response
+        # 5. Construir respuesta
+        return build_article_response(request, pdf_result, article_result, affiliate_products)
         
     except HTTPException:
         raise
@@ -232,30 +385,103 @@ async def generate_article(request: GenerateArticleRequest):
         )
 
 
+def sse_event(event: str, data: Dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/generate_article/stream")
+async def generate_article_stream(request: GenerateArticleRequest):
+    """
+    Igual que /generate_article, pero envía el artículo por Server-Sent Events
+    a medida que el LLM lo genera.
+    
+    Eventos:
+    - **status**: fase actual (processing_pdf, retrieving, generating)
+    - **context**: método de recuperación y páginas del manual usadas
+    - **token**: fragmento de texto del LLM
+    - **section**: campo del artículo completo (title, introduction, solution_steps...)
+    - **product**: producto recomendado con su enlace de afiliado ya resuelto
+    - **done**: respuesta completa, con el mismo formato que /generate_article
+    - **error**: error durante la generación
+    """
+    async def events():
+        try:
+            yield sse_event("status", {"stage": "processing_pdf"})
+            pdf_result, retrieved = await resolve_request_context(request)
+            
+            yield sse_event("status", {"stage": "retrieving"})
+            affiliate_products = []
+            article_result = None
+            
+            async for event, data in article_generator.stream_article(
+                chunks=pdf_result["chunks"],
+                error=request.error,
+                model=request.model,
+                error_index=pdf_result.get("error_index"),
+                use_cache=not request.bypass_cache,
+                retrieved=retrieved
+            ):
+                if event == "context":
+                    yield sse_event("context", data)
+                    yield sse_event("status", {"stage": "generating"})
+                elif event == "token":
+                    yield sse_event("token", data)
+                elif event == "section":
+                    yield sse_event("section", data)
+                elif event == "item" and data["key"] == "recommended_products":
+                    # Resolver el enlace de afiliado en cuanto llega el producto
+                    if isinstance(data["value"], dict):
+                        product = affiliate_linker.process_products([data["value"]])[0]
+                        affiliate_products.append(product)
+                        yield sse_event("product", product)
+                elif event == "result":
+                    article_result = data
+            
+            schedule_global_index(request, pdf_result)
+            
+            if not affiliate_products:
+                # La respuesta no se pudo leer por secciones: usar la parseada
+                affiliate_products = affiliate_linker.process_products(
+                    article_result["content"].get("recommended_products", [])
+                )
+            
+            response = build_article_response(request, pdf_result, article_result, affiliate_products)
+            yield sse_event("done", response.model_dump())
+            
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            yield sse_event("error", {"status_code": 500, "detail": f"Error interno: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/upload_pdf")
 async def upload_pdf(file: UploadFile = File(...)):
     """
     Endpoint para subir PDF directamente (alternativa a URL)
+    
+    Devuelve el content_hash del manual, que puede usarse después como
+    manual_hash en /generate_article sin volver a subir el archivo.
     """
     try:
-        # Guardar archivo temporal
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        # Procesar PDF
-        result = await pdf_processor.process_pdf(tmp_path)
-        
-        # Limpiar archivo temporal
-        os.unlink(tmp_path)
+        # Procesar PDF leyendo la subida en bloques
+        result = await pdf_processor.process_upload(file)
         
         return {
             "success": True,
             "filename": file.filename,
+            "content_hash": result["content_hash"],
+            "cached": result["cached"],
             "num_chunks": result["num_chunks"],
-            "text_length": result["text_length"]
+            "num_indexed_chunks": result["num_indexed_chunks"],
+            "text_length": result["text_length"],
+            "languages": result.get("languages", {})
         }
         
     except Exception as e:
@@ -310,42 +536,53 @@ async def publish_to_wordpress(request: PublishToWordPressRequest):
         )
 
 
+def resolve_batch_errors(request: BatchGenerateRequest) -> List[str]:
+    """Errores a procesar en un batch (los de la petición o los comunes del tipo)"""
+    errors_to_process = request.errors
+    
+    if request.use_common_errors and request.device_type:
+        common_errors = batch_generator.get_common_errors(request.device_type)
+        if common_errors:
+            errors_to_process = common_errors
+    
+    if not errors_to_process:
+        raise HTTPException(
+            status_code=400,
+            detail="No se especificaron errores para procesar"
+        )
+    
+    # Limitar el tamaño del batch por seguridad (BATCH_MAX_ERRORS)
+    if len(errors_to_process) > BATCH_MAX_ERRORS:
+        errors_to_process = errors_to_process[:BATCH_MAX_ERRORS]
+    
+    return errors_to_process
+
+
 @app.post("/batch_generate")
 async def batch_generate(request: BatchGenerateRequest):
     """
     Genera múltiples artículos para el mismo dispositivo
     
-    Permite generar 5-10 artículos automáticamente para diferentes errores.
+    Permite generar hasta BATCH_MAX_ERRORS artículos para diferentes errores.
     Ideal para crear contenido en batch para un dispositivo específico.
+    Para batches grandes es preferible /batch_generate/stream, que no
+    acumula los artículos en una sola respuesta.
+    
+    Internamente se ejecuta como un trabajo de /batch_jobs: si el servidor se
+    reinicia, el batch continúa desde el último artículo completado.
     """
     try:
-        # Usar errores comunes si se especifica
-        errors_to_process = request.errors
-        
-        if request.use_common_errors and request.device_type:
-            common_errors = batch_generator.get_common_errors(request.device_type)
-            if common_errors:
-                errors_to_process = common_errors[:10]  # Máximo 10
-        
-        if not errors_to_process:
-            raise HTTPException(
-                status_code=400,
-                detail="No se especificaron errores para procesar"
-            )
-        
-        # Limitar a 10 artículos por seguridad
-        if len(errors_to_process) > 10:
-            errors_to_process = errors_to_process[:10]
+        errors_to_process = resolve_batch_errors(request)
         
         # Generar artículos
-        result = await batch_generator.generate_multiple_articles(
+        job_id = await batch_jobs.submit(
             pdf_url=request.pdf_url,
             model=request.model,
             errors=errors_to_process,
             publish_status="draft"
         )
         
-        return result
+        return await batch_jobs.wait(job_id)
         
     except HTTPException:
         raise
@@ -356,6 +593,170 @@ async def batch_generate(request: BatchGenerateRequest):
         )
 
 
+def ndjson_line(event: str, data: Dict) -> str:
+    """Formatea un evento como una línea de NDJSON"""
+    return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+
+
+@app.post("/batch_generate/stream")
+async def batch_generate_stream(request: BatchGenerateRequest):
+    """
+    Igual que /batch_generate, pero devuelve cada artículo como una línea de
+    NDJSON (application/x-ndjson) en cuanto termina de generarse.
+    
+    El servidor no guarda los artículos ya enviados, así que la memoria no
+    crece con el número de errores. Las líneas llegan en orden de
+    finalización; el campo index indica la posición del error en la petición.
+    
+    Líneas (campo **event**):
+    - **status**: fase actual (processing_pdf, generating)
+    - **item**: artículo terminado (status done/failed, article o detail)
+    - **done**: contadores finales (total, successful, failed)
+    - **error**: el batch falló antes de terminar
+    """
+    errors_to_process = resolve_batch_errors(request)
+    
+    async def lines():
+        yield ndjson_line("status", {"stage": "queued", "total": len(errors_to_process)})
+        try:
+            async for event, data in batch_generator.stream_multiple_articles(
+                pdf_url=request.pdf_url,
+                model=request.model,
+                errors=errors_to_process,
+                publish_status="draft"
+            ):
+                yield ndjson_line(event, data)
+        except Exception as e:
+            yield ndjson_line("error", {"detail": f"Error en generación batch: {str(e)}"})
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/batch_jobs", status_code=202)
+async def create_batch_job(request: BatchGenerateRequest):
+    """
+    Lanza un batch en segundo plano y devuelve su job_id inmediatamente
+    
+    El progreso se consulta con GET /batch_jobs/{job_id} o se sigue por
+    Server-Sent Events en GET /batch_jobs/{job_id}/events.
+    """
+    errors_to_process = resolve_batch_errors(request)
+    job_id = await batch_jobs.submit(
+        pdf_url=request.pdf_url,
+        model=request.model,
+        errors=errors_to_process,
+        publish_status="draft"
+    )
+    return batch_jobs.get_result(job_id, include_articles=False)
+
+
+@app.get("/batch_jobs/{job_id}")
+async def get_batch_job(job_id: str, include_articles: bool = True):
+    """Estado y progreso de un batch (con los artículos ya generados)"""
+    result = batch_jobs.get_result(job_id, include_articles=include_articles)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return result
+
+
+@app.get("/batch_jobs/{job_id}/events")
+async def batch_job_events(job_id: str):
+    """
+    Progreso de un batch por Server-Sent Events
+    
+    Eventos: **status** (estado actual), **item** (artículo terminado, con
+    el artículo o el detalle del fallo) y **done** (resumen final).
+    """
+    if batch_jobs.get_result(job_id, include_articles=False) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    async def events():
+        async for event, data in batch_jobs.subscribe(job_id):
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/bulk_jobs", status_code=202)
+async def create_bulk_job(
+    manifest: UploadFile = File(...),
+    pipeline: bool = Form(False),
+    publish: bool = Form(False)
+):
+    """
+    Lanza la generación masiva de un manifiesto JSONL o CSV
+    
+    Cada fila lleva pdf_url, model y error. Las filas se agrupan por manual,
+    así que cada manual se descarga, extrae e indexa una sola vez. Los
+    artículos se escriben en BULK_OUTPUT_DIR/{job_id}/articles y el estado
+    de cada fila en status.jsonl al terminar.
+    
+    - **pipeline**: ejecutar por etapas (ingesta, embeddings, generación,
+      publicación), cada una con su cola y sus workers (PIPELINE_*)
+    - **publish**: publicar cada artículo en WordPress (requiere pipeline)
+    """
+    try:
+        fmt = "csv" if (manifest.filename or "").lower().endswith(".csv") else None
+        rows = parse_manifest((await manifest.read()).decode("utf-8-sig"), fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Manifiesto no válido: {str(e)}")
+    
+    try:
+        job_id = await bulk_jobs.submit(rows, pipeline=pipeline, publish=publish)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return bulk_jobs.get_result(job_id)
+
+
+@app.get("/bulk_jobs/{job_id}")
+async def get_bulk_job(job_id: str, include_rows: bool = False):
+    """
+    Progreso de un trabajo masivo (con el estado de cada fila si se pide)
+    
+    En modo pipeline incluye **stages**: workers ocupados, cola y elementos
+    procesados por etapa, para localizar el cuello de botella.
+    """
+    result = bulk_jobs.get_result(job_id, include_rows=include_rows)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return result
+
+
+@app.post("/manuals/index")
+async def index_manual(request: IndexManualRequest):
+    """
+    Añade un manual al índice global con sus modelos, marca y tipo de dispositivo
+    
+    Después, /generate_article puede usarlo indicando solo model y error.
+    Si el manual ya estaba indexado, solo se le asocian los modelos nuevos.
+    """
+    pdf_result = await load_request_manual(request)
+    try:
+        return await global_index.add_manual(
+            pdf_result,
+            request.models,
+            pdf_url=request.pdf_url,
+            brand=request.brand,
+            device_type=request.device_type
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al indexar el manual: {str(e)}")
+
+
+@app.get("/manuals/index")
+async def global_index_stats():
+    """Manuales y chunks del índice global por shard (segmento de una marca)"""
+    return await asyncio.to_thread(global_index.stats)
+
+
 @app.post("/batch_publish")
 async def batch_publish(articles: List[Dict]):
     """
@@ -424,6 +825,33 @@ async def get_page_metrics(url: str, days: int = 30):
         )
 
 
+@app.get("/metrics/runtime")
+async def get_runtime_metrics():
+    """
+    Métricas internas del backend
+    
+    - Caché de manuales (entradas, tamaño)
+    - Caché de embeddings (hits/misses = llamadas a OpenAI ahorradas)
+    - Caché de artículos generados
+    - Índices vectoriales cargados en memoria
+    - Limitador de peticiones/tokens por minuto de OpenAI
+    - Peticiones idénticas agrupadas (single-flight): executed = trabajo
+      realizado, coalesced = llamadas que esperaron a una ya en curso
+    """
+    return {
+        "manual_cache": pdf_processor.cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "article_cache": article_cache.stats(),
+        "vector_indexes": article_generator.vector_store.stats(),
+        "openai_rate_limiter": get_rate_limiter().stats(),
+        "single_flight": {
+            "process_pdf": pdf_processor.flight.stats(),
+            "vectorstore": article_generator.vectorstore_flight.stats(),
+            "generate_article": article_generator.article_flight.stats()
+        }
+    }
+
+
 @app.get("/device_types")
 async def get_device_types():
     """
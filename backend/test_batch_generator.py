@@ -0,0 +1,63 @@
+"""
+Pruebas de la ventana deslizante de generación de artículos
+"""
+import asyncio
+
+from agents.batch_generator import BatchArticleGenerator
+
+
+class SlowRetrievalGenerator:
+    """Recuperación en bloque que queda bloqueada a partir del segundo bloque"""
+    embedding_batch_size = 2
+    
+    def __init__(self):
+        self.blocks = []
+        self.release = asyncio.Event()
+    
+    async def retrieve_many(self, chunks, errors, model, error_index):
+        self.blocks.append(list(errors))
+        if len(self.blocks) > 1:
+            await self.release.wait()
+        return [None] * len(errors)
+
+
+class FakeBatchGenerator(BatchArticleGenerator):
+    def __init__(self):
+        self.article_generator = SlowRetrievalGenerator()
+        self.concurrency = 2
+    
+    async def generate_single_article(self, pdf_result, model, error, publish_status, retrieved):
+        await asyncio.sleep(0)
+        return {"title": error}
+
+
+def test_finished_articles_do_not_wait_for_the_next_block():
+    """Los artículos terminados salen aunque la recuperación del bloque siguiente siga en curso"""
+    print("🔍 Probando la recuperación del bloque siguiente en segundo plano...")
+    errors = [f"E{i}" for i in range(5)]
+    
+    async def run():
+        generator = FakeBatchGenerator()
+        articles = generator.iter_articles({"chunks": []}, "Echo", iter(errors))
+        results = []
+        async for index, error, article, detail in articles:
+            results.append(index)
+            if len(results) == 2:
+                # El primer bloque ya salió y el segundo sigue bloqueado
+                assert len(generator.article_generator.blocks) == 2
+                generator.article_generator.release.set()
+        return generator, results
+    
+    generator, results = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert sorted(results) == list(range(5))
+    assert generator.article_generator.blocks == [["E0", "E1"], ["E2", "E3"], ["E4"]]
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DE LA GENERACIÓN EN VENTANA DESLIZANTE")
+    print("=" * 50)
+    print()
+    
+    test_finished_articles_do_not_wait_for_the_next_block()
@@ -0,0 +1,104 @@
+"""
+Pruebas del chunking por tokens que respeta la estructura del manual
+"""
+from agents import chunker as chunker_module
+from agents.chunker import StructuredChunker
+from agents.manual_text import ManualText
+
+
+class MissingEncoding:
+    """Simula tiktoken sin red: el encoding no se puede descargar"""
+    
+    @staticmethod
+    def get_encoding(name):
+        raise OSError("sin red")
+
+
+def char_chunker(max_tokens: int = 50, overlap_tokens: int = 15) -> StructuredChunker:
+    """Chunker que cuenta 4 caracteres por token, igual con o sin red"""
+    chunker = StructuredChunker(max_tokens, overlap_tokens)
+    chunker._encoding_loaded = True
+    return chunker
+
+
+def chunks_of(chunker: StructuredChunker, manual: ManualText):
+    return [(manual.text[start:end], start, end, page) for start, end, page in chunker.iter_chunks(manual)]
+
+
+def paragraph(index: int) -> str:
+    # 40 caracteres = 10 tokens
+    return f"Paso {index:02d}: compruebe el cable y pulse OK.\n"
+
+
+def test_chunks_never_cross_pages():
+    """Ningún chunk empieza en una página y termina en otra"""
+    print("🔍 Probando cortes en los saltos de página...")
+    chunker = char_chunker()
+    pages = ["\n".join(paragraph(i) for i in range(page * 10, page * 10 + 7)) for page in range(3)]
+    manual = ManualText.from_pages(pages)
+    
+    chunks = chunks_of(chunker, manual)
+    assert {page for _, _, _, page in chunks} == set(manual.page_numbers)
+    for text, start, end, page in chunks:
+        span = manual.page_span(manual.page_numbers.index(page))
+        assert span.start <= start < end <= span.stop
+        assert "--- Página" not in text
+    print("✅ OK")
+
+
+def test_headings_start_new_chunks_without_overlap():
+    """Un título abre chunk nuevo y ese chunk no arrastra solape del anterior"""
+    print("🔍 Probando títulos como límites de chunk...")
+    chunker = char_chunker()
+    page = "\n".join(paragraph(i) for i in range(3)) + "\n4. SOLUCIÓN DE PROBLEMAS\n" + paragraph(3)
+    manual = ManualText.from_pages([page])
+    
+    texts = [text for text, _, _, _ in chunks_of(chunker, manual)]
+    assert len(texts) == 2
+    assert "SOLUCIÓN" not in texts[0]
+    assert texts[1].startswith("4. SOLUCIÓN DE PROBLEMAS")
+    assert paragraph(2).strip() not in texts[1]
+    print("✅ OK")
+
+
+def test_overlap_uses_whole_units():
+    """El solape repite párrafos completos del final del chunk anterior"""
+    print("🔍 Probando el solape entre chunks...")
+    chunker = char_chunker()
+    units = [paragraph(i) for i in range(12)]
+    manual = ManualText.from_pages(["\n".join(units)])
+    
+    chunks = chunks_of(chunker, manual)
+    assert len(chunks) > 2
+    for (_, _, previous_end, _), (text, start, _, _) in zip(chunks, chunks[1:]):
+        assert start < previous_end, "los chunks consecutivos deben solaparse"
+        # El solape empieza al principio de un párrafo y no supera CHUNK_OVERLAP_TOKENS
+        assert text.startswith("Paso ")
+        assert chunker.count_tokens([manual.text[start:previous_end]])[0] <= chunker.overlap_tokens
+    print("✅ OK")
+
+
+def test_key_falls_back_to_characters():
+    """Sin encoding de tiktoken se cuentan caracteres y la clave lo refleja"""
+    print("🔍 Probando el conteo sin encoding de tiktoken...")
+    original = chunker_module.tiktoken
+    chunker_module.tiktoken = MissingEncoding
+    try:
+        chunker = StructuredChunker(max_tokens=100, overlap_tokens=10, encoding="cl100k_base")
+        assert chunker.key == "tok100_10_chars"
+        assert chunker.count_tokens(["abcd", "abcde", ""]) == [1, 2, 0]
+    finally:
+        chunker_module.tiktoken = original
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DEL CHUNKING POR TOKENS")
+    print("=" * 50)
+    print()
+    
+    test_chunks_never_cross_pages()
+    test_headings_start_new_chunks_without_overlap()
+    test_overlap_uses_whole_units()
+    test_key_falls_back_to_characters()
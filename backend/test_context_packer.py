@@ -0,0 +1,101 @@
+"""
+Pruebas del empaquetado del contexto del prompt
+"""
+from langchain_core.documents import Document
+
+from agents.context_packer import ContextPacker
+from agents.manual_text import ManualText
+
+
+SECTIONS = [
+    "El anillo naranja indica que el dispositivo está en modo de configuración.",
+    "Si el anillo parpadea en rojo, el micrófono está desactivado.",
+    "Para volver a conectar la red abra la aplicación y pulse Dispositivos.",
+    "El error E03 aparece cuando el router no responde a tiempo.",
+]
+
+
+def build_manual():
+    """Manual de una página con los tramos de SECTIONS seguidos"""
+    manual = ManualText.from_pages([" ".join(SECTIONS)])
+    offsets = []
+    for section in SECTIONS:
+        start = manual.text.index(section)
+        offsets.append((start, start + len(section)))
+    return manual, offsets
+
+
+def document(manual: ManualText, start: int, end: int) -> Document:
+    return Document(
+        page_content=manual.text[start:end],
+        metadata={"start": start, "end": end, "page": manual.page_numbers[0]}
+    )
+
+
+def test_overlapping_results_are_merged():
+    """Resultados que se solapan en el manual salen como un solo tramo sin repetir texto"""
+    print("🔍 Probando la fusión de tramos...")
+    manual, offsets = build_manual()
+    (a, _), (b, b_end), (c, c_end), (d, d_end) = offsets
+    documents = [
+        document(manual, b, c_end),          # tramos 1-2
+        document(manual, a, b_end),          # tramos 0-1, solapa con el anterior
+        document(manual, d, d_end),          # tramo 3, separado por un espacio
+    ]
+    
+    context, packed = ContextPacker(max_tokens=0).pack(documents, manual)
+    assert len(packed) == 2
+    assert packed[0].page_content == manual.text[a:c_end]
+    assert packed[0].metadata["start"] == a and packed[0].metadata["end"] == c_end
+    for section in SECTIONS:
+        assert context.count(section) == 1
+    print("✅ OK")
+
+
+def test_duplicate_text_is_dropped():
+    """Un resultado contenido en otro ya elegido no se repite"""
+    print("🔍 Probando la eliminación de duplicados...")
+    manual, offsets = build_manual()
+    (a, a_end), _, _, (d, d_end) = offsets
+    documents = [
+        document(manual, d, d_end),
+        # Sin posición en el manual (ej: del índice global) y con otros espacios
+        Document(page_content="  El error  E03 aparece cuando\nel router no responde a tiempo.  "),
+        Document(page_content=SECTIONS[1]),
+        document(manual, a, a_end),
+    ]
+    
+    context, packed = ContextPacker(max_tokens=0).pack(documents, manual)
+    assert [doc.page_content for doc in packed] == [SECTIONS[0], SECTIONS[3], SECTIONS[1]]
+    assert context.count("E03") == 1
+    print("✅ OK")
+
+
+def test_budget_keeps_the_most_relevant_spans():
+    """Con presupuesto se añaden tramos por relevancia y el contexto queda en orden del manual"""
+    print("🔍 Probando el presupuesto de tokens...")
+    manual, offsets = build_manual()
+    documents = [document(manual, *offsets[i]) for i in (3, 0, 2)]
+    tokens = [len(doc.page_content) // 4 for doc in documents]
+    
+    packer = ContextPacker(max_tokens=tokens[0] + tokens[1])
+    context, packed = packer.pack(documents, manual)
+    assert [doc.metadata["start"] for doc in packed] == [offsets[0][0], offsets[3][0]]
+    assert SECTIONS[2] not in context
+    
+    # Si ni el mejor tramo cabe, se recorta al presupuesto
+    context, packed = ContextPacker(max_tokens=5).pack(documents, manual)
+    assert len(packed) == 1 and len(context) <= 20
+    assert SECTIONS[3].startswith(context)
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DEL EMPAQUETADO DE CONTEXTO")
+    print("=" * 50)
+    print()
+    
+    test_overlapping_results_are_merged()
+    test_duplicate_text_is_dropped()
+    test_budget_keeps_the_most_relevant_spans()
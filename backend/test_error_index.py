@@ -0,0 +1,59 @@
+"""
+Pruebas del índice de códigos de error
+"""
+from agents.error_index import ErrorCodeIndex, extract_error_codes
+from agents.manual_text import ManualText
+
+
+def test_error_codes_are_normalized():
+    """'E-3', 'E3' y 'E03' son el mismo código"""
+    print("🔍 Probando la normalización de códigos...")
+    assert extract_error_codes("Error E-3, luego E3 y E03; después R01 y T6") == ["E03", "R01", "T06"]
+    assert extract_error_codes("Fallo F-104 en la placa") == ["F104"]
+    print("✅ OK")
+
+
+def test_specifications_are_not_error_codes():
+    """Identificadores de especificaciones (USB3, IP65, H264...) no se indexan"""
+    print("🔍 Probando especificaciones con forma de código...")
+    text = (
+        "Puerto USB3 y USB2, resistencia IP65 e IPX4, vídeo H264/H265, conector RJ45 "
+        "con cable CAT6, audio MP3, memoria DDR4, pila CR2032 o LR6, norma ISO9001"
+    )
+    assert extract_error_codes(text) == []
+    assert extract_error_codes(f"{text}. Si aparece E05, reinicie") == ["E05"]
+    print("✅ OK")
+
+
+def test_index_ignores_specifications():
+    """El índice solo apunta a los chunks con códigos de error reales"""
+    print("🔍 Probando el índice sobre un manual...")
+    manual = ManualText.from_pages([
+        "Especificaciones: USB3, IP65, H264.\n",
+        "Tabla de errores\nE01: sin conexión\nE-2: batería baja\n",
+    ])
+    for position in range(manual.num_pages):
+        span = manual.page_span(position)
+        manual.add_chunk(span.start, span.stop, manual.page_numbers[position])
+    
+    index = ErrorCodeIndex.build(manual)
+    assert sorted(index.postings) == ["E01", "E02"]
+    assert index.pages["E02"] == [manual.page_numbers[1]]
+    assert index.lookup("Error E-1 en la pantalla") == [1]
+    assert index.lookup("USB3 no funciona") == []
+    
+    restored = ErrorCodeIndex.from_dict(index.to_dict())
+    assert restored.postings == index.postings
+    assert index.to_dict()["version"] == ErrorCodeIndex.VERSION
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DEL ÍNDICE DE CÓDIGOS DE ERROR")
+    print("=" * 50)
+    print()
+    
+    test_error_codes_are_normalized()
+    test_specifications_are_not_error_codes()
+    test_index_ignores_specifications()
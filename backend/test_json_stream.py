@@ -0,0 +1,93 @@
+"""
+Pruebas del parser incremental que emite las secciones del artículo en streaming
+"""
+import json
+
+from agents.json_stream import JSONSectionStream
+
+
+ARTICLE = {
+    "title": "Error \"E03\" en el Echo Dot [4ª gen.]",
+    "introduction": "Si ve el aviso \"Fallo, reinicie]\", siga estos pasos: {a}, [b].",
+    "steps": ["Pulse \"Acción\", 5 s", "Desenchufe ] y espere, 10 s", "Ruta C:\\config\\"],
+    "recommended_products": [
+        {"name": "Cable [USB-C], 1 m", "query": "cable \"usb c\""},
+        {"name": "Enchufe, inteligente", "query": "enchufe}"}
+    ],
+    "conclusion": "Listo."
+}
+
+
+def feed_in_pieces(text: str, size: int):
+    """Alimenta el parser con trozos de `size` caracteres y junta los eventos"""
+    stream = JSONSectionStream()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(stream.feed(text[start:start + size]))
+    return stream, events
+
+
+def test_sections_with_split_tokens():
+    """Las secciones salen completas aunque las claves y valores lleguen partidos"""
+    print("🔍 Probando secciones con tokens partidos...")
+    text = "```json\n" + json.dumps(ARTICLE, ensure_ascii=False, indent=2) + "\n```"
+    
+    for size in (1, 2, 3, 7, 64, len(text)):
+        stream, events = feed_in_pieces(text, size)
+        sections = {key: value for kind, key, value in events if kind == "section"}
+        assert sections == ARTICLE, f"trozos de {size}"
+        assert stream.done
+    print("✅ OK")
+
+
+def test_escaped_quotes_and_delimiters_inside_strings():
+    """Las comillas escapadas y los `]`, `,`, `}` dentro de cadenas no cierran nada"""
+    print("🔍 Probando comillas escapadas y delimitadores en cadenas...")
+    text = json.dumps(ARTICLE, ensure_ascii=False)
+    stream, events = feed_in_pieces(text, 1)
+    
+    sections = [(key, value) for kind, key, value in events if kind == "section"]
+    assert sections == list(ARTICLE.items())
+    print("✅ OK")
+
+
+def test_list_items_before_list_closes():
+    """Cada elemento de una lista se emite antes de que se cierre la lista"""
+    print("🔍 Probando elementos de listas...")
+    text = json.dumps(ARTICLE, ensure_ascii=False)
+    stream, events = feed_in_pieces(text, 5)
+    
+    steps = [value for kind, key, value in events if kind == "item" and key == "steps"]
+    products = [value for kind, key, value in events if kind == "item" and key == "recommended_products"]
+    assert steps == ARTICLE["steps"]
+    assert products == ARTICLE["recommended_products"]
+    
+    kinds = [(kind, key) for kind, key, _ in events if key == "steps"]
+    assert kinds[-1] == ("section", "steps")
+    assert kinds.count(("item", "steps")) == len(ARTICLE["steps"])
+    print("✅ OK")
+
+
+def test_incomplete_json_emits_only_closed_sections():
+    """Con el JSON cortado solo se emiten las secciones ya cerradas"""
+    print("🔍 Probando JSON incompleto...")
+    text = json.dumps(ARTICLE, ensure_ascii=False)
+    cut = text.index('"conclusion"')
+    stream, events = feed_in_pieces(text[:cut + 20], 4)
+    
+    sections = [key for kind, key, _ in events if kind == "section"]
+    assert sections == ["title", "introduction", "steps", "recommended_products"]
+    assert not stream.done
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DEL STREAMING DE SECCIONES JSON")
+    print("=" * 50)
+    print()
+    
+    test_sections_with_split_tokens()
+    test_escaped_quotes_and_delimiters_inside_strings()
+    test_list_items_before_list_closes()
+    test_incomplete_json_emits_only_closed_sections()
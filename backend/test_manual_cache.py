@@ -0,0 +1,99 @@
+"""
+Pruebas de la caché de manuales procesados
+"""
+import asyncio
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+
+from agents.language_filter import LanguageFilter
+from agents.manual_cache import ManualCache
+from agents.pdf_processor import PDFProcessor
+
+
+SPANISH = (
+    "Para reiniciar el dispositivo pulse el botón de encendido durante cinco segundos. "
+    "Si la luz no se enciende, compruebe que el cable está conectado a la toma de corriente "
+    "y que el adaptador es el original del fabricante."
+)
+ENGLISH = (
+    "To restart the device press the power button for five seconds. If the light does not "
+    "turn on, unplug the device from the power outlet and check that the adapter is the "
+    "original one from the manufacturer."
+)
+
+
+def build_manual(path: str):
+    """Manual con dos páginas en español y una en inglés"""
+    doc = fitz.open()
+    for text in (SPANISH, SPANISH.replace("cinco", "diez"), ENGLISH):
+        doc.new_page().insert_textbox(fitz.Rect(72, 72, 520, 400), text)
+    doc.save(path)
+
+
+def process(cache: ManualCache, path: str, languages):
+    processor = PDFProcessor(cache=cache, language_filter=LanguageFilter(languages))
+    processor.extract_workers = 1
+    return asyncio.run(processor._process_file(path, "manual"))
+
+
+def test_language_switch_keeps_text_and_chunks_consistent():
+    """Cambiar INGEST_LANGUAGES y volver no mezcla texto filtrado y sin filtrar"""
+    print("🔍 Probando cambio de idiomas con la misma caché...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "manual.pdf")
+        build_manual(path)
+        cache = ManualCache(os.path.join(tmp, "cache"))
+        
+        first = process(cache, path, ["es"])
+        unfiltered = process(cache, path, [])
+        again = process(cache, path, ["es"])
+        
+        assert not first["cached"] and not unfiltered["cached"] and again["cached"]
+        assert "unplug" not in first["full_text"]
+        assert "unplug" in unfiltered["full_text"]
+        assert again["full_text"] == first["full_text"]
+        
+        chunks = again["chunks"]
+        assert [chunk["text"] for chunk in chunks] == [chunk["text"] for chunk in first["chunks"]]
+        assert all("unplug" not in chunk["text"] for chunk in chunks)
+    print("✅ OK")
+
+
+def test_hits_do_not_rewrite_the_index():
+    """Los aciertos actualizan el LRU en memoria sin reescribir index.json cada vez"""
+    print("🔍 Probando accesos a la caché...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ManualCache(os.path.join(tmp, "cache"), max_bytes=10 ** 9)
+        cache.touch_interval = 3600
+        cache.store("a", "key", "texto a", {})
+        cache.store("b", "key", "texto b", {})
+        index_path = os.path.join(cache.cache_dir, cache.INDEX_FILE)
+        written = os.stat(index_path).st_mtime_ns
+        
+        for _ in range(50):
+            assert cache.load("a", "key")["text"] == "texto a"
+        assert os.stat(index_path).st_mtime_ns == written
+        
+        # El LRU usa los accesos en memoria: "b" es ahora el menos usado
+        cache.max_bytes = cache.stats()["size_bytes"]
+        cache.store("c", "key", "texto c", {})
+        assert cache.has_entry("a") and not cache.has_entry("b")
+        
+        # flush() persiste los accesos pendientes
+        cache.load("a", "key")
+        cache.flush()
+        assert ManualCache(cache.cache_dir)._index["entries"]["a"]["last_access"] == \
+            cache._index["entries"]["a"]["last_access"]
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DE LA CACHÉ DE MANUALES")
+    print("=" * 50)
+    print()
+    
+    test_language_switch_keeps_text_and_chunks_consistent()
+    test_hits_do_not_rewrite_the_index()
@@ -0,0 +1,83 @@
+"""
+Pruebas de la detección de chunks casi duplicados (MinHash + LSH)
+"""
+from agents.near_duplicates import NearDuplicateDetector, _choose_bands
+
+
+WARNING = (
+    "ADVERTENCIA: no abra la carcasa del dispositivo. En su interior no hay piezas que el "
+    "usuario pueda reparar. Si el equipo no funciona correctamente, desconéctelo de la red "
+    "eléctrica y contacte con el servicio técnico oficial indicando el número de serie que "
+    "figura en la etiqueta de la base del equipo y la fecha de compra."
+)
+RESET = (
+    "Para restablecer los valores de fábrica mantenga pulsado el botón de acción durante "
+    "veinte segundos hasta que el anillo de luz se vuelva naranja. El dispositivo entrará "
+    "en modo de configuración y tendrá que volver a vincularlo desde la aplicación móvil."
+)
+CODE_ROW = (
+    "Código {code}: el dispositivo no puede conectarse a la red inalámbrica. Compruebe que "
+    "el router está encendido, que la contraseña es correcta y que la señal llega con "
+    "suficiente intensidad al lugar donde está instalado el altavoz inteligente."
+)
+
+
+def test_choose_bands():
+    """Con 64 permutaciones y umbral 0.85 se usan 8 bandas de 8 filas"""
+    print("🔍 Probando la elección de bandas LSH...")
+    assert _choose_bands(64, 0.85) == (8, 8)
+    # El umbral LSH elegido nunca supera el de similitud
+    for threshold in (0.5, 0.7, 0.85, 0.95):
+        bands, rows = _choose_bands(64, threshold)
+        assert bands * rows == 64
+        assert (1 / bands) ** (1 / rows) <= threshold
+    print("✅ OK")
+
+
+def test_near_identical_chunks_share_a_representative():
+    """Un aviso repetido con cambios mínimos se agrupa con su primera aparición"""
+    print("🔍 Probando avisos casi idénticos...")
+    detector = NearDuplicateDetector(threshold=0.85, num_perm=64)
+    texts = [
+        WARNING,
+        RESET,
+        WARNING.replace("ADVERTENCIA:", "ADVERTENCIA -"),
+        WARNING + " Página 12",
+    ]
+    
+    assert detector.find_duplicates(texts) == [0, 1, 0, 0]
+    print("✅ OK")
+
+
+def test_texts_below_threshold_stay_separate():
+    """Textos que solo comparten una parte no se agrupan"""
+    print("🔍 Probando textos por debajo del umbral...")
+    detector = NearDuplicateDetector(threshold=0.85, num_perm=64)
+    half = WARNING[:len(WARNING) // 2] + " " + RESET
+    
+    assert detector.find_duplicates([WARNING, half, RESET]) == [0, 1, 2]
+    # Con el umbral a 0 la detección está desactivada
+    assert NearDuplicateDetector(threshold=0).find_duplicates([WARNING, WARNING]) == [0, 1]
+    print("✅ OK")
+
+
+def test_different_error_codes_never_merge():
+    """Filas de una tabla de códigos iguales salvo el código siguen separadas"""
+    print("🔍 Probando chunks con códigos de error distintos...")
+    detector = NearDuplicateDetector(threshold=0.5, num_perm=64)
+    texts = [CODE_ROW.format(code="E03"), CODE_ROW.format(code="E04"), CODE_ROW.format(code="E03")]
+    
+    assert detector.find_duplicates(texts) == [0, 1, 0]
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DE CHUNKS CASI DUPLICADOS")
+    print("=" * 50)
+    print()
+    
+    test_choose_bands()
+    test_near_identical_chunks_share_a_representative()
+    test_texts_below_threshold_stay_separate()
+    test_different_error_codes_never_merge()
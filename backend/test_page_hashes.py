@@ -0,0 +1,128 @@
+"""
+Pruebas del hash por página usado en la re-ingesta incremental de manuales
+"""
+import asyncio
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+
+from agents.language_filter import LanguageFilter
+from agents.manual_cache import ManualCache
+from agents.pdf_processor import PDFProcessor, _extract_pages, _hash_pages
+
+
+def build_manual(path: str, seconds: int):
+    """
+    Manual de dos páginas: la primera con texto directo y la segunda con el
+    texto dentro de un Form XObject (show_pdf_page), como en los PDF que se
+    montan a partir de otros
+    """
+    source = fitz.open()
+    source.new_page().insert_text((72, 72), f"Pulse el boton {seconds} segundos")
+    
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Capitulo 1: Instalacion del dispositivo")
+    doc.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), source, 0)
+    doc.save(path)
+
+
+def test_xobject_change_changes_hash():
+    """Un cambio de texto dentro de un XObject cambia el hash de su página"""
+    print("🔍 Probando hash de páginas con XObjects...")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "v1.pdf")
+        new_path = os.path.join(tmp, "v2.pdf")
+        build_manual(old_path, 5)
+        build_manual(new_path, 9)
+        
+        old_hashes = _hash_pages(old_path)
+        new_hashes = _hash_pages(new_path)
+        
+        assert _extract_pages(old_path, [1]) != _extract_pages(new_path, [1])
+        assert old_hashes[0] == new_hashes[0]
+        assert old_hashes[1] != new_hashes[1]
+    print("✅ OK")
+
+
+def test_incremental_refresh_extracts_changed_xobject_page():
+    """La versión nueva reutiliza la página igual y extrae la del XObject"""
+    print("🔍 Probando re-ingesta incremental con XObjects...")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "v1.pdf")
+        new_path = os.path.join(tmp, "v2.pdf")
+        build_manual(old_path, 5)
+        build_manual(new_path, 9)
+        
+        processor = PDFProcessor(
+            cache=ManualCache(os.path.join(tmp, "cache")),
+            language_filter=LanguageFilter([])
+        )
+        processor.extract_workers = 1
+        
+        asyncio.run(processor._process_file(old_path, "v1"))
+        result = asyncio.run(processor._process_file(new_path, "v2", previous_hash="v1"))
+        
+        assert result["pages_reused"] == 1
+        assert "9 segundos" in result["full_text"]
+        assert "5 segundos" not in result["full_text"]
+    print("✅ OK")
+
+
+def build_multilingual_manual(path: str, seconds: int):
+    """Manual con una página en español que cambia entre versiones y otra en inglés"""
+    doc = fitz.open()
+    doc.new_page().insert_textbox(fitz.Rect(72, 72, 520, 400), (
+        f"Para reiniciar el dispositivo pulse el botón de encendido durante {seconds} segundos. "
+        "Si la luz no se enciende, compruebe que el cable está conectado a la toma de corriente "
+        "y que el adaptador es el original del fabricante."
+    ))
+    doc.new_page().insert_textbox(fitz.Rect(72, 72, 520, 400), (
+        "To restart the device press the power button for five seconds. If the light does not "
+        "turn on, unplug the device from the power outlet and check that the adapter is the "
+        "original one from the manufacturer."
+    ))
+    doc.save(path)
+
+
+def test_incremental_refresh_respects_language_filter():
+    """Solo se reutilizan páginas filtradas con los mismos idiomas y nunca las descartadas"""
+    print("🔍 Probando re-ingesta incremental con filtro de idioma...")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "v1.pdf")
+        new_path = os.path.join(tmp, "v2.pdf")
+        build_multilingual_manual(old_path, 5)
+        build_multilingual_manual(new_path, 9)
+        cache = ManualCache(os.path.join(tmp, "cache"))
+        
+        def processor(languages):
+            instance = PDFProcessor(cache=cache, language_filter=LanguageFilter(languages))
+            instance.extract_workers = 1
+            return instance
+        
+        # Versión anterior procesada sin filtro: no se reutiliza con el filtro "es"
+        asyncio.run(processor([])._process_file(old_path, "v1"))
+        result = asyncio.run(processor(["es"])._process_file(new_path, "v2", previous_hash="v1"))
+        assert result["pages_reused"] == 0
+        assert result["pages_dropped"] == 1
+        assert "unplug" not in result["full_text"]
+        
+        # Con el mismo filtro tampoco se reutiliza ninguna: la española cambió
+        # y la inglesa, igual en ambas versiones, se descartó y se guardó vacía
+        asyncio.run(processor(["es"])._process_file(old_path, "v1b"))
+        result = asyncio.run(processor(["es"])._process_file(new_path, "v2b", previous_hash="v1b"))
+        assert result["pages_reused"] == 0
+        assert result["languages"] == {"es": 1, "en": 1}
+        assert "9 segundos" in result["full_text"]
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DE HASH POR PÁGINA")
+    print("=" * 50)
+    print()
+    
+    test_xobject_change_changes_hash()
+    test_incremental_refresh_extracts_changed_xobject_page()
+    test_incremental_refresh_respects_language_filter()
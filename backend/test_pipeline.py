@@ -0,0 +1,97 @@
+"""
+Pruebas del pipeline por etapas de la generación masiva
+"""
+import asyncio
+
+from agents.pipeline import build_article_pipeline
+
+
+class FakeProcessor:
+    async def process_pdf(self, pdf_url):
+        if pdf_url == "ingest-error":
+            raise RuntimeError("sin red")
+        return {"success": True, "chunks": [], "error_index": None, "pdf_url": pdf_url}
+
+
+class FakeGenerator:
+    embedding_batch_size = 2
+    
+    async def retrieve_many(self, chunks, errors, model, error_index):
+        return [None] * len(errors)
+
+
+class FakeBatchGenerator:
+    def __init__(self):
+        self.pdf_processor = FakeProcessor()
+        self.article_generator = FakeGenerator()
+    
+    async def generate_single_article(self, pdf_result, model, error, publish_status, retrieved):
+        return {"title": error}
+
+
+def run_pipeline(groups, pipeline=None):
+    pipeline = pipeline or build_article_pipeline(FakeBatchGenerator())
+    
+    async def collect():
+        return [row async for row in pipeline.run(groups)]
+    
+    return pipeline, asyncio.run(collect())
+
+
+def test_every_row_ends_in_a_terminal_state():
+    """Un fallo inesperado en una etapa marca como fallidas sus filas en lugar de perderlas"""
+    print("🔍 Probando fallos dentro de las etapas...")
+    pipeline = build_article_pipeline(FakeBatchGenerator())
+    ingest, embed, generate = (stage.handler for stage in pipeline.stages)
+    
+    async def failing_ingest(group):
+        if group[0] == "ingest-bug.pdf":
+            raise RuntimeError("bug en la ingesta")
+        async for item in ingest(group):
+            yield item
+    
+    async def failing_embed(manual):
+        # Emite la primera fila de "bad.pdf" y falla con el resto pendiente
+        async for row in embed(manual):
+            yield row
+            if row["pdf_url"] == "bad.pdf":
+                raise RuntimeError("índice corrupto")
+    
+    async def failing_generate(row):
+        if row["error"] == "E9":
+            raise RuntimeError("bug en la generación")
+        async for item in generate(row):
+            yield item
+    
+    for stage, handler in zip(pipeline.stages, (failing_ingest, failing_embed, failing_generate)):
+        stage.handler = handler
+    
+    groups = [
+        ("ok.pdf", {"Echo": [(0, "E1"), (1, "E9")]}),
+        ("bad.pdf", {"Echo": [(2, "E1"), (3, "E2")], "Dot": [(4, "E3")]}),
+        ("ingest-error", {"Echo": [(5, "E1")]}),
+        ("ingest-bug.pdf", {"Echo": [(6, "E1")]}),
+    ]
+    pipeline, rows = run_pipeline(groups, pipeline)
+    by_position = {row["position"]: row for row in rows}
+    
+    assert len(rows) == 7 and sorted(by_position) == list(range(7))
+    assert by_position[0]["article"] and by_position[2]["article"]
+    assert by_position[1]["failed"] and "generación" in by_position[1]["detail"]
+    for position in (3, 4):
+        assert by_position[position]["failed"] and "índice corrupto" in by_position[position]["detail"]
+    assert by_position[5]["failed"] and "sin red" in by_position[5]["detail"]
+    assert by_position[6]["failed"] and "bug en la ingesta" in by_position[6]["detail"]
+    
+    stats = pipeline.stats()
+    assert (stats["ingest"]["failed"], stats["embed"]["failed"], stats["generate"]["failed"]) == (1, 1, 1)
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🧪 TEST DEL PIPELINE POR ETAPAS")
+    print("=" * 50)
+    print()
+    
+    test_every_row_ends_in_a_terminal_state()
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { generateBatch, getDeviceTypes } from '../services/api';
+import { generateBatchStream, getDeviceTypes } from '../services/api';
 import './BatchGenerator.css';
 
 const BatchGenerator = ({ onBatchGenerated }) => {
@@ -56,12 +56,10 @@ const BatchGenerator = ({ onBatchGenerated }) => {
   };
 
   const addErrorField = () => {
-    if (formData.errors.length < 10) {
-      setFormData(prev => ({
-        ...prev,
-        errors: [...prev.errors, '']
-      }));
-    }
+    setFormData(prev => ({
+      ...prev,
+      errors: [...prev.errors, '']
+    }));
   };
 
   const removeErrorField = (index) => {
@@ -87,17 +85,41 @@ const BatchGenerator = ({ onBatchGenerated }) => {
         return;
       }
 
-      const result = await generateBatch({
+      // Los artículos llegan uno a uno según terminan
+      const articles = [];
+      const errorsLog = [];
+      let result = null;
+
+      await generateBatchStream({
         pdf_url: formData.pdf_url,
         model: formData.model,
         device_type: formData.device_type,
         use_common_errors: formData.use_common_errors,
         errors: errors
+      }, (line) => {
+        if (line.event === 'status' && line.total) {
+          setProgress({ total: line.total, current: 0, currentError: '' });
+        } else if (line.event === 'item') {
+          if (line.status === 'done') {
+            articles[line.index] = line.article;
+          } else {
+            errorsLog.push({ error: line.error, detail: line.detail });
+          }
+          setProgress(prev => ({
+            ...prev,
+            current: line.successful + line.failed,
+            currentError: line.error
+          }));
+        } else if (line.event === 'done') {
+          result = { ...line, articles: articles.filter(Boolean), errors_log: errorsLog };
+        } else if (line.event === 'error') {
+          throw new Error(line.detail);
+        }
       });
 
       setLoading(false);
       
-      if (result.successful > 0) {
+      if (result && result.successful > 0) {
         onBatchGenerated(result);
       } else {
         alert('No se pudieron generar artículos. Revisa los errores.');
@@ -113,7 +135,7 @@ const BatchGenerator = ({ onBatchGenerated }) => {
     <div className="batch-generator">
       <div className="batch-header">
         <h2>🚀 Generación en Batch</h2>
-        <p>Genera hasta 10 artículos para el mismo dispositivo de forma automática</p>
+        <p>Genera artículos para todos los errores de un dispositivo de forma automática</p>
       </div>
 
       <form onSubmit={handleSubmit} className="batch-form">
@@ -171,7 +193,7 @@ const BatchGenerator = ({ onBatchGenerated }) => {
         {/* Errores personalizados */}
         {!formData.use_common_errors && (
           <div className="form-group">
-            <label>⚠️ Errores a Procesar (máx. 10)</label>
+            <label>⚠️ Errores a Procesar</label>
             {formData.errors.map((error, index) => (
               <div key={index} className="error-input-group">
                 <input
@@ -192,15 +214,13 @@ const BatchGenerator = ({ onBatchGenerated }) => {
                 )}
               </div>
             ))}
-            {formData.errors.length < 10 && (
-              <button
-                type="button"
-                onClick={addErrorField}
-                className="btn-add-error"
-              >
-                + Agregar Error
-              </button>
-            )}
+            <button
+              type="button"
+              onClick={addErrorField}
+              className="btn-add-error"
+            >
+              + Agregar Error
+            </button>
           </div>
         )}
 
@@ -219,11 +239,11 @@ const BatchGenerator = ({ onBatchGenerated }) => {
             <div className="progress-bar">
               <div 
                 className="progress-fill"
-                style={{ width: `${(progress.current / progress.total) * 100}%` }}
+                style={{ width: `${progress.total ? (progress.current / progress.total) * 100 : 0}%` }}
               />
             </div>
             <p className="progress-text">
-              Generando artículo {progress.current} de {progress.total}
+              {progress.current} de {progress.total} artículos generados
               {progress.currentError && <><br />📄 {progress.currentError}</>}
             </p>
           </div>
@@ -234,7 +254,7 @@ const BatchGenerator = ({ onBatchGenerated }) => {
       <div className="batch-info">
         <h4>ℹ️ Información</h4>
         <ul>
-          <li>✅ Genera entre 5 y 10 artículos automáticamente</li>
+          <li>✅ Genera cientos de artículos; cada uno llega en cuanto está listo</li>
           <li>📝 Usa errores comunes o especifica los tuyos</li>
           <li>⚡ El PDF se procesa una sola vez para todos los artículos</li>
           <li>💾 Los artículos se generan como borradores</li>
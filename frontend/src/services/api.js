@@ -51,6 +51,34 @@ export const apiService = {
     return response.data;
   },
   
+  // Generación en batch en streaming (NDJSON): llama a onEvent por cada línea
+  async generateBatchStream(batchData, onEvent) {
+    const response = await fetch(`${API_URL}/batch_generate/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(batchData),
+    });
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.detail || `HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.filter(line => line.trim() !== '').forEach(line => onEvent(JSON.parse(line)));
+      if (done) break;
+    }
+    if (buffer.trim() !== '') {
+      onEvent(JSON.parse(buffer));
+    }
+  },
+  
   // Publicar múltiples artículos
   async batchPublish(articles) {
     const response = await api.post('/batch_publish', articles);
@@ -84,6 +112,7 @@ export const generateArticle = apiService.generateArticle;
 export const uploadPDF = apiService.uploadPDF;
 export const publishToWordPress = apiService.publishToWordPress;
 export const generateBatch = apiService.generateBatch;
+export const generateBatchStream = apiService.generateBatchStream;
 export const batchPublish = apiService.batchPublish;
 export const getDeviceTypes = apiService.getDeviceTypes;
 export const getSiteMetrics = apiService.getSiteMetrics;